@@ -0,0 +1,5 @@
+"""Performance benchmarks for cuteninja.
+
+Run the suite from the repository root with `python -m benchmarks`; the
+individual `bench_*` modules compare specific implementation choices.
+"""
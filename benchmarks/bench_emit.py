@@ -0,0 +1,110 @@
+"""Compare string-returning and writer-based HTML emission.
+
+Run from the repository root with `python -m benchmarks.bench_emit`.
+"""
+
+import io
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List
+
+import ckdl
+
+from cuteninja.kdl_converter import KdlToHtmlConverter
+
+from .generators import deep_document, wide_document
+
+
+class ConcatConverter(KdlToHtmlConverter):
+    """The previous emitter: every subtree is returned and concatenated."""
+
+    def convert_node(self, node: Any, level: int = 0) -> str:
+        current_indent = self.indent * level if self.format_output else ""
+        newline = "\n" if self.format_output else ""
+        if node.name == "-":
+            return " ".join(str(arg) for arg in node.args)
+        tag_name = node.name
+        opening = f"{current_indent}<{tag_name}"
+        props: Dict[str, Any] = node.properties
+        for key, value in props.items():
+            if isinstance(value, bool):
+                if value:
+                    opening += f" {key}"
+            else:
+                escaped_value = str(value).replace('"', "&quot;")
+                opening += f' {key}="{escaped_value}"'
+        if tag_name in self.VOID_ELEMENTS and not node.args and not node.children:
+            return f"{opening} />{newline}"
+        opening += ">"
+        content_parts: List[str] = []
+        if node.args:
+            content_parts.append(" ".join(str(arg) for arg in node.args))
+        for child in node.children:
+            child_html = self.convert_node(child, level + 1)
+            if child.name == "-" or not self.format_output:
+                content_parts.append(child_html)
+            else:
+                content_parts.append(newline + child_html)
+        if content_parts:
+            content = "".join(content_parts)
+            if node.children and self.format_output:
+                closing = f"{newline}{current_indent}</{tag_name}>{newline}"
+            else:
+                closing = f"</{tag_name}>{newline}"
+            return f"{opening}{content}{closing}"
+        return f"{opening}</{tag_name}>{newline}"
+
+    def convert_document(self, nodes: List[Any]) -> str:
+        return "".join(self.convert_node(node) for node in nodes)
+
+
+def measure(func: Callable[[], Any]) -> Dict[str, float]:
+    tracemalloc.start()
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    best = elapsed
+    for _ in range(3):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return {"ms": best * 1000, "peak_kib": peak / 1024}
+
+
+def main() -> None:
+    documents = {
+        "wide 20k": wide_document(20_000),
+        "deep 800": deep_document(800, 200),
+    }
+    converter = KdlToHtmlConverter()
+    legacy = ConcatConverter()
+
+    print(f"{'document':<10} {'emitter':<14} {'ms':>9} {'peak KiB':>10} {'MB/s':>8}")
+    for name, source in documents.items():
+        nodes = ckdl.parse(source).nodes
+        html = converter.convert_document(nodes)
+        assert legacy.convert_document(nodes) == html
+        size = len(html.encode("utf-8"))
+
+        def to_file() -> None:
+            converter.convert_document_to(nodes, io.StringIO().write)
+
+        runs = {
+            "concat": lambda: legacy.convert_document(nodes),
+            "writer+join": lambda: converter.convert_document(nodes),
+            "writer->file": to_file,
+        }
+        for label, func in runs.items():
+            result = measure(func)
+            throughput = size / (result["ms"] / 1000) / 1e6
+            print(
+                f"{name:<10} {label:<14} {result['ms']:>9.2f} "
+                f"{result['peak_kib']:>10.0f} {throughput:>8.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
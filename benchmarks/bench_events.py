@@ -0,0 +1,71 @@
+"""Compare the pure-Python event parser with ckdl.
+
+For each workload, reports the time to parse, to parse and convert to
+formatted HTML, and the peak memory of converting: through ckdl's tree,
+through a tree built from the events, and straight from the event stream.
+
+Run from the repository root with `python -m benchmarks.bench_events`.
+"""
+
+import gc
+import timeit
+import tracemalloc
+from typing import Any, Callable
+
+import ckdl
+
+from cuteninja.jinja_processor import JinjaProcessor
+from cuteninja.kdl_converter import KdlToHtmlConverter
+from cuteninja.kdl_events import parse_document, parse_events
+
+from .generators import WORKLOADS
+
+CONVERTER = KdlToHtmlConverter(iterative=True)
+
+
+def best(function: Callable[[], Any]) -> float:
+    return min(timeit.repeat(function, number=1, repeat=5)) * 1000
+
+
+def peak(function: Callable[[], Any]) -> int:
+    gc.collect()
+    tracemalloc.start()
+    function()
+    peak_bytes = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak_bytes
+
+
+def discard(_: str) -> None:
+    pass
+
+
+def main() -> None:
+    print(
+        f"{'workload':>10} {'ckdl ms':>8} {'events ms':>9} "
+        f"{'ckdl+conv':>9} {'tree+conv':>9} {'stream':>8} "
+        f"{'ckdl KiB':>8} {'tree KiB':>8} {'stream KiB':>10}"
+    )
+    for name, generator in WORKLOADS.items():
+        kdl = JinjaProcessor().scan(generator()).kdl
+
+        def via_ckdl() -> None:
+            CONVERTER.convert_document_to(ckdl.parse(kdl).nodes, discard)
+
+        def via_tree() -> None:
+            CONVERTER.convert_document_to(parse_document(kdl).nodes, discard)
+
+        def streamed() -> None:
+            CONVERTER.convert_events_to(parse_events(kdl), discard)
+
+        print(
+            f"{name:>10} {best(lambda: ckdl.parse(kdl)):>8.1f} "
+            f"{best(lambda: sum(1 for _ in parse_events(kdl))):>9.1f} "
+            f"{best(via_ckdl):>9.1f} {best(via_tree):>9.1f} "
+            f"{best(streamed):>8.1f} {peak(via_ckdl) / 1024:>8.0f} "
+            f"{peak(via_tree) / 1024:>8.0f} {peak(streamed) / 1024:>10.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
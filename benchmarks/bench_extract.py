@@ -0,0 +1,76 @@
+"""Compare the single-pass Jinja scanner with the regex extraction it replaced.
+
+Run from the repository root with `python -m benchmarks.bench_extract`.
+"""
+
+import re
+import timeit
+from typing import Callable, Dict, List, Tuple
+
+from cuteninja.jinja_processor import (
+    JinjaProcessor,
+    _placeholder_pattern,
+    _placeholder_prefix,
+)
+
+from .generators import WORKLOADS
+
+TARGET_BYTES = 1024 * 1024
+
+
+def extract_by_regex(source: str) -> Tuple[str, Dict[str, str]]:
+    # the previous implementation: substitute, split into lines, match each line
+    token_map: Dict[str, str] = {}
+    prefix = _placeholder_prefix(source)
+    pattern = r"(\{\{.*?\}\}|\{%.*?%\}|\{#.*?#\})"
+
+    def replace_jinja(match: "re.Match[str]") -> str:
+        token = match.group(0)
+        placeholder = f"{prefix}{len(token_map)}__"
+        token_map[placeholder] = token
+        if "\n" in token:
+            return f'- "{placeholder}"'
+        return placeholder
+
+    cleaned = re.sub(pattern, replace_jinja, source, flags=re.DOTALL)
+    standalone = _placeholder_pattern(prefix)
+    final_lines: List[str] = []
+    for line in cleaned.split("\n"):
+        stripped = line.strip()
+        if standalone.fullmatch(stripped):
+            indent = len(line) - len(line.lstrip())
+            final_lines.append(" " * indent + f'- "{stripped}"')
+        else:
+            final_lines.append(line)
+    return "\n".join(final_lines), token_map
+
+
+def scale_to(generator: Callable[..., str], size: int) -> str:
+    """Repeat a workload until it is about `size` bytes long."""
+    unit = generator()
+    return "\n".join([unit] * max(1, round(size / len(unit.encode("utf-8")))))
+
+
+def main() -> None:
+    processor = JinjaProcessor()
+    print(
+        f"{'workload':>10} {'KiB':>7} {'tokens':>7} {'regex ms':>9} "
+        f"{'scan ms':>8} {'speedup':>8}"
+    )
+    for name in ("tokens", "mixed", "wide"):
+        source = scale_to(WORKLOADS[name], TARGET_BYTES)
+        expected = extract_by_regex(source)
+        assert processor.extract_jinja(source) == expected
+
+        old = min(timeit.repeat(lambda: extract_by_regex(source), number=3, repeat=7))
+        new = min(
+            timeit.repeat(lambda: processor.extract_jinja(source), number=3, repeat=7)
+        )
+        print(
+            f"{name:>10} {len(source) / 1024:>7.0f} {len(expected[1]):>7} "
+            f"{old / 3 * 1000:>9.1f} {new / 3 * 1000:>8.1f} {old / new:>7.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
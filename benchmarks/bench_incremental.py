@@ -0,0 +1,95 @@
+"""Compare `KdlTemplate.update` with compiling an edited document again.
+
+Each workload is generated at about 500 KB and edited the way a page editor
+does: a character typed into a text, a node inserted and then deleted
+again, and an attribute changed. Every edit is applied with `update` and
+compiled from scratch, and the median latencies are reported along with
+the number of nodes `update` converted.
+
+Run from the repository root with `python -m benchmarks.bench_incremental`.
+"""
+
+import re
+import statistics
+import time
+from typing import Callable, List, Tuple
+
+from cuteninja import KdlTemplate
+
+from .generators import mixed_document, property_heavy_document, token_heavy_document
+
+SIZE = 500 * 1024
+# the end of a string with something in it, and what follows
+CLOSING_QUOTE = re.compile(r'[^\s="]"(?=\s)')
+
+WORKLOADS: List[Tuple[str, Callable[[int], str]]] = [
+    ("mixed", mixed_document),
+    ("props", property_heavy_document),
+    ("tokens", token_heavy_document),
+]
+
+
+def sized(generator: Callable[[int], str]) -> str:
+    """Generate a document of about SIZE characters."""
+    count = 16
+    while len(generator(count)) < SIZE:
+        count *= 2
+    return generator(count)
+
+
+def edits(source: str) -> List[str]:
+    """A sequence of edited sources, each building on the last."""
+    sources = []
+    middle = source.index("\n", len(source) // 2) + 1
+    quote = CLOSING_QUOTE.search(source, middle).end() - 1
+    for offset in range(10):
+        # typing at the end of a string
+        source = source[: quote + offset] + "e" + source[quote + offset :]
+        sources.append(source)
+    line = source.index("\n", middle) + 1
+    indent = source[line : len(source) - len(source[line:].lstrip(" "))]
+    node = f'{indent}p class=note "{{{{ note }}}}"\n'
+    source = source[:line] + node + source[line:]
+    sources.append(source)
+    source = source[:line] + source[line + len(node) :]
+    sources.append(source)
+    equals = source.index("=", middle)
+    for offset, character in enumerate("abc"):
+        # renaming an attribute
+        source = source[: equals + offset] + character + source[equals + offset :]
+        sources.append(source)
+    return sources
+
+
+def main() -> None:
+    print(
+        f"{'workload':>10} {'KiB':>6} {'full ms':>8} {'update ms':>9} "
+        f"{'speedup':>7} {'nodes':>6}"
+    )
+    for name, generator in WORKLOADS:
+        source = sized(generator)
+        template = KdlTemplate(source, use_cache=False)
+        template.update(source)
+        full: List[float] = []
+        update: List[float] = []
+        nodes: List[int] = []
+        for edited in edits(source):
+            started = time.perf_counter()
+            expected = KdlTemplate(edited, use_cache=False)
+            full.append(time.perf_counter() - started)
+            started = time.perf_counter()
+            template.update(edited)
+            update.append(time.perf_counter() - started)
+            assert template.output == expected.output
+            nodes.append(template.metrics.node_count)
+        full_ms = statistics.median(full) * 1000
+        update_ms = statistics.median(update) * 1000
+        print(
+            f"{name:>10} {len(source) / 1024:>6.0f} {full_ms:>8.1f} "
+            f"{update_ms:>9.2f} {full_ms / update_ms:>6.0f}x "
+            f"{statistics.median(nodes):>6.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
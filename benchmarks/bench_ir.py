@@ -0,0 +1,78 @@
+"""Compare holding ckdl's parse tree with holding the flat document IR.
+
+Reports the memory retained by each, the size of the serialized IR, and
+the time to emit formatted, compact and minified output from a fresh
+parse versus from the IR.
+
+Run from the repository root with `python -m benchmarks.bench_ir`.
+"""
+
+import gc
+import timeit
+import tracemalloc
+from typing import Any, Callable, Tuple
+
+from cuteninja.ir import DocumentIR
+from cuteninja.jinja_processor import JinjaProcessor
+from cuteninja.kdl_bindings import parse
+from cuteninja.kdl_converter import KdlToHtmlConverter
+
+from .generators import WORKLOADS
+
+CONVERTERS = [
+    KdlToHtmlConverter(iterative=True),
+    KdlToHtmlConverter(format_output=False, iterative=True),
+    KdlToHtmlConverter(minify=True),
+]
+
+
+def retained(factory: Callable[[], Any]) -> Tuple[Any, int]:
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = factory()
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, after - before
+
+
+def best(function: Callable[[], Any]) -> float:
+    return min(timeit.repeat(function, number=1, repeat=5)) * 1000
+
+
+def emit_reparsing(kdl: str) -> None:
+    for converter in CONVERTERS:
+        converter.convert_document_to(parse(kdl).nodes, [].append)
+
+
+def emit_from_ir(ir: DocumentIR) -> None:
+    for converter in CONVERTERS:
+        converter.convert_document_to(ir, [].append)
+
+
+def main() -> None:
+    print(
+        f"{'workload':>10} {'tree KiB':>9} {'IR KiB':>7} {'bytes KiB':>9} "
+        f"{'parse ms':>8} {'build ms':>8} {'3x reparse':>10} {'3x from IR':>10}"
+    )
+    for name, generator in WORKLOADS.items():
+        kdl = JinjaProcessor().scan(generator()).kdl
+        document, tree_bytes = retained(lambda: parse(kdl))
+        ir, ir_bytes = retained(lambda: DocumentIR.from_nodes(document.nodes))
+        del document
+        serialized = len(ir.to_bytes())
+
+        parse_ms = best(lambda: parse(kdl))
+        build_ms = best(lambda: DocumentIR.from_nodes(parse(kdl).nodes)) - parse_ms
+        reparse_ms = best(lambda: emit_reparsing(kdl))
+        ir_ms = best(lambda: emit_from_ir(ir))
+        print(
+            f"{name:>10} {tree_bytes / 1024:>9.0f} {ir_bytes / 1024:>7.0f} "
+            f"{serialized / 1024:>9.0f} {parse_ms:>8.1f} {build_ms:>8.1f} "
+            f"{reparse_ms:>10.1f} {ir_ms:>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""Measure the memory retained per KdlTemplate instance.
+
+Run from the repository root with `python -m benchmarks.bench_memory`.
+"""
+
+import gc
+import inspect
+import tracemalloc
+from typing import Any, Callable, Dict, List
+
+from cuteninja import KdlTemplate, get_compile_cache
+
+COUNT = 5000
+
+
+def tenant_source(i: int) -> str:
+    return (
+        f"section class=tenant-{i} {{\n"
+        f'    h2 "{{{{ tenant_{i}.name }}}}"\n'
+        "    {% for item in items %}\n"
+        f'    a href="/t/{i}/{{{{ item.id }}}}" "{{{{ item.title }}}}"\n'
+        "    {% endfor %}\n"
+        "}\n"
+    )
+
+
+def retained_per_instance(factory: Callable[[str], Any]) -> float:
+    sources = [tenant_source(i) for i in range(COUNT)]
+    get_compile_cache().clear()
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    templates = [factory(source) for source in sources]
+    for template in templates:
+        template.render()
+    get_compile_cache().clear()
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del templates
+    return (after - before) / COUNT
+
+
+def main() -> None:
+    modes: Dict[str, Callable[[str], Any]] = {
+        "default": lambda source: KdlTemplate(source),
+    }
+    parameters = inspect.signature(KdlTemplate).parameters
+    if "lazy" in parameters:
+        modes["lean"] = lambda source: KdlTemplate(
+            source, lazy=True, keep_source=False, keep_tokens=False
+        )
+
+    rows: List[str] = []
+    for name, factory in modes.items():
+        rows.append(f"{name:<8} {retained_per_instance(factory):>10.0f}")
+    print(f"{'mode':<8} {'bytes/instance':>10}")
+    print("\n".join(rows))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""Compare the size of formatted, compact and minified output.
+
+Run from the repository root with `python -m benchmarks.bench_minify`.
+"""
+
+import gzip
+import timeit
+
+from cuteninja import render_kdl
+
+from .generators import WORKLOADS
+
+MODES = {
+    "formatted": {},
+    "compact": {"format_output": False},
+    "minified": {"minify": True},
+}
+
+
+def main() -> None:
+    print(
+        f"{'workload':>10} {'mode':>10} {'KiB':>8} {'gzip KiB':>9} "
+        f"{'saved':>6} {'ms':>7}"
+    )
+    for name, generator in WORKLOADS.items():
+        source = generator()
+        compact = None
+        for mode, options in MODES.items():
+            html = render_kdl(source, use_cache=False, **options).encode("utf-8")
+            seconds = min(
+                timeit.repeat(
+                    lambda: render_kdl(source, use_cache=False, **options),
+                    number=1,
+                    repeat=5,
+                )
+            )
+            if mode == "compact":
+                compact = len(html)
+            saved = f"{1 - len(html) / compact:>6.1%}" if compact else f"{'':>6}"
+            print(
+                f"{name:>10} {mode:>10} {len(html) / 1024:>8.1f} "
+                f"{len(gzip.compress(html)) / 1024:>9.1f} {saved} "
+                f"{seconds * 1000:>7.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
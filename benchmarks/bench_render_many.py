@@ -0,0 +1,51 @@
+"""Compare rendering a batch of templates sequentially, in threads and in processes.
+
+Run from the repository root with `python -m benchmarks.bench_render_many`.
+Threads only render in parallel on a free-threaded build of CPython.
+"""
+
+import sys
+import timeit
+from typing import List
+
+from cuteninja import render_kdl, render_many
+
+from .generators import mixed_document
+
+TEMPLATES = 64
+SECTIONS = 50
+
+
+def batch() -> List[str]:
+    # distinct sources, so nothing is deduplicated
+    return [f"// page {i}\n" + mixed_document(SECTIONS) for i in range(TEMPLATES)]
+
+
+def main() -> None:
+    sources = batch()
+    workers = 4
+    is_gil_enabled = getattr(sys, "_is_gil_enabled", lambda: True)
+    print(
+        f"{TEMPLATES} templates of {len(sources[0]) / 1024:.0f} KiB, "
+        f"{workers} workers, GIL {'enabled' if is_gil_enabled() else 'disabled'}"
+    )
+
+    expected = [render_kdl(source, use_cache=False) for source in sources]
+    runs = {
+        "sequential": lambda: render_many(sources, workers=1, use_cache=False),
+        "thread": lambda: render_many(sources, workers=workers, use_cache=False),
+        "process": lambda: render_many(
+            sources, workers=workers, executor="process", use_cache=False
+        ),
+    }
+    baseline = None
+    print(f"{'mode':>10} {'ms':>9} {'speedup':>8}")
+    for name, run in runs.items():
+        assert run() == expected
+        seconds = min(timeit.repeat(run, number=1, repeat=5))
+        baseline = baseline or seconds
+        print(f"{name:>10} {seconds * 1000:>9.1f} {baseline / seconds:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""Compare placeholder restoration strategies as the token count grows.
+
+Run from the repository root with `python -m benchmarks.bench_restore`.
+"""
+
+import timeit
+from typing import Dict, Tuple
+
+from cuteninja.jinja_processor import JinjaProcessor
+
+
+def restore_by_replace(html: str, token_map: Dict[str, str]) -> str:
+    # the previous implementation: one full scan and copy per token
+    result = html
+    for placeholder, token in token_map.items():
+        result = result.replace(placeholder, token)
+    return result
+
+
+def make_input(tokens: int) -> Tuple[str, Dict[str, str]]:
+    token_map = {f"__JINJA_{i}__": f"{{{{ item_{i} }}}}" for i in range(tokens)}
+    html = "".join(f'<li class="row">{placeholder}</li>\n' for placeholder in token_map)
+    return html, token_map
+
+
+def main() -> None:
+    processor = JinjaProcessor()
+    print(
+        f"{'tokens':>8} {'html KiB':>9} {'replace ms':>11} {'single ms':>10} {'speedup':>8}"
+    )
+    for tokens in (10, 100, 500, 1000, 2000, 5000):
+        html, token_map = make_input(tokens)
+        assert processor.restore_jinja(html, token_map) == restore_by_replace(
+            html, token_map
+        )
+
+        number = max(1, 2000 // tokens)
+        old = (
+            min(
+                timeit.repeat(
+                    lambda: restore_by_replace(html, token_map), number=number, repeat=3
+                )
+            )
+            / number
+        )
+        new = (
+            min(
+                timeit.repeat(
+                    lambda: processor.restore_jinja(html, token_map),
+                    number=number,
+                    repeat=3,
+                )
+            )
+            / number
+        )
+        print(
+            f"{tokens:>8} {len(html) / 1024:>9.1f} {old * 1000:>11.3f} "
+            f"{new * 1000:>10.3f} {old / new:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
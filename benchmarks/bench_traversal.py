@@ -0,0 +1,67 @@
+"""Compare recursive and explicit-stack traversal in KdlToHtmlConverter.
+
+Run from the repository root with `python -m benchmarks.bench_traversal`.
+"""
+
+import sys
+import timeit
+
+import ckdl
+
+from cuteninja.kdl_converter import KdlToHtmlConverter
+
+from .generators import deep_document
+
+
+def bushy_document(breadth: int, depth: int) -> str:
+    def node(level: int) -> str:
+        if level == depth:
+            return 'span "leaf"'
+        children = "\n".join(node(level + 1) for _ in range(breadth))
+        return f"div class=l{level} {{\n{children}\n}}"
+
+    return node(0)
+
+
+def main() -> None:
+    documents = {
+        "deep 500": deep_document(500, 1),
+        "bushy 4^7": bushy_document(4, 7),
+        "deep 20000": deep_document(20_000, 1),
+    }
+
+    print(f"{'document':<12} {'format':<7} {'recursive ms':>13} {'iterative ms':>13}")
+    for name, source in documents.items():
+        nodes = ckdl.parse(source).nodes
+        for format_output in (True, False):
+            recursive = KdlToHtmlConverter(format_output=format_output)
+            iterative = KdlToHtmlConverter(format_output=format_output, iterative=True)
+
+            try:
+                expected = recursive.convert_document(nodes)
+            except RecursionError:
+                expected = None
+            if expected is not None:
+                assert iterative.convert_document(nodes) == expected
+                rec_ms = min(
+                    timeit.repeat(
+                        lambda: recursive.convert_document(nodes), number=5, repeat=3
+                    )
+                )
+                rec = f"{rec_ms / 5 * 1000:>13.2f}"
+            else:
+                rec = f"{'RecursionError':>13}"
+
+            it_ms = min(
+                timeit.repeat(
+                    lambda: iterative.convert_document(nodes), number=5, repeat=3
+                )
+            )
+            label = "pretty" if format_output else "compact"
+            print(f"{name:<12} {label:<7} {rec} {it_ms / 5 * 1000:>13.2f}")
+
+    print(f"recursion limit: {sys.getrecursionlimit()}")
+
+
+if __name__ == "__main__":
+    main()
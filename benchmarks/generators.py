@@ -0,0 +1,82 @@
+"""Synthetic KDL workloads of configurable size."""
+
+from typing import Callable, Dict
+
+
+def wide_document(width: int = 5000) -> str:
+    """Many sibling elements with a little nesting each."""
+    return "\n".join(
+        f'div class=row id=r{i} {{ span "cell {i}"; a href="/item/{i}" "link" }}'
+        for i in range(width)
+    )
+
+
+def deep_document(depth: int = 2000, text: int = 20) -> str:
+    """A single chain of nested elements, each with some text."""
+    payload = "x" * text
+    return (
+        "".join(f'div class=level "{payload}" {{\n' for _ in range(depth))
+        + "}\n" * depth
+    )
+
+
+def property_heavy_document(count: int = 2000, props: int = 12) -> str:
+    """Elements carrying many attributes of mixed types."""
+    lines = []
+    for i in range(count):
+        attrs = " ".join(
+            f'data-k{j}="value {i} {j}"' if j % 3 else f"data-n{j}={i * j}"
+            for j in range(props)
+        )
+        lines.append(
+            f"input type=text name=f{i} {attrs} required=#true disabled=#false"
+        )
+    return "\n".join(lines)
+
+
+def token_heavy_document(items: int = 2000) -> str:
+    """A loop-heavy page where most content is Jinja tokens."""
+    lines = ["ul class=items {"]
+    for i in range(items):
+        lines.append(f"    {{% if items[{i}].visible %}}")
+        lines.append(
+            f'    li class="{{{{ items[{i}].css }}}}" '
+            f'"{{{{ items[{i}].name|e }}}} - {{{{ items[{i}].price }}}}"'
+        )
+        lines.append("    {% endif %}")
+    lines.append("}")
+    return "\n".join(lines)
+
+
+def mixed_document(sections: int = 200) -> str:
+    """A realistic page: layout, loops, conditionals and text."""
+    body = []
+    for i in range(sections):
+        body.append(f"""        section id=s{i} class=card {{
+            h2 "{{{{ sections[{i}].title }}}}"
+            {{% for entry in sections[{i}].entries %}}
+            article {{
+                h3 "{{{{ entry.title }}}}"
+                p class=summary "{{{{ entry.summary }}}}"
+                a href="/entries/{{{{ entry.id }}}}" "Read more"
+            }}
+            {{% endfor %}}
+        }}""")
+    return (
+        "!doctype html\n"
+        "html lang=en {\n"
+        "    head {\n"
+        "        meta charset=utf-8\n"
+        '        title "{{ page_title }}"\n'
+        "    }\n"
+        "    body {\n" + "\n".join(body) + "\n    }\n}\n"
+    )
+
+
+WORKLOADS: Dict[str, Callable[..., str]] = {
+    "wide": wide_document,
+    "deep": deep_document,
+    "props": property_heavy_document,
+    "tokens": token_heavy_document,
+    "mixed": mixed_document,
+}
@@ -0,0 +1,205 @@
+"""Per-phase timing and memory benchmarks over the synthetic workloads.
+
+Run from the repository root:
+
+    python -m benchmarks                          # run and print a table
+    python -m benchmarks --save baseline.json     # store a baseline
+    python -m benchmarks --compare baseline.json  # exit 1 on regressions
+"""
+
+import argparse
+import inspect
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional
+
+from cuteninja import KdlTemplate, __version__
+from cuteninja.jinja_processor import JinjaProcessor
+from cuteninja.kdl_bindings import parse
+from cuteninja.kdl_converter import KdlToHtmlConverter
+
+from .generators import WORKLOADS
+
+PHASES = ["extract_jinja", "parse", "convert_document", "restore_jinja", "end_to_end"]
+
+
+def scaled_source(name: str, scale: float) -> str:
+    """Generate a workload with its default size multiplied by `scale`."""
+    generator = WORKLOADS[name]
+    first = next(iter(inspect.signature(generator).parameters.values()))
+    return generator(max(1, int(first.default * scale)))
+
+
+def _best_of(func: Callable[[], Any], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def _peak(func: Callable[[], Any]) -> int:
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run_workload(source: str, format_output: bool, repeat: int) -> Dict[str, Any]:
+    """Time each compile phase and the whole pipeline on one source.
+
+    Returns:
+        Sizes of the input and output plus `ms` and `peak_kib` per phase
+    """
+    processor = JinjaProcessor()
+    converter = KdlToHtmlConverter(format_output=format_output, iterative=True)
+
+    cleaned, token_map = processor.extract_jinja(source)
+    doc = parse(cleaned)
+    html = converter.convert_document(doc.nodes)
+    output = processor.restore_jinja(html, token_map)
+
+    steps: Dict[str, Callable[[], Any]] = {
+        "extract_jinja": lambda: processor.extract_jinja(source),
+        "parse": lambda: parse(cleaned),
+        "convert_document": lambda: converter.convert_document(doc.nodes),
+        "restore_jinja": lambda: processor.restore_jinja(html, token_map),
+        "end_to_end": lambda: KdlTemplate(
+            source, format_output=format_output, use_cache=False
+        ),
+    }
+
+    phases = {
+        name: {
+            "ms": _best_of(step, repeat) * 1000,
+            "peak_kib": _peak(step) / 1024,
+        }
+        for name, step in steps.items()
+    }
+    return {
+        "input_bytes": len(source.encode("utf-8")),
+        "output_bytes": len(output.encode("utf-8")),
+        "tokens": len(token_map),
+        "phases": phases,
+    }
+
+
+def run_suite(
+    workloads: List[str], scale: float, format_output: bool, repeat: int
+) -> Dict[str, Any]:
+    """Run the selected workloads and collect the results with run metadata."""
+    results = {
+        name: run_workload(scaled_source(name, scale), format_output, repeat)
+        for name in workloads
+    }
+    return {
+        "meta": {
+            "cuteninja": __version__,
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "machine": platform.machine(),
+            "scale": scale,
+            "format_output": format_output,
+        },
+        "results": results,
+    }
+
+
+def print_results(report: Dict[str, Any]) -> None:
+    header = f"{'workload':<8} {'phase':<17} {'ms':>10} {'peak KiB':>10}"
+    print(header)
+    print("-" * len(header))
+    for name, result in report["results"].items():
+        for phase in PHASES:
+            data = result["phases"][phase]
+            print(
+                f"{name:<8} {phase:<17} {data['ms']:>10.2f} {data['peak_kib']:>10.0f}"
+            )
+        print(
+            f"{name:<8} {'(sizes)':<17} in {result['input_bytes'] / 1024:.0f} KiB, "
+            f"out {result['output_bytes'] / 1024:.0f} KiB, {result['tokens']} tokens"
+        )
+
+
+def compare(
+    report: Dict[str, Any], baseline: Dict[str, Any], threshold: float
+) -> List[str]:
+    """Find phases that got slower than the baseline by more than `threshold`.
+
+    Returns:
+        One line per regression, empty when there are none
+    """
+    regressions: List[str] = []
+    for name, result in report["results"].items():
+        base = baseline.get("results", {}).get(name)
+        if base is None:
+            continue
+        for phase in PHASES:
+            old = base["phases"].get(phase, {}).get("ms")
+            new = result["phases"][phase]["ms"]
+            if old and new > old * (1 + threshold):
+                regressions.append(
+                    f"{name}/{phase}: {old:.2f} ms -> {new:.2f} ms "
+                    f"(+{(new / old - 1) * 100:.0f}%)"
+                )
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks")
+    parser.add_argument(
+        "-w",
+        "--workload",
+        action="append",
+        choices=sorted(WORKLOADS),
+        help="workload to run, may be repeated (default: all)",
+    )
+    parser.add_argument(
+        "--scale", type=float, default=1.0, help="multiply workload sizes"
+    )
+    parser.add_argument("--repeat", type=int, default=5, help="timing repetitions")
+    parser.add_argument(
+        "--compact", action="store_true", help="benchmark format_output=False"
+    )
+    parser.add_argument("--save", metavar="PATH", help="write results as JSON")
+    parser.add_argument(
+        "--compare", metavar="PATH", help="compare against a saved JSON baseline"
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.15,
+        help="relative slowdown reported as a regression (default: 0.15)",
+    )
+    args = parser.parse_args(argv)
+
+    report = run_suite(
+        args.workload or list(WORKLOADS), args.scale, not args.compact, args.repeat
+    )
+    print_results(report)
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print("\nregressions:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print("\nno regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,4 +1,13 @@
-from .core import KdlTemplate, render_kdl
+from .cache import CompileCache, get_compile_cache
+from .core import KdlTemplate, render_kdl, render_kdl_to, render_many
 from .version import __version__
 
-__all__: list[str] = ["KdlTemplate", "render_kdl", "__version__"]
+__all__: list[str] = [
+    "CompileCache",
+    "KdlTemplate",
+    "get_compile_cache",
+    "render_kdl",
+    "render_kdl_to",
+    "render_many",
+    "__version__",
+]
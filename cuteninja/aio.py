@@ -0,0 +1,150 @@
+import asyncio
+import threading
+import weakref
+from concurrent.futures import Executor, ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Dict, Hashable, Optional, TypeVar
+
+from .cache import get_compile_cache, make_key
+from .core import KdlTemplate
+from .persistent import PersistentCache
+
+T = TypeVar("T")
+
+_executor: Optional[Executor] = None
+_executor_lock = threading.Lock()
+_Flights = Dict[Hashable, "asyncio.Future[Any]"]
+# calls running per event loop, futures never cross loops
+_flights: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, _Flights]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def set_executor(executor: Optional[Executor]) -> None:
+    """Set the executor compilations run in.
+
+    Args:
+        executor: Executor to use, None to go back to the default
+    """
+    global _executor
+    with _executor_lock:
+        _executor = executor
+
+
+def get_executor() -> Executor:
+    """Get the executor compilations run in.
+
+    Unless one was set with `set_executor`, this is a thread pool with a
+    single worker. Compiling is CPU bound and holds the GIL, so more threads
+    would not compile faster, they would only keep the event loop waiting
+    for the GIL longer.
+
+    Returns:
+        The executor
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(1, thread_name_prefix="cuteninja")
+        return _executor
+
+
+def in_flight() -> int:
+    """Count the compilations currently running for the running event loop."""
+    return len(_flights.get(asyncio.get_running_loop(), {}))
+
+
+def _retrieve(future: "asyncio.Future[Any]") -> None:
+    # every waiter may have been cancelled; don't log an unretrieved error
+    if not future.cancelled():
+        future.exception()
+
+
+async def single_flight(
+    key: Hashable, func: Callable[[], T], executor: Optional[Executor] = None
+) -> T:
+    """Run `func` in an executor, sharing one call among concurrent callers.
+
+    While a call for `key` is running, further callers wait for its result
+    instead of starting another one. Cancelling a caller does not cancel the
+    call, so the other callers still get the result.
+
+    Args:
+        key: Identifies calls that can be shared
+        func: Blocking function to run
+        executor: Executor to run in, defaults to the one from `set_executor`
+
+    Returns:
+        The return value of `func`
+    """
+    loop = asyncio.get_running_loop()
+    flights = _flights.get(loop)
+    if flights is None:
+        flights = _flights[loop] = {}
+
+    future = flights.get(key)
+    if future is None:
+        future = loop.run_in_executor(executor or get_executor(), func)
+        flights[key] = future
+
+        def done(finished: "asyncio.Future[Any]") -> None:
+            if flights.get(key) is finished:
+                del flights[key]
+            _retrieve(finished)
+
+        future.add_done_callback(done)
+    return await asyncio.shield(future)
+
+
+async def compile_kdl_async(
+    source: str,
+    format_output: bool = True,
+    indent: str = "    ",
+    use_cache: bool = True,
+    persistent_cache: Optional[PersistentCache] = None,
+    executor: Optional[Executor] = None,
+) -> KdlTemplate:
+    """Compile KDL source to a template without blocking the event loop.
+
+    A source already in the compile cache is returned right away. Otherwise
+    the compilation runs in an executor, and concurrent calls for the same
+    source and options share it and get the same template.
+
+    Args:
+        source: KDL markup as string
+        format_output: Whether to format the output with indentation
+        indent: Indentation used for each nesting level
+        use_cache: Whether to use the compile caches
+        persistent_cache: Persistent cache to use instead of the process-wide one
+        executor: Executor to compile in, defaults to the one from `set_executor`
+
+    Returns:
+        The compiled template
+    """
+    compile_template = partial(
+        KdlTemplate,
+        source,
+        format_output=format_output,
+        indent=indent,
+        use_cache=use_cache,
+        persistent_cache=persistent_cache,
+    )
+    key = make_key(source, format_output, indent)
+    if use_cache:
+        cached = get_compile_cache().get(key)
+        if cached is not None:
+            template = compile_template(lazy=True)
+            template._use_cached(cached)
+            return template
+
+    flight = ("compile", key, use_cache, id(persistent_cache))
+    return await single_flight(flight, compile_template, executor)
+
+
+__all__ = [
+    "compile_kdl_async",
+    "get_executor",
+    "in_flight",
+    "set_executor",
+    "single_flight",
+]
@@ -0,0 +1,96 @@
+import gzip
+import hashlib
+import zlib
+from functools import lru_cache
+from typing import NamedTuple, Optional, Tuple
+
+# preferred first when a client accepts several
+ENCODINGS = ("gzip", "deflate")
+
+
+class StaticArtifact(NamedTuple):
+    """Ready to serve output of a template without Jinja tokens."""
+
+    body: bytes  # UTF-8
+    gzip: bytes
+    deflate: bytes  # zlib format, as HTTP's deflate coding is
+    etag: str  # strong ETag of `body`, quoted
+
+    def encoded(self, encoding: Optional[str]) -> bytes:
+        """Get the body in a content coding.
+
+        Args:
+            encoding: "gzip", "deflate", or None for the plain body
+
+        Returns:
+            The encoded body
+        """
+        if encoding is None or encoding == "identity":
+            return self.body
+        if encoding in ENCODINGS:
+            return getattr(self, encoding)
+        raise ValueError(f"unsupported content coding: {encoding!r}")
+
+    def negotiate(self, accept_encoding: str = "") -> Tuple[bytes, Optional[str], str]:
+        """Pick the representation to send for an `Accept-Encoding` header.
+
+        Compressed variants are only chosen when they are smaller, unless the
+        client refuses the plain body with `identity;q=0`. Codings with
+        `q=0` are never chosen, also not through `*`. Each representation
+        has its own strong ETag, the plain one is `etag`.
+
+        Args:
+            accept_encoding: Value of the request's Accept-Encoding header
+
+        Returns:
+            The payload, its Content-Encoding (None for the plain body) and
+            its ETag
+        """
+        accepted = set()
+        refused = set()
+        for item in accept_encoding.lower().split(","):
+            coding, _, params = item.partition(";")
+            quality = params.strip()
+            if quality.startswith("q="):
+                try:
+                    if float(quality[2:]) <= 0:
+                        refused.add(coding.strip())
+                        continue
+                except ValueError:
+                    continue
+            accepted.add(coding.strip())
+
+        identity_refused = "identity" in refused or (
+            "*" in refused and "identity" not in accepted
+        )
+        for encoding in ENCODINGS:
+            if encoding in accepted or ("*" in accepted and encoding not in refused):
+                payload = getattr(self, encoding)
+                if identity_refused or len(payload) < len(self.body):
+                    return payload, encoding, f'{self.etag[:-1]}-{encoding}"'
+        return self.body, None, self.etag
+
+
+@lru_cache(maxsize=256)
+def make_artifact(output: str) -> StaticArtifact:
+    """Encode, compress and hash the output of a static template, memoized.
+
+    Compression is deterministic, so the same output always gives the same
+    bytes and ETags, in every process.
+
+    Args:
+        output: HTML without Jinja syntax
+
+    Returns:
+        The artifact
+    """
+    body = output.encode("utf-8", "surrogatepass")
+    return StaticArtifact(
+        body=body,
+        gzip=gzip.compress(body, compresslevel=9, mtime=0),
+        deflate=zlib.compress(body, 9),
+        etag=f'"{hashlib.sha256(body).hexdigest()[:32]}"',
+    )
+
+
+__all__ = ["StaticArtifact", "make_artifact"]
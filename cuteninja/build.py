@@ -0,0 +1,353 @@
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+from .artifacts import make_artifact
+from .core import KdlTemplate
+from .utils import atomic_write
+from .version import __version__
+
+MANIFEST_NAME = ".cuteninja-manifest.json"
+
+
+class BuildResult(NamedTuple):
+    """Outcome of converting one source file."""
+
+    source: str
+    output: str
+    status: str  # "built", "skipped" or "failed"
+    seconds: float
+    checksum: str
+    error: Optional[str] = None
+    # whether a gzip copy of the output was written next to it
+    compressed: bool = False
+
+
+class BuildReport(NamedTuple):
+    """Outcome of a build: one result per source file, in source order."""
+
+    results: List[BuildResult]
+    seconds: float
+
+    @property
+    def built(self) -> List[BuildResult]:
+        return [r for r in self.results if r.status == "built"]
+
+    @property
+    def skipped(self) -> List[BuildResult]:
+        return [r for r in self.results if r.status == "skipped"]
+
+    @property
+    def failed(self) -> List[BuildResult]:
+        return [r for r in self.results if r.status == "failed"]
+
+
+def find_sources(src_dir: str, extensions: Sequence[str] = (".kdl",)) -> List[str]:
+    """Find template sources below a directory.
+
+    Args:
+        src_dir: Directory to search
+        extensions: File name suffixes treated as KDL
+
+    Returns:
+        Sorted paths relative to `src_dir`, using `/` as separator
+    """
+    suffixes = tuple(extensions)
+    sources: List[str] = []
+    for root, dirs, files in os.walk(src_dir):
+        dirs[:] = [d for d in dirs if not d.startswith(".")]
+        for name in files:
+            if name.endswith(suffixes):
+                path = os.path.relpath(os.path.join(root, name), src_dir)
+                sources.append(path.replace(os.sep, "/"))
+    sources.sort()
+    return sources
+
+
+def output_name(source: str, suffix: str = ".html") -> str:
+    """Get the output path for a source path.
+
+    Args:
+        source: Source path relative to the source directory
+        suffix: Suffix replacing the source extension
+
+    Returns:
+        Output path relative to the output directory
+    """
+    return os.path.splitext(source)[0] + suffix
+
+
+def _checksum(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def convert_file(
+    src_dir: str,
+    out_dir: str,
+    source: str,
+    output: str,
+    format_output: bool = True,
+    indent: str = "    ",
+    compress_static: bool = True,
+) -> BuildResult:
+    """Convert one source file and write its output atomically.
+
+    When the output holds no Jinja syntax, a gzip copy is written next to
+    it with `.gz` appended, for web servers that serve precompressed files.
+    A stale copy of an earlier build is removed.
+
+    Errors are caught and reported in the result instead of raised.
+
+    Args:
+        src_dir: Directory holding the KDL sources
+        out_dir: Directory receiving the HTML outputs
+        source: Source path relative to `src_dir`
+        output: Output path relative to `out_dir`
+        format_output: Whether to format the output with indentation
+        indent: Indentation used for each nesting level
+        compress_static: Whether to write gzip copies of static outputs
+
+    Returns:
+        BuildResult with status "built" or "failed"
+    """
+    start = time.perf_counter()
+    checksum = ""
+    compressed = False
+    try:
+        with open(os.path.join(src_dir, source), "rb") as f:
+            data = f.read()
+        checksum = _checksum(data)
+        template = KdlTemplate(
+            data.decode("utf-8"),
+            format_output=format_output,
+            indent=indent,
+            use_cache=False,
+        )
+        target = os.path.join(out_dir, output)
+        os.makedirs(os.path.dirname(target) or ".", exist_ok=True)
+        if compress_static and template.is_static:
+            artifact = make_artifact(template.output)
+            atomic_write(target, artifact.body)
+            atomic_write(target + ".gz", artifact.gzip)
+            compressed = True
+        else:
+            atomic_write(target, template.output.encode("utf-8"))
+            if os.path.exists(target + ".gz"):
+                os.unlink(target + ".gz")
+    except Exception as e:
+        return BuildResult(
+            source,
+            output,
+            "failed",
+            time.perf_counter() - start,
+            checksum,
+            f"{type(e).__name__}: {e}",
+        )
+    return BuildResult(
+        source,
+        output,
+        "built",
+        time.perf_counter() - start,
+        checksum,
+        compressed=compressed,
+    )
+
+
+def _build_one(task: Tuple[str, str, str, str, Dict[str, Any]]) -> BuildResult:
+    src_dir, out_dir, source, output, options = task
+    return convert_file(src_dir, out_dir, source, output, **options)
+
+
+def _remove_output(target: str) -> None:
+    for path in (target, target + ".gz"):
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+
+def load_manifest(out_dir: str) -> Dict[str, Any]:
+    """Read the build manifest of an output directory.
+
+    Args:
+        out_dir: Output directory of a previous build
+
+    Returns:
+        The manifest, or an empty one when missing or unreadable
+    """
+    try:
+        with open(os.path.join(out_dir, MANIFEST_NAME), encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return manifest if isinstance(manifest, dict) else {}
+
+
+def iter_build(
+    src_dir: str,
+    out_dir: str,
+    jobs: Optional[int] = None,
+    format_output: bool = True,
+    indent: str = "    ",
+    force: bool = False,
+    extensions: Sequence[str] = (".kdl",),
+    suffix: str = ".html",
+    compress_static: bool = True,
+) -> Iterator[BuildResult]:
+    """Convert a tree of KDL templates, yielding a result per file.
+
+    Sources whose checksum and options match the manifest of the previous
+    build are skipped. The remaining files are converted in a process pool;
+    a failing file is reported and does not stop the others. Outputs the
+    previous build wrote for sources that are gone are removed. The
+    manifest is written once all files are done.
+
+    Args:
+        src_dir: Directory holding the KDL sources
+        out_dir: Directory receiving the HTML outputs
+        jobs: Number of worker processes, defaults to the CPU count; 1
+            converts in the current process
+        format_output: Whether to format the output with indentation
+        indent: Indentation used for each nesting level
+        force: Rebuild every file regardless of the manifest
+        extensions: File name suffixes treated as KDL
+        suffix: Suffix of the output files
+        compress_static: Whether to write gzip copies of static outputs
+
+    Yields:
+        BuildResult for each source, in source order
+    """
+    options: Dict[str, Any] = {
+        "format_output": format_output,
+        "indent": indent,
+        "compress_static": compress_static,
+    }
+    os.makedirs(out_dir, exist_ok=True)
+
+    manifest = load_manifest(out_dir)
+    built_before = manifest.get("files")
+    if not isinstance(built_before, dict):
+        built_before = {}
+    previous: Dict[str, Any] = {}
+    if (
+        not force
+        and manifest.get("version") == __version__
+        and manifest.get("options") == options
+    ):
+        previous = built_before
+
+    sources = find_sources(src_dir, extensions)
+    outputs = {output_name(source, suffix) for source in sources}
+    for entry in built_before.values():
+        output = entry.get("output") if isinstance(entry, dict) else None
+        if isinstance(output, str) and output not in outputs:
+            # the source was deleted or renamed since
+            _remove_output(os.path.join(out_dir, output))
+
+    files: Dict[str, Dict[str, str]] = {}
+    tasks: List[Tuple[str, str, str, str, Dict[str, Any]]] = []
+    pending: List[Tuple[str, Optional[BuildResult]]] = []
+
+    for source in sources:
+        output = output_name(source, suffix)
+        entry = previous.get(source)
+        if entry and entry.get("output") == output:
+            try:
+                with open(os.path.join(src_dir, source), "rb") as f:
+                    checksum = _checksum(f.read())
+            except OSError:
+                # converting reports why it can't be read
+                checksum = ""
+            target = os.path.join(out_dir, output)
+            if (
+                checksum
+                and entry.get("checksum") == checksum
+                and os.path.exists(target)
+                and (not entry.get("compressed") or os.path.exists(target + ".gz"))
+            ):
+                files[source] = entry
+                pending.append(
+                    (
+                        source,
+                        BuildResult(
+                            source,
+                            output,
+                            "skipped",
+                            0.0,
+                            checksum,
+                            compressed=bool(entry.get("compressed")),
+                        ),
+                    )
+                )
+                continue
+        tasks.append((src_dir, out_dir, source, output, options))
+        pending.append((source, None))
+
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+
+    if jobs <= 1 or len(tasks) <= 1:
+        built: Iterator[BuildResult] = map(_build_one, tasks)
+        executor = None
+    else:
+        executor = ProcessPoolExecutor(max_workers=min(jobs, len(tasks)))
+        chunksize = max(1, len(tasks) // (jobs * 8))
+        built = executor.map(_build_one, tasks, chunksize=chunksize)
+
+    try:
+        for source, result in pending:
+            if result is None:
+                result = next(built)
+                if result.status == "built":
+                    files[source] = {
+                        "checksum": result.checksum,
+                        "output": result.output,
+                    }
+                    if result.compressed:
+                        files[source]["compressed"] = True
+            yield result
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    new_manifest = {"version": __version__, "options": options, "files": files}
+    atomic_write(
+        os.path.join(out_dir, MANIFEST_NAME),
+        json.dumps(new_manifest, indent=1, sort_keys=True).encode("utf-8"),
+    )
+
+
+def build(
+    src_dir: str,
+    out_dir: str,
+    jobs: Optional[int] = None,
+    format_output: bool = True,
+    indent: str = "    ",
+    force: bool = False,
+    extensions: Sequence[str] = (".kdl",),
+    suffix: str = ".html",
+    compress_static: bool = True,
+) -> BuildReport:
+    """Convert a tree of KDL templates; see `iter_build`.
+
+    Returns:
+        BuildReport with a result per source file
+    """
+    start = time.perf_counter()
+    results = list(
+        iter_build(
+            src_dir,
+            out_dir,
+            jobs=jobs,
+            format_output=format_output,
+            indent=indent,
+            force=force,
+            extensions=extensions,
+            suffix=suffix,
+            compress_static=compress_static,
+        )
+    )
+    return BuildReport(results, time.perf_counter() - start)
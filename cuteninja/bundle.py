@@ -0,0 +1,179 @@
+import json
+import os
+import zipfile
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import jinja2
+from jinja2 import Environment, FileSystemLoader, ModuleLoader
+
+from .utils import atomic_write
+from .version import __version__
+
+STAMP_NAME = "__cuteninja_bundle__.json"
+
+
+class StaleBundleError(Exception):
+    """Error raised when a bundle was built by another cuteninja or Jinja2."""
+
+
+def _stamp(names: List[str], options: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "cuteninja": __version__,
+        "jinja2": jinja2.__version__,
+        "options": options,
+        "templates": names,
+    }
+
+
+def compile_bundle(
+    src_dir: str,
+    target: str,
+    environment: Optional[Environment] = None,
+    zip: Optional[str] = "deflated",
+    format_output: bool = True,
+    indent: str = "    ",
+    extensions: Sequence[str] = (".kdl",),
+    filter_func: Optional[Callable[[str], bool]] = None,
+    log_function: Optional[Callable[[str], None]] = None,
+) -> List[str]:
+    """Precompile a tree of templates into an importable bundle.
+
+    KDL templates are converted with `KdlLoader` and then compiled to Python
+    modules by Jinja, like `Environment.compile_templates`. Other templates
+    in the tree are compiled as they are. The bundle carries a stamp with the
+    cuteninja and Jinja2 versions that `BundleLoader` checks.
+
+    Jinja bakes some environment settings into the generated code, so pass
+    the environment the bundle will be served from, or one configured the
+    same way.
+
+    Args:
+        src_dir: Directory holding the templates
+        target: Zip file or, with `zip=None`, directory to write
+        environment: Environment whose settings to compile with
+        zip: "deflated", "stored" or None to write a directory
+        format_output: Whether to format the HTML with indentation
+        indent: Indentation used for each nesting level
+        extensions: File name suffixes treated as KDL
+        filter_func: Called with each template name, False skips it
+        log_function: Called with progress messages
+
+    Returns:
+        Names of the compiled templates
+
+    Raises:
+        jinja2.TemplateSyntaxError: When a template does not compile
+    """
+    from .loaders import KdlLoader
+
+    loader = KdlLoader(
+        FileSystemLoader(src_dir),
+        extensions=extensions,
+        format_output=format_output,
+        indent=indent,
+    )
+    env = (environment or Environment()).overlay(loader=loader)
+    names = env.list_templates(filter_func=filter_func)
+    options = {"format_output": format_output, "indent": indent}
+    stamp = json.dumps(_stamp(names, options), indent=1).encode("utf-8")
+
+    if zip is None:
+        os.makedirs(target, exist_ok=True)
+        # the stamp is written last, so an interrupted build is rejected
+        try:
+            os.remove(os.path.join(target, STAMP_NAME))
+        except FileNotFoundError:
+            pass
+        env.compile_templates(
+            target,
+            filter_func=filter_func,
+            zip=None,
+            log_function=log_function,
+            ignore_errors=False,
+        )
+        atomic_write(os.path.join(target, STAMP_NAME), stamp)
+        return names
+
+    directory = os.path.dirname(os.path.abspath(target))
+    tmp_target = os.path.join(
+        directory, f".tmp-{os.getpid()}-{os.path.basename(target)}"
+    )
+    try:
+        env.compile_templates(
+            tmp_target,
+            filter_func=filter_func,
+            zip=zip,
+            log_function=log_function,
+            ignore_errors=False,
+        )
+        with zipfile.ZipFile(tmp_target, "a") as archive:
+            archive.writestr(STAMP_NAME, stamp)
+        os.replace(tmp_target, target)
+    except BaseException:
+        try:
+            os.remove(tmp_target)
+        except OSError:
+            pass
+        raise
+    return names
+
+
+def read_stamp(path: str) -> Optional[Dict[str, Any]]:
+    """Read the stamp of a bundle.
+
+    Args:
+        path: Zip file or directory written by `compile_bundle`
+
+    Returns:
+        The stamp, or None when the bundle has none or it is unreadable
+    """
+    try:
+        if os.path.isdir(path):
+            with open(os.path.join(path, STAMP_NAME), "rb") as f:
+                data = f.read()
+        else:
+            with zipfile.ZipFile(path) as archive:
+                data = archive.read(STAMP_NAME)
+        stamp = json.loads(data.decode("utf-8"))
+    except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+        return None
+    return stamp if isinstance(stamp, dict) else None
+
+
+class BundleLoader(ModuleLoader):
+    """Jinja2 loader serving templates from a bundle built by `compile_bundle`.
+
+    Templates are imported as precompiled Python modules; neither KDL
+    parsing nor Jinja compilation happens at runtime. Bundles built by a
+    different cuteninja or Jinja2 version are rejected.
+
+    Args:
+        path: Zip file or directory written by `compile_bundle`
+
+    Raises:
+        StaleBundleError: When the bundle has no valid stamp or was built
+            by other versions
+    """
+
+    stamp: Dict[str, Any]
+
+    def __init__(self, path: str) -> None:
+        stamp = read_stamp(path)
+        if stamp is None:
+            raise StaleBundleError(f"{path!r} is not a cuteninja bundle")
+        built_with = (stamp.get("cuteninja"), stamp.get("jinja2"))
+        running = (__version__, jinja2.__version__)
+        if built_with != running:
+            raise StaleBundleError(
+                f"{path!r} was built with cuteninja {built_with[0]} and "
+                f"Jinja2 {built_with[1]}, running cuteninja {running[0]} and "
+                f"Jinja2 {running[1]}"
+            )
+        super().__init__(path)
+        self.stamp = stamp
+
+    def list_templates(self) -> List[str]:
+        return list(self.stamp.get("templates", []))
+
+
+__all__ = ["BundleLoader", "StaleBundleError", "compile_bundle", "read_stamp"]
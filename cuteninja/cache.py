@@ -0,0 +1,191 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, NamedTuple, Optional, Tuple
+
+
+class CompiledTemplate(NamedTuple):
+    """Result of compiling a KDL source: the HTML output and its token map."""
+
+    output: str
+    token_map: Dict[str, str]
+    # tokens evaluated at compile time with a static context
+    folded: Tuple[str, ...] = ()
+
+    @property
+    def size(self) -> int:
+        """Approximate number of bytes held by this entry."""
+        size = len(self.output.encode("utf-8", "surrogatepass"))
+        for placeholder, token in self.token_map.items():
+            size += len(placeholder) + len(token.encode("utf-8", "surrogatepass"))
+        for token in self.folded:
+            size += len(token.encode("utf-8", "surrogatepass"))
+        return size
+
+
+def make_key(source: str, *options: object) -> str:
+    """Build a cache key from a KDL source and the options it was compiled with.
+
+    Args:
+        source: KDL markup as string
+        *options: Converter options that influence the output
+
+    Returns:
+        Hex digest identifying the compiled result
+    """
+    digest = hashlib.sha256(source.encode("utf-8", "surrogatepass"))
+    for option in options:
+        digest.update(b"\0")
+        digest.update(repr(option).encode("utf-8", "surrogatepass"))
+    return digest.hexdigest()
+
+
+class CompileCache:
+    """Thread-safe LRU cache of compiled templates bounded by count and size."""
+
+    max_entries: int
+    max_bytes: int
+    hits: int
+    misses: int
+    evictions: int
+
+    def __init__(
+        self, max_entries: int = 512, max_bytes: int = 64 * 1024 * 1024
+    ) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[str, CompiledTemplate]" = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._entries
+
+    @property
+    def total_bytes(self) -> int:
+        """Number of bytes currently held by the cache."""
+        return self._total_bytes
+
+    def get(self, key: str) -> Optional[CompiledTemplate]:
+        """Look up a compiled template and mark it as recently used.
+
+        Args:
+            key: Cache key as returned by `make_key`
+
+        Returns:
+            The cached entry, or None on a miss
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def set(self, key: str, entry: CompiledTemplate) -> None:
+        """Store a compiled template, evicting least recently used entries.
+
+        Entries larger than the byte budget are not stored.
+
+        Args:
+            key: Cache key as returned by `make_key`
+            entry: Compiled template to store
+        """
+        size = entry.size
+        with self._lock:
+            self._remove(key)
+            if self.max_entries <= 0 or size > self.max_bytes:
+                return
+            self._entries[key] = entry
+            self._sizes[key] = size
+            self._total_bytes += size
+            self._evict()
+
+    def invalidate(self, key: str) -> bool:
+        """Drop a single entry.
+
+        Args:
+            key: Cache key as returned by `make_key`
+
+        Returns:
+            Whether an entry was removed
+        """
+        with self._lock:
+            return self._remove(key)
+
+    def clear(self) -> None:
+        """Drop every entry and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+            self._total_bytes = 0
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def configure(
+        self, max_entries: Optional[int] = None, max_bytes: Optional[int] = None
+    ) -> None:
+        """Change the cache limits, evicting entries that no longer fit.
+
+        Args:
+            max_entries: Maximum number of entries, 0 disables caching
+            max_bytes: Maximum total size of the entries in bytes
+        """
+        with self._lock:
+            if max_entries is not None:
+                self.max_entries = max_entries
+            if max_bytes is not None:
+                self.max_bytes = max_bytes
+            self._evict()
+
+    def stats(self) -> Dict[str, int]:
+        """Get the cache counters.
+
+        Returns:
+            Mapping of counter names to values
+        """
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def _remove(self, key: str) -> bool:
+        if key not in self._entries:
+            return False
+        del self._entries[key]
+        self._total_bytes -= self._sizes.pop(key)
+        return True
+
+    def _evict(self) -> None:
+        while self._entries and (
+            len(self._entries) > self.max_entries or self._total_bytes > self.max_bytes
+        ):
+            key, _ = self._entries.popitem(last=False)
+            self._total_bytes -= self._sizes.pop(key)
+            self.evictions += 1
+
+
+_compile_cache = CompileCache()
+
+
+def get_compile_cache() -> CompileCache:
+    """Get the process-wide compile cache used by `KdlTemplate` and `render_kdl`.
+
+    Returns:
+        The shared CompileCache instance
+    """
+    return _compile_cache
@@ -0,0 +1,195 @@
+import argparse
+import sys
+from typing import List, Optional
+
+from .version import __version__
+
+
+def _add_output_options(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("src", help="directory holding the .kdl sources")
+    parser.add_argument("out", help="directory receiving the .html outputs")
+    parser.add_argument(
+        "--compact",
+        action="store_true",
+        help="write unformatted output without newlines and indentation",
+    )
+    parser.add_argument(
+        "--indent",
+        default="    ",
+        help="indentation for each nesting level (default: four spaces)",
+    )
+    parser.add_argument("--suffix", default=".html", help="suffix of the output files")
+
+
+def _cmd_build(args: argparse.Namespace) -> int:
+    from .build import iter_build
+
+    failed = built = skipped = 0
+    total = 0.0
+    for result in iter_build(
+        args.src,
+        args.out,
+        jobs=args.jobs,
+        format_output=not args.compact,
+        indent=args.indent,
+        force=args.force,
+        suffix=args.suffix,
+        compress_static=not args.no_gzip,
+    ):
+        total += result.seconds
+        if result.status == "failed":
+            failed += 1
+            print(f"failed  {result.source}: {result.error}", file=sys.stderr)
+        elif result.status == "built":
+            built += 1
+            if not args.quiet:
+                print(f"built   {result.source} ({result.seconds * 1000:.1f} ms)")
+        else:
+            skipped += 1
+            if args.verbose:
+                print(f"skipped {result.source}")
+
+    print(
+        f"{built} built, {skipped} unchanged, {failed} failed "
+        f"({total:.2f} s of conversion)"
+    )
+    return 1 if failed else 0
+
+
+def _cmd_watch(args: argparse.Namespace) -> int:
+    from .build import BuildResult
+    from .watch import Watcher
+
+    watcher = Watcher(
+        args.src,
+        args.out,
+        format_output=not args.compact,
+        indent=args.indent,
+        suffix=args.suffix,
+        interval=args.interval,
+        debounce=args.debounce,
+    )
+
+    def report(results: List[BuildResult]) -> None:
+        for result in results:
+            if result.status == "failed":
+                print(f"failed  {result.source}: {result.error}", file=sys.stderr)
+            else:
+                print(f"built   {result.source} ({result.seconds * 1000:.1f} ms)")
+        sys.stdout.flush()
+
+    print(f"watching {args.src} (Ctrl-C to stop)")
+    try:
+        watcher.run(report)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def _cmd_bundle(args: argparse.Namespace) -> int:
+    from .bundle import compile_bundle
+
+    names = compile_bundle(
+        args.src,
+        args.target,
+        zip=None if args.zip == "none" else args.zip,
+        format_output=not args.compact,
+        indent=args.indent,
+        log_function=None if args.quiet else print,
+    )
+    print(f"{len(names)} templates bundled into {args.target}")
+    return 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Entry point of the `cuteninja` command.
+
+    Args:
+        argv: Command line arguments, defaults to `sys.argv[1:]`
+
+    Returns:
+        Process exit code
+    """
+    parser = argparse.ArgumentParser(
+        prog="cuteninja", description="Convert KDL templates to HTML with Jinja2."
+    )
+    parser.add_argument("--version", action="version", version=__version__)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = commands.add_parser(
+        "build", help="convert every .kdl file below SRC into OUT"
+    )
+    _add_output_options(build_parser)
+    build_parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=None,
+        help="number of worker processes (default: CPU count)",
+    )
+    build_parser.add_argument(
+        "--force", action="store_true", help="rebuild files that did not change"
+    )
+    build_parser.add_argument(
+        "--no-gzip",
+        action="store_true",
+        help="don't write .gz copies of outputs without Jinja syntax",
+    )
+    build_parser.add_argument(
+        "-q", "--quiet", action="store_true", help="only report failures"
+    )
+    build_parser.add_argument(
+        "-v", "--verbose", action="store_true", help="also list unchanged files"
+    )
+    build_parser.set_defaults(func=_cmd_build)
+
+    watch_parser = commands.add_parser(
+        "watch", help="convert SRC into OUT and re-convert files as they change"
+    )
+    _add_output_options(watch_parser)
+    watch_parser.add_argument(
+        "--interval",
+        type=float,
+        default=0.05,
+        help="seconds between polls of the source tree (default: 0.05)",
+    )
+    watch_parser.add_argument(
+        "--debounce",
+        type=float,
+        default=0.03,
+        help="seconds the tree must be quiet before converting (default: 0.03)",
+    )
+    watch_parser.set_defaults(func=_cmd_watch)
+
+    bundle_parser = commands.add_parser(
+        "bundle", help="precompile SRC into an importable Jinja2 module bundle"
+    )
+    bundle_parser.add_argument("src", help="directory holding the templates")
+    bundle_parser.add_argument("target", help="zip file or directory to write")
+    bundle_parser.add_argument(
+        "--zip",
+        choices=("deflated", "stored", "none"),
+        default="deflated",
+        help="zip compression, or 'none' to write a directory",
+    )
+    bundle_parser.add_argument(
+        "--compact",
+        action="store_true",
+        help="write unformatted output without newlines and indentation",
+    )
+    bundle_parser.add_argument(
+        "--indent",
+        default="    ",
+        help="indentation for each nesting level (default: four spaces)",
+    )
+    bundle_parser.add_argument(
+        "-q", "--quiet", action="store_true", help="only print the summary"
+    )
+    bundle_parser.set_defaults(func=_cmd_bundle)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,56 +1,632 @@
-from typing import Dict
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache, partial
+from time import perf_counter
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Mapping,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
 
-from .jinja_processor import JinjaProcessor
+from . import instrumentation
+from .artifacts import StaticArtifact, make_artifact
+from .cache import CompiledTemplate, get_compile_cache, make_key
+from .folding import fold_static
+from .fragments import Fragment, make_fragments
+from .incremental import IncrementalDocument
+from .instrumentation import CompileMetrics
+from .ir import DocumentIR, get_document_cache
+from .jinja_processor import JinjaProcessor, find_statements
 from .kdl_converter import KdlToHtmlConverter
+from .kdl_events import parse_events
+from .persistent import PersistentCache, get_persistent_cache
+from .sourcemap import SourceMap, restore_with_spans
+
+if TYPE_CHECKING:
+    from jinja2 import Environment, Template
+
+_processor = JinjaProcessor()
+
+
+@lru_cache(maxsize=32)
+def _shared_converter(
+    format_output: bool, indent: str, minify: bool = False
+) -> KdlToHtmlConverter:
+    return KdlToHtmlConverter(
+        indent=indent, format_output=format_output, iterative=True, minify=minify
+    )
 
 
 class KdlTemplate:
-    original_source: str
+    """A KDL template compiled to HTML with Jinja2 syntax preserved.
+
+    By default the source is compiled on construction. With `lazy=True`
+    compilation waits until the output or the tokens are first needed, and
+    `keep_source=False`/`keep_tokens=False` release the source and the token
+    map once compiled, for processes holding many templates. `minify=True`
+    writes the smallest equivalent HTML, see
+    `KdlToHtmlConverter.convert_document_to`.
+
+    Values in `static_context` are the same for every render, e.g. a site
+    name or feature flags. Jinja expressions and conditions they decide are
+    evaluated at compile time (see `folding.fold_static`) and the folded
+    tokens are listed in `folded`. The token map and source map only cover
+    the tokens left in the output.
+    """
+
+    __slots__ = (
+        "original_source",
+        "format_output",
+        "indent",
+        "use_cache",
+        "persistent_cache",
+        "keep_source",
+        "keep_tokens",
+        "minify",
+        "static_context",
+        "metrics",
+        "_output",
+        "_token_map",
+        "_folded",
+        "_static",
+        "_fragments",
+        "_incremental",
+    )
+
+    original_source: Optional[str]
     format_output: bool
-    jinja_processor: JinjaProcessor
-    converter: KdlToHtmlConverter
-    token_map: Dict[str, str]
-    output: str
+    indent: str
+    use_cache: bool
+    persistent_cache: Optional[PersistentCache]
+    keep_source: bool
+    keep_tokens: bool
+    minify: bool
+    static_context: Optional[Mapping[str, Any]]
+    metrics: Optional[CompileMetrics]
+    _output: Optional[str]
+    _token_map: Optional[Dict[str, str]]
+    _folded: Tuple[str, ...]
+    _static: bool
+    _fragments: Optional[Dict[str, Fragment]]
+    _incremental: Optional[IncrementalDocument]
 
-    def __init__(self, source: str, format_output: bool = True) -> None:
+    def __init__(
+        self,
+        source: str,
+        format_output: bool = True,
+        indent: str = "    ",
+        use_cache: bool = True,
+        persistent_cache: Optional[PersistentCache] = None,
+        lazy: bool = False,
+        keep_source: bool = True,
+        keep_tokens: bool = True,
+        static_context: Optional[Mapping[str, Any]] = None,
+        minify: bool = False,
+    ) -> None:
         self.original_source = source
         self.format_output = format_output
-        self.jinja_processor = JinjaProcessor()
-        self.converter = KdlToHtmlConverter(format_output=format_output)
+        self.indent = indent
+        self.use_cache = use_cache
+        if persistent_cache is None and use_cache:
+            persistent_cache = get_persistent_cache()
+        self.persistent_cache = persistent_cache
+        self.keep_source = keep_source
+        self.keep_tokens = keep_tokens
+        self.minify = minify
+        self.static_context = static_context or None
+        self.metrics = None
+        self._output = None
+        self._token_map = None
+        self._folded = ()
+        self._static = False
+        self._fragments = None
+        self._incremental = None
+
+        if not lazy:
+            self._process()
+
+    @property
+    def jinja_processor(self) -> JinjaProcessor:
+        return _processor
 
-        self._process()
+    @property
+    def converter(self) -> KdlToHtmlConverter:
+        return _shared_converter(self.format_output, self.indent, self.minify)
+
+    @property
+    def compiled(self) -> bool:
+        return self._output is not None
+
+    @property
+    def output(self) -> str:
+        if self._output is None:
+            self._process()
+        assert self._output is not None
+        return self._output
+
+    @property
+    def token_map(self) -> Dict[str, str]:
+        if self._output is None:
+            self._process()
+        if self._token_map is None:
+            raise RuntimeError("token map was released (keep_tokens=False)")
+        # the map may be shared with the compile cache
+        return dict(self._token_map)
+
+    @property
+    def folded(self) -> Tuple[str, ...]:
+        """Tokens evaluated with the static context, in source order."""
+        if self._output is None:
+            self._process()
+        return self._folded
+
+    @property
+    def is_static(self) -> bool:
+        """Whether the output holds no Jinja syntax and needs no rendering."""
+        if self._output is None:
+            self._process()
+        return self._static
+
+    @property
+    def artifact(self) -> Optional[StaticArtifact]:
+        """The output as bytes, compressed and with an ETag, if it is static.
+
+        Built once per distinct output and shared by all templates with it.
+        """
+        if not self.is_static:
+            return None
+        return make_artifact(self.output)
+
+    @property
+    def options(self) -> Tuple[object, ...]:
+        """Compile options that influence the output, for cache keys."""
+        options: List[object] = [self.format_output, self.indent]
+        if self.minify:
+            options.append("minify")
+        if self.static_context is not None:
+            options.append(sorted(self.static_context.items()))
+        return tuple(options)
+
+    @property
+    def cache_key(self) -> str:
+        if self.original_source is None:
+            raise RuntimeError("source was released (keep_source=False)")
+        return make_key(self.original_source, *self.options)
 
     def _process(self) -> None:
+        if self.original_source is None:
+            raise RuntimeError("source was released (keep_source=False)")
+        cache = get_compile_cache() if self.use_cache else None
+        if cache is None:
+            compiled = self._load()
+        else:
+            key = self.cache_key
+            cached = cache.get(key)
+            if cached is None:
+                compiled = self._load()
+                cache.set(key, compiled)
+            else:
+                self._use_cached(cached)
+                return
+        self._use(compiled)
+
+    def _use_cached(self, compiled: CompiledTemplate) -> None:
+        # a hit in the compile cache
+        self.metrics = self._cached_metrics("memory", compiled)
+        self._use(compiled)
+
+    def _use(self, compiled: CompiledTemplate) -> None:
+        self._output = compiled.output
+        self._folded = compiled.folded
+        self._static = not compiled.token_map
+        if self.keep_tokens:
+            self._token_map = compiled.token_map
+        if not self.keep_source:
+            self.original_source = None
+
+        if instrumentation.has_listeners() and self.metrics is not None:
+            instrumentation.notify(self.metrics)
+
+    def _cached_metrics(
+        self, origin: str, compiled: CompiledTemplate
+    ) -> CompileMetrics:
+        return CompileMetrics(
+            origin=origin,
+            input_bytes=self._input_size(),
+            output_bytes=compiled.output,
+            token_count=len(compiled.token_map),
+        )
+
+    def _input_size(self) -> Union[int, str]:
+        source = self.original_source
+        assert source is not None
+        if self.keep_source:
+            # measured when the metrics are read
+            return source
+        # the source is released next, measure it now
+        if source.isascii():
+            return len(source)
+        return len(source.encode("utf-8", "surrogatepass"))
+
+    def _load(self) -> CompiledTemplate:
+        assert self.original_source is not None
+        if self.persistent_cache is None:
+            return self._compile()
+
+        bucket = self.persistent_cache.get_bucket(self.original_source, *self.options)
+        if bucket.compiled is None:
+            bucket.compiled = self._compile()
+            self.persistent_cache.set_bucket(bucket)
+        else:
+            self.metrics = self._cached_metrics("disk", bucket.compiled)
+        return bucket.compiled
+
+    def _parse(self, kdl: str) -> Union[DocumentIR, List[Any]]:
+        if self.use_cache:
+            return get_document_cache().parse(kdl)
         from .kdl_bindings import parse
 
-        cleaned_kdl, self.token_map = self.jinja_processor.extract_jinja(
-            self.original_source
+        return parse(kdl).nodes
+
+    def _compile(self) -> CompiledTemplate:
+        assert self.original_source is not None
+        start = perf_counter()
+        cleaned_kdl, token_map, _ = self.jinja_processor.scan(self.original_source)
+        extracted = perf_counter()
+
+        document = self._parse(cleaned_kdl)
+        parsed = perf_counter()
+
+        parts: List[str] = []
+        node_count = self.converter.convert_document_to(
+            document, parts.append, self._statements(token_map)
         )
+        html_with_placeholders = "".join(parts)
+        converted = perf_counter()
+
+        folded: Tuple[str, ...] = ()
+        if self.static_context is None:
+            output = self.jinja_processor.restore_jinja(
+                html_with_placeholders, token_map
+            )
+        else:
+            output, token_map, folded = fold_static(
+                html_with_placeholders, token_map, self.static_context
+            )
+        restored = perf_counter()
+
+        self.metrics = CompileMetrics(
+            origin="compile",
+            input_bytes=self._input_size(),
+            output_bytes=output,
+            token_count=len(token_map),
+            node_count=node_count,
+            extract_seconds=extracted - start,
+            parse_seconds=parsed - extracted,
+            convert_seconds=converted - parsed,
+            restore_seconds=restored - converted,
+        )
+        return CompiledTemplate(output, token_map, folded)
+
+    def update(self, source: str) -> None:
+        """Compile an edited source, recompiling only the nodes the edit touched.
+
+        The template is kept in units of whole nodes (see
+        `incremental.IncrementalDocument`), built by the first update. Each
+        update compares the source with the last one and extracts, parses
+        and converts only the units the edit touched, inside the innermost
+        element holding the whole edit; the HTML of the others is reused and
+        the token map is numbered again. Output and token map are those of a
+        template compiled from `source`.
+
+        Minified templates, templates with a `static_context` or
+        `keep_source=False`, sources with `{% raw %}` blocks or Jinja the
+        units can't be told apart in, and edits the units can't be compiled
+        again after are compiled from scratch instead. Only those are added
+        to the compile caches.
+
+        Args:
+            source: The edited KDL source
+
+        Raises:
+            Exception: What compiling `source` raises, e.g. a parse error;
+                the template is then left as it was
+        """
+        incremental = self._incremental
+        if incremental is None or not incremental.update(source):
+            incremental = None
+            if self.keep_source and not self.minify and self.static_context is None:
+                try:
+                    incremental = IncrementalDocument(source, self.converter)
+                except ValueError:
+                    pass
+        self._incremental = incremental
+        self._fragments = None
+
+        if incremental is None:
+            previous = (self.original_source, self._output, self._token_map)
+            self.original_source = source
+            self._output = None
+            try:
+                self._process()
+            except BaseException:
+                self.original_source, self._output, self._token_map = previous
+                raise
+            return
+
+        self.original_source = source
+        self._output = incremental.output
+        token_map = incremental.token_map
+        self._token_map = token_map if self.keep_tokens else None
+        self._folded = ()
+        self._static = not token_map
+        self.metrics = incremental.metrics
+        if instrumentation.has_listeners():
+            instrumentation.notify(incremental.metrics)
 
-        doc = parse(cleaned_kdl)
+    def _statements(self, token_map: Dict[str, str]) -> Set[str]:
+        return find_statements(token_map) if self.minify else set()
 
-        html_with_placeholders = self.converter.convert_document(doc.nodes)
+    def source_map(self) -> SourceMap:
+        """Compile the source again, recording where each Jinja token went.
 
-        self.output = self.jinja_processor.restore_jinja(
-            html_with_placeholders, self.token_map
+        The result is not cached; it is meant for debugging and profiling.
+
+        Returns:
+            Map from lines of the output to lines of the KDL source
+        """
+        if self.original_source is None:
+            raise RuntimeError("source was released (keep_source=False)")
+        extraction = self.jinja_processor.scan(self.original_source)
+        parts: List[str] = []
+        self.converter.convert_document_to(
+            self._parse(extraction.kdl),
+            parts.append,
+            self._statements(extraction.token_map),
+        )
+        html = "".join(parts)
+        if self.static_context is not None:
+            html, token_map, _ = fold_static(
+                html, extraction.token_map, self.static_context, restore=False
+            )
+            extraction = extraction._replace(token_map=token_map)
+        output, spans = restore_with_spans(html, extraction)
+        return SourceMap(spans, output, self.original_source)
+
+    @property
+    def fragments(self) -> Dict[str, Fragment]:
+        """Elements that render on their own, by `fragment` property or id.
+
+        Found on first use by compiling the source again, see
+        `KdlToHtmlConverter.convert_fragments` and `fragments.make_fragments`.
+        """
+        if self._fragments is None:
+            self._fragments = self._compile_fragments()
+        return self._fragments
+
+    def fragment(self, name: str) -> Fragment:
+        """Get a template rendering only one element, e.g. for a partial update.
+
+        The element comes with the loops and conditionals around it and the
+        names assigned before it, so rendering the fragment with the page's
+        context gives the element's part of the page.
+
+        Args:
+            name: Value of the element's `fragment` property or its id
+
+        Returns:
+            The fragment
+
+        Raises:
+            KeyError: If no element has that name, or it can't be rendered
+                on its own
+        """
+        try:
+            return self.fragments[name]
+        except KeyError:
+            raise KeyError(f"no fragment named {name!r}") from None
+
+    def _compile_fragments(self) -> Dict[str, Fragment]:
+        if self.original_source is None:
+            raise RuntimeError("source was released (keep_source=False)")
+        extraction = self.jinja_processor.scan(self.original_source)
+        nodes = self._parse(extraction.kdl)
+        statements = self._statements(extraction.token_map)
+        marked = self.converter.convert_fragments(nodes, statements)
+        if not marked:
+            return {}
+        parts: List[str] = []
+        self.converter.convert_document_to(nodes, parts.append, statements)
+        return make_fragments(
+            marked,
+            "".join(parts),
+            extraction.token_map,
+            self.static_context,
         )
 
     def render(self) -> str:
         return self.output
 
     def get_jinja_tokens(self) -> Dict[str, str]:
-        return self.jinja_processor.get_source_map()
+        return self.token_map
+
+    def to_jinja(self, environment: Optional["Environment"] = None) -> "Template":
+        """Compile the output to a Jinja template, memoized per environment.
 
+        Args:
+            environment: Environment to compile in, defaults to the shared
+                one used by `jinja2.Template`
 
-def render_kdl(source: str, format_output: bool = True) -> str:
+        Returns:
+            Ready to render jinja2.Template
+        """
+        from .jinja_templates import html_to_jinja
+
+        return html_to_jinja(self.output, environment)
+
+
+def render_kdl(
+    source: str,
+    format_output: bool = True,
+    indent: str = "    ",
+    use_cache: bool = True,
+    persistent_cache: Optional[PersistentCache] = None,
+    static_context: Optional[Mapping[str, Any]] = None,
+    minify: bool = False,
+) -> str:
     """Render KDL source to HTML with Jinja2 support.
 
+    Compiled results are kept in the process-wide compile cache, so rendering
+    the same source with the same options again skips parsing and conversion.
+
     Args:
         source: KDL markup as string
         format_output: Whether to format the output with indentation
+        indent: Indentation used for each nesting level
+        use_cache: Whether to use the compile caches
+        persistent_cache: Persistent cache to use instead of the process-wide one
+        static_context: Values to evaluate at compile time, see `KdlTemplate`
+        minify: Whether to write the smallest equivalent HTML
 
     Returns:
         HTML string with Jinja2 syntax preserved
     """
-    template = KdlTemplate(source, format_output=format_output)
+    template = KdlTemplate(
+        source,
+        format_output=format_output,
+        indent=indent,
+        use_cache=use_cache,
+        persistent_cache=persistent_cache,
+        static_context=static_context,
+        minify=minify,
+    )
     return template.render()
+
+
+def render_kdl_to(
+    source: str,
+    write: Callable[[str], Any],
+    format_output: bool = True,
+    indent: str = "    ",
+) -> int:
+    """Render KDL source to HTML while it is parsed, fragment by fragment.
+
+    The source is read by the pure-Python event parser
+    (`kdl_events.parse_events`) and each fragment is written as soon as the
+    events allow, so neither a parse tree nor the whole output is held:
+    besides the source and its tokens, memory is bounded by nesting depth.
+    The output is the same as `render_kdl` gives. Nothing is cached.
+
+    Args:
+        source: KDL markup as string
+        write: Callable receiving each HTML fragment, e.g. the `write`
+            method of a text file
+        format_output: Whether to format the output with indentation
+        indent: Indentation used for each nesting level
+
+    Returns:
+        Number of nodes converted, including descendants
+
+    Raises:
+        KdlParseError: If the source is not valid KDL, possibly after part
+            of the output was written
+    """
+    cleaned_kdl, token_map, _ = _processor.scan(source)
+    converter = _shared_converter(format_output, indent)
+    if token_map:
+        restore = _processor.restore_jinja
+        # placeholders are never split across fragments
+        return converter.convert_events_to(
+            parse_events(cleaned_kdl), lambda html: write(restore(html, token_map))
+        )
+    return converter.convert_events_to(parse_events(cleaned_kdl), write)
+
+
+def _compile_in_worker(task: Tuple[str, bool, str]) -> CompiledTemplate:
+    # runs in a worker process, whose caches would only be thrown away
+    source, format_output, indent = task
+    template = KdlTemplate(
+        source, format_output=format_output, indent=indent, use_cache=False
+    )
+    return CompiledTemplate(template.output, template.token_map)
+
+
+def render_many(
+    sources: Iterable[str],
+    workers: Optional[int] = None,
+    executor: str = "thread",
+    format_output: bool = True,
+    indent: str = "    ",
+    use_cache: bool = True,
+) -> List[str]:
+    """Render several KDL sources concurrently.
+
+    Compiling holds no state outside the call, so with `executor="thread"`
+    the sources are rendered by `render_kdl` in a thread pool. That only runs
+    in parallel on a free-threaded Python; with the GIL, `"process"` compiles
+    in a process pool instead. Worker processes don't use the compile
+    caches, but the results are added to this process's memory cache.
+
+    Args:
+        sources: KDL markup strings
+        workers: Number of workers, defaults to the number of CPUs
+        executor: "thread" or "process"
+        format_output: Whether to format the output with indentation
+        indent: Indentation used for each nesting level
+        use_cache: Whether to use the compile caches
+
+    Returns:
+        HTML strings in the order of `sources`
+
+    Raises:
+        ValueError: If `executor` is not "thread" or "process"
+    """
+    if executor not in ("thread", "process"):
+        raise ValueError(f"executor must be 'thread' or 'process', not {executor!r}")
+    sources = list(sources)
+    # the same source is compiled once
+    unique = list(dict.fromkeys(sources))
+    workers = max(1, min(workers or os.cpu_count() or 1, len(unique)))
+    render = partial(
+        render_kdl, format_output=format_output, indent=indent, use_cache=use_cache
+    )
+
+    if workers == 1:
+        rendered = [render(source) for source in unique]
+    elif executor == "thread":
+        with ThreadPoolExecutor(workers, thread_name_prefix="cuteninja") as pool:
+            rendered = list(pool.map(render, unique))
+    else:
+        cache = get_compile_cache() if use_cache else None
+        outputs: Dict[str, str] = {}
+        missing: List[str] = []
+        for source in unique:
+            cached = None
+            if cache is not None:
+                cached = cache.get(make_key(source, format_output, indent))
+            if cached is None:
+                missing.append(source)
+            else:
+                outputs[source] = cached.output
+
+        if missing:
+            tasks = [(source, format_output, indent) for source in missing]
+            with ProcessPoolExecutor(min(workers, len(missing))) as pool:
+                chunksize = max(1, len(tasks) // (workers * 4))
+                built = pool.map(_compile_in_worker, tasks, chunksize=chunksize)
+                for source, compiled in zip(missing, built):
+                    if cache is not None:
+                        cache.set(make_key(source, format_output, indent), compiled)
+                    outputs[source] = compiled.output
+        rendered = [outputs[source] for source in unique]
+
+    by_source = dict(zip(unique, rendered))
+    return [by_source[source] for source in sources]
@@ -0,0 +1,326 @@
+import re
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from .jinja_processor import JinjaProcessor, _is_standalone
+
+SourceLoader = Callable[[str], Optional[str]]
+Token = Tuple[int, int, str]
+
+_INCLUDE = re.compile(
+    r"""\{%\s*include\s+(["'])([^"'\\]+)\1(?:\s+with\s+context)?\s*%\}"""
+)
+_EXTENDS = re.compile(r"""\{%\s*extends\s+(["'])([^"'\\]+)\1\s*%\}""")
+_BLOCK = re.compile(r"\{%[-+]?\s*block\s+(\w+)")
+_ENDBLOCK = re.compile(r"\{%[-+]?\s*endblock\b")
+_RAW = re.compile(r"\{%[-+]?\s*raw\s*[-+]?%\}")
+_ENDRAW = re.compile(r"\{%[-+]?\s*endraw\s*[-+]?%\}")
+# tags whose names would leak out of an inlined template
+_ASSIGNMENT = re.compile(r"\{%[-+]?\s*(?:set|macro|import|from)\b")
+# a child calling into the block machinery has to stay a child
+_BLOCK_REFERENCE = re.compile(r"\bsuper\s*\(|\bself\s*\.")
+_COMMENT = re.compile(r"\{#.*?#\}", re.DOTALL)
+
+
+class DependencyGraph:
+    """Tracks which templates include, extend or import which others."""
+
+    def __init__(self) -> None:
+        self._dependencies: Dict[str, Set[str]] = {}
+        self._dependents: Dict[str, Set[str]] = {}
+
+    def set_dependencies(self, source: str, dependencies: Iterable[str]) -> None:
+        """Replace the recorded dependencies of a template.
+
+        Args:
+            source: Template that references the others
+            dependencies: Templates referenced by `source`
+        """
+        self.remove(source)
+        deps = set(dependencies)
+        self._dependencies[source] = deps
+        for dep in deps:
+            self._dependents.setdefault(dep, set()).add(source)
+
+    def remove(self, source: str) -> None:
+        """Forget the dependencies of a template.
+
+        Args:
+            source: Template to forget
+        """
+        for dep in self._dependencies.pop(source, ()):
+            dependents = self._dependents.get(dep)
+            if dependents is not None:
+                dependents.discard(source)
+                if not dependents:
+                    del self._dependents[dep]
+
+    def dependencies(self, source: str) -> Set[str]:
+        """Get the templates a template references directly.
+
+        Args:
+            source: Template name
+
+        Returns:
+            Set of referenced template names
+        """
+        return set(self._dependencies.get(source, ()))
+
+    def affected(self, changed: Iterable[str]) -> Set[str]:
+        """Get the changed templates plus everything that depends on them.
+
+        Args:
+            changed: Templates that changed
+
+        Returns:
+            The changed templates and their transitive dependents
+        """
+        result: Set[str] = set()
+        stack = list(changed)
+        while stack:
+            name = stack.pop()
+            if name in result:
+                continue
+            result.add(name)
+            stack.extend(self._dependents.get(name, ()))
+        return result
+
+
+class Flattened(NamedTuple):
+    """KDL source with literal includes and layouts inlined, as returned by `flatten`."""
+
+    source: str
+    # names of the inlined templates, in order of first use
+    dependencies: List[str]
+
+
+class _Block:
+    __slots__ = (
+        "name",
+        "start",
+        "body_start",
+        "body_end",
+        "end",
+        "standalone",
+        "children",
+    )
+
+    def __init__(self, name: str, start: int, body_start: int, standalone: bool):
+        self.name = name
+        self.start = start
+        self.body_start = body_start
+        self.body_end = body_start
+        self.end = body_start
+        self.standalone = standalone
+        self.children: List["_Block"] = []
+
+
+class _Flattener:
+    def __init__(self, load: SourceLoader, name: Optional[str]) -> None:
+        self.load = load
+        self.processor = JinjaProcessor()
+        self.sources: Dict[str, Optional[str]] = {}
+        self.dependencies: Dict[str, None] = {}
+        self.stack: List[str] = [name] if name is not None else []
+
+    def tokens(self, source: str) -> List[Token]:
+        extraction = self.processor.scan(source)
+        tokens: List[Token] = []
+        in_raw = False
+        for (start, end), token in zip(
+            extraction.offsets, extraction.token_map.values()
+        ):
+            # tokens inside raw blocks are only text
+            if in_raw:
+                in_raw = _ENDRAW.fullmatch(token) is None
+            elif _RAW.fullmatch(token) is not None:
+                in_raw = True
+            else:
+                tokens.append((start, end, token))
+        return tokens
+
+    def expand(self, name: str) -> Optional[str]:
+        # a template including itself recurses at render time, leave it to Jinja
+        if name in self.stack:
+            return None
+        if name not in self.sources:
+            self.sources[name] = self.load(name)
+        source = self.sources[name]
+        if source is None:
+            return None
+
+        self.dependencies[name] = None
+        self.stack.append(name)
+        try:
+            return self.flatten(source)
+        finally:
+            self.stack.pop()
+
+    def flatten(self, source: str) -> str:
+        return self.inline_layout(self.inline_includes(source))
+
+    def inline_includes(self, source: str) -> str:
+        parts: List[str] = []
+        last = 0
+        for start, end, token in self.tokens(source):
+            match = _INCLUDE.fullmatch(token)
+            if match is None or not _is_standalone(source, start, end):
+                continue
+            included = self.expand(match.group(2))
+            # its blocks would become the includer's, for children to override
+            if included is None or _BLOCK.search(included):
+                continue
+            included = included.strip()
+            if _ASSIGNMENT.search(included):
+                # an included template gets a scope of its own
+                included = f"{{% with %}}\n{included}\n{{% endwith %}}"
+            parts.append(source[last:start])
+            parts.append(included)
+            last = end
+        if not parts:
+            return source
+        parts.append(source[last:])
+        return "".join(parts)
+
+    def inline_layout(self, source: str) -> str:
+        tokens = self.tokens(source)
+        if not tokens:
+            return source
+        start, end, token = tokens[0]
+        match = _EXTENDS.fullmatch(token)
+        if match is None or not _is_blank(source[:start]):
+            return source
+        overrides = self.child_blocks(source, end, tokens[1:])
+        if overrides is None:
+            return source
+        base = self.expand(match.group(2))
+        if base is None:
+            return source
+        blocks = _parse_blocks(base, self.tokens(base))
+        if blocks is None:
+            return source
+
+        parts: List[str] = []
+        if not _merge(base, 0, len(base), blocks[0], source, overrides, parts):
+            return source
+        return "".join(parts)
+
+    def child_blocks(
+        self, source: str, start: int, tokens: List[Token]
+    ) -> Optional[Dict[str, _Block]]:
+        if any(_BLOCK_REFERENCE.search(token) for _, _, token in tokens):
+            return None
+        blocks = _parse_blocks(source, tokens)
+        if blocks is None:
+            return None
+        top, by_name = blocks
+
+        # everything outside the blocks must be something Jinja ignores anyway
+        outside: List[str] = []
+        for block in top:
+            outside.append(source[start : block.start])
+            start = block.end
+        outside.append(source[start:])
+        if not _is_blank(_COMMENT.sub("", "".join(outside))):
+            return None
+        return by_name
+
+
+def _is_blank(text: str) -> bool:
+    # nothing but whitespace and KDL line comments
+    return all(
+        not line.strip() or line.lstrip().startswith("//") for line in text.split("\n")
+    )
+
+
+def _parse_blocks(
+    source: str, tokens: List[Token]
+) -> Optional[Tuple[List[_Block], Dict[str, _Block]]]:
+    top: List[_Block] = []
+    by_name: Dict[str, _Block] = {}
+    stack: List[_Block] = []
+    for start, end, token in tokens:
+        match = _BLOCK.match(token)
+        if match is not None:
+            name = match.group(1)
+            if name in by_name:
+                return None
+            block = _Block(name, start, end, _is_standalone(source, start, end))
+            by_name[name] = block
+            (stack[-1].children if stack else top).append(block)
+            stack.append(block)
+        elif _ENDBLOCK.match(token) is not None:
+            if not stack:
+                return None
+            block = stack.pop()
+            block.body_end = start
+            block.end = end
+            block.standalone = block.standalone and _is_standalone(source, start, end)
+    if stack:
+        return None
+    return top, by_name
+
+
+def _merge(
+    base: str,
+    start: int,
+    stop: int,
+    blocks: List[_Block],
+    child: str,
+    overrides: Dict[str, _Block],
+    parts: List[str],
+) -> bool:
+    for block in blocks:
+        override = overrides.get(block.name)
+        if override is None:
+            parts.append(base[start : block.body_start])
+            if not _merge(
+                base,
+                block.body_start,
+                block.body_end,
+                block.children,
+                child,
+                overrides,
+                parts,
+            ):
+                return False
+        elif block.standalone and override.standalone:
+            # the child's tag, it may be scoped where the base's is not
+            parts.append(base[start : block.start])
+            parts.append(child[override.start : override.body_end])
+        else:
+            # KDL can only be swapped when the tags have lines of their own
+            return False
+        start = block.body_end
+    parts.append(base[start:stop])
+    return True
+
+
+def flatten(source: str, load: SourceLoader, name: Optional[str] = None) -> Flattened:
+    """Inline the templates a KDL source includes or extends by literal name.
+
+    A `{% include "name" %}` alone on its line is replaced by the KDL of the
+    included template, wrapped in `{% with %}` when the template assigns
+    names. A template starting with `{% extends "name" %}` and holding
+    nothing but blocks is replaced by its layout with the blocks filled in.
+    Both work recursively. Block tags are kept, so the result renders like
+    the original and can still be extended.
+
+    Anything that cannot be inlined without changing what renders is left
+    for Jinja: names that `load` does not know, tags with `ignore missing`,
+    `without context` or whitespace control, includes inside a line,
+    children calling `super()` or `self`, and recursive includes.
+
+    Args:
+        source: KDL source with Jinja syntax
+        load: Returns the KDL source of a template name, None when it is
+            not a KDL template that can be inlined
+        name: Name of `source`, to stop it from inlining itself
+
+    Returns:
+        The flattened KDL and the names of the templates that went into it
+    """
+    flattener = _Flattener(load, name)
+    return Flattened(flattener.flatten(source), list(flattener.dependencies))
+
+
+__all__ = ["DependencyGraph", "Flattened", "flatten"]
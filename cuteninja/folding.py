@@ -0,0 +1,290 @@
+import ast
+import re
+from typing import Any, Dict, List, Mapping, Optional, Set, Tuple
+
+from .jinja_processor import PLACEHOLDER_PREFIX, _placeholder_pattern
+
+_PATH = r"[A-Za-z_]\w*(?:\.[A-Za-z_]\w*)*"
+_LITERAL = r"'[^'\\]*'|\"[^\"\\]*\"|-?\d+(?:\.\d+)?|true|false|none|True|False|None"
+_EXPRESSION = re.compile(rf"\{{\{{\s*({_PATH})\s*\}}\}}")
+_CONDITION = re.compile(rf"(not\s+)?({_PATH})(?:\s*(==|!=)\s*({_LITERAL}))?")
+_TAG = re.compile(
+    r"\{%([-+]?)\s*(if|elif|else|endif|for|endfor|raw|endraw)\b(.*?)([-+]?)%\}",
+    re.DOTALL,
+)
+_BLOCK = re.compile(r"\{%[-+]?\s*block\b")
+# tags that can bind a name at render time, with the part naming the targets
+_BINDING = re.compile(
+    r"\{%[-+]?\s*(?:for\s+(.*?)\s+in\b|set\s+([^=]*?)\s*(?:=|[-+]?%\})"
+    r"|(?:with|macro|call|import|from)\b(.*?)[-+]?%\})",
+    re.DOTALL,
+)
+_NAME = re.compile(r"[A-Za-z_]\w*")
+_JINJA_SYNTAX = re.compile(r"\{[{%#]")
+_SCALARS = (str, int, float, bool, type(None))
+_ESCAPES = str.maketrans(
+    {"&": "&amp;", "<": "&lt;", ">": "&gt;", '"': "&#34;", "'": "&#39;"}
+)
+_MISSING = object()
+
+Span = Tuple[int, int]
+
+
+def _resolve(path: str, context: Mapping[str, Any]) -> Any:
+    """Look up `a.b.c` the way Jinja does: attribute first, then item."""
+    names = path.split(".")
+    value = context.get(names[0], _MISSING)
+    for name in names[1:]:
+        if value is _MISSING:
+            break
+        try:
+            value = getattr(value, name)
+        except AttributeError:
+            try:
+                value = value[name]
+            except (TypeError, LookupError):
+                return _MISSING
+    # methods would have to be called, that is not a constant any more
+    if callable(value):
+        return _MISSING
+    return value
+
+
+def _literal(value: Any) -> Optional[str]:
+    """Render a value like Jinja with autoescaping, None if it is not simple."""
+    if hasattr(value, "__html__"):
+        text = str(value.__html__())
+    elif isinstance(value, _SCALARS):
+        text = str(value).translate(_ESCAPES)
+    else:
+        return None
+    # Jinja would parse it as syntax once it is part of the template
+    if _JINJA_SYNTAX.search(text) or PLACEHOLDER_PREFIX in text:
+        return None
+    return text
+
+
+def _condition(expression: str, context: Mapping[str, Any]) -> Optional[bool]:
+    """Evaluate a condition if it only depends on the context, else None."""
+    match = _CONDITION.fullmatch(expression.strip())
+    if match is None:
+        return None
+    negate, path, operator, literal = match.groups()
+    value = _resolve(path, context)
+    if value is _MISSING:
+        return None
+    if operator is None:
+        result = bool(value)
+    else:
+        literal = {"true": "True", "false": "False", "none": "None"}.get(
+            literal, literal
+        )
+        equal = value == ast.literal_eval(literal)
+        result = equal if operator == "==" else not equal
+    return not result if negate else result
+
+
+def _bound_names(tokens: List[str]) -> Set[str]:
+    """Names a template may assign itself; their static values can't be trusted."""
+    names: Set[str] = set()
+    for token in tokens:
+        match = _BINDING.match(token)
+        if match is not None:
+            for group in match.groups():
+                if group:
+                    names.update(_NAME.findall(group))
+    return names
+
+
+def _fold_chain(
+    chain: List[Tuple[int, str, str]],
+    tokens: List[str],
+    spans: List[Span],
+    context: Mapping[str, Any],
+    removed: List[Span],
+    rewritten: Dict[int, str],
+) -> None:
+    """Fold one if/elif/else/endif chain given as (index, tag, expression)."""
+    conditions = [
+        None if tag == "else" else _condition(expression, context)
+        for _, tag, expression in chain[:-1]
+    ]
+    if all(value is None for value in conditions):
+        return
+
+    # the branches that can still be taken, and whether they always are
+    kept: List[Tuple[int, bool]] = []
+    for position, value in enumerate(conditions):
+        if value is True or chain[position][1] == "else":
+            kept.append((position, True))
+            break
+        if value is None:
+            kept.append((position, False))
+
+    positions = {position for position, _ in kept}
+    dropped = [p for p in range(len(conditions)) if p not in positions]
+    for position in dropped:
+        # a dropped branch must not take a block definition with it
+        first, last = chain[position][0], chain[position + 1][0]
+        if any(_BLOCK.match(tokens[i]) for i in range(first + 1, last)):
+            return
+
+    for position in dropped:
+        removed.append((spans[chain[position][0]][0], spans[chain[position + 1][0]][0]))
+    if not kept or kept[0][1]:
+        # at most one branch is left and it is always taken, unwrap it
+        for position, _ in kept:
+            removed.append(spans[chain[position][0]])
+        removed.append(spans[chain[-1][0]])
+        return
+    for number, (position, unconditional) in enumerate(kept):
+        index, tag, expression = chain[position]
+        if unconditional and tag != "else":
+            rewritten[index] = "{% else %}"
+        elif number == 0 and tag == "elif":
+            rewritten[index] = f"{{% if {expression.strip()} %}}"
+
+
+def _merge_spans(spans: List[Span]) -> List[Span]:
+    merged: List[Span] = []
+    for start, end in sorted(spans):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _line_span(html: str, start: int, end: int) -> Span:
+    """Widen a removed span to whole lines if nothing else is on them."""
+    line_start = html.rfind("\n", 0, start) + 1
+    line_end = html.find("\n", end)
+    if line_end < 0:
+        line_end = len(html)
+    if html[line_start:start].isspace() or line_start == start:
+        if line_end == end or html[end:line_end].isspace():
+            return line_start, min(line_end + 1, len(html))
+    return start, end
+
+
+def fold_static(
+    html: str,
+    token_map: Dict[str, str],
+    static_context: Mapping[str, Any],
+    restore: bool = True,
+) -> Tuple[str, Dict[str, str], Tuple[str, ...]]:
+    """Restore Jinja tokens in HTML, evaluating what the static context decides.
+
+    `{{ name }}` and `{{ a.b }}` with a string, number, boolean or None in
+    `static_context` become their escaped value, as Jinja renders them with
+    autoescaping; values with `__html__` are inserted as they are. `{% if %}`
+    and `{% elif %}` conditions of the form `[not] name [== literal]` that
+    the context decides drop the branches not taken and unwrap the one that
+    is. Names the template assigns itself, tags with whitespace control and
+    anything inside `{% raw %}` are left alone.
+
+    Args:
+        html: HTML with placeholders
+        token_map: Mapping of placeholders to Jinja tokens
+        static_context: Values that are the same for every render
+        restore: Whether to restore the tokens left, or keep their placeholders
+
+    Returns:
+        The HTML with Jinja syntax restored or folded, the tokens left in it
+        by placeholder and the tokens folded away, in order
+    """
+    if not token_map:
+        return html, token_map, ()
+
+    first = next(iter(token_map))
+    prefix = first[: first.rindex("_", 0, len(first) - 2) + 1]
+    placeholders: List[str] = []
+    spans: List[Span] = []
+    for match in _placeholder_pattern(prefix).finditer(html):
+        if match.group() in token_map:
+            placeholders.append(match.group())
+            spans.append(match.span())
+    tokens = [token_map[placeholder] for placeholder in placeholders]
+
+    bound = _bound_names(tokens)
+    context = {
+        name: value for name, value in static_context.items() if name not in bound
+    }
+
+    literals: Dict[int, str] = {}
+    removed: List[Span] = []
+    rewritten: Dict[int, str] = {}
+    # open if and for tags, None for a for loop whose else is not ours
+    stack: List[Optional[List[Tuple[int, str, str]]]] = []
+    controlled: Set[int] = set()
+    in_raw = False
+    for index, token in enumerate(tokens):
+        match = _TAG.fullmatch(token)
+        if in_raw:
+            in_raw = match is None or match.group(2) != "endraw"
+            continue
+        if match is None:
+            expression = _EXPRESSION.fullmatch(token)
+            if expression is not None:
+                value = _resolve(expression.group(1), context)
+                literal = None if value is _MISSING else _literal(value)
+                if literal is not None:
+                    literals[index] = literal
+            continue
+
+        before, tag, expression, after = match.groups()
+        if before or after:
+            controlled.add(index)
+        if tag == "raw":
+            in_raw = True
+        elif tag == "if":
+            stack.append([(index, tag, expression)])
+        elif tag == "for":
+            stack.append(None)
+        elif tag in ("elif", "else"):
+            if stack and stack[-1] is not None:
+                stack[-1].append((index, tag, expression))
+        elif stack:
+            chain = stack.pop()
+            if chain is not None and tag == "endif":
+                chain.append((index, tag, expression))
+                if not any(i in controlled for i, _, _ in chain):
+                    _fold_chain(chain, tokens, spans, context, removed, rewritten)
+
+    # drop the lines the removed spans leave empty
+    merged = _merge_spans(removed)
+    merged = _merge_spans([_line_span(html, start, end) for start, end in merged])
+
+    parts: List[str] = []
+    remaining: Dict[str, str] = {}
+    position = 0
+    next_removed = 0
+    for index, (start, end) in enumerate(spans):
+        while next_removed < len(merged) and merged[next_removed][1] <= start:
+            parts.append(html[position : merged[next_removed][0]])
+            position = merged[next_removed][1]
+            next_removed += 1
+        if next_removed < len(merged) and merged[next_removed][0] <= start:
+            continue
+        parts.append(html[position:start])
+        position = end
+        if index in literals:
+            parts.append(literals[index])
+        else:
+            token = rewritten.get(index, tokens[index])
+            remaining[placeholders[index]] = token
+            parts.append(token if restore else placeholders[index])
+    for removed_start, removed_end in merged[next_removed:]:
+        parts.append(html[position:removed_start])
+        position = removed_end
+    parts.append(html[position:])
+
+    folded = tuple(
+        token
+        for placeholder, token in token_map.items()
+        if placeholder not in remaining
+    )
+    return "".join(parts), remaining, folded
+
+
+__all__ = ["fold_static"]
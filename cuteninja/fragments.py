@@ -0,0 +1,219 @@
+import re
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Dict,
+    List,
+    Mapping,
+    NamedTuple,
+    Optional,
+    Tuple,
+)
+
+from .folding import fold_static
+from .jinja_processor import JinjaProcessor, _placeholder_pattern
+
+if TYPE_CHECKING:
+    from jinja2 import Environment, Template
+
+_processor = JinjaProcessor()
+_TAG = re.compile(r"\{%[-+]?\s*(\w+)(.*?)[-+]?%\}", re.DOTALL)
+# blocks a fragment inside them is wrapped in
+_WRAPPING = {"if", "for", "with", "filter", "autoescape", "raw"}
+# definitions kept whole when they come before a fragment
+_DEFINITIONS = {"macro", "set"}
+# blocks a fragment can't be taken out of
+_ENCLOSING = {"call", "trans", *_DEFINITIONS}
+# single tags binding names for what follows
+_ASSIGNMENTS = {"set", "import", "from"}
+
+
+class Fragment(NamedTuple):
+    """One element of a template that renders on its own, see `KdlTemplate.fragment`."""
+
+    name: str
+    output: str
+    # tokens in `output` by placeholder, the enclosing tags included
+    token_map: Dict[str, str]
+    # opening tags of the for/if/with blocks around the element, outermost first
+    scopes: Tuple[str, ...]
+
+    def to_jinja(self, environment: Optional["Environment"] = None) -> "Template":
+        """Compile the output to a Jinja template, memoized per environment.
+
+        Args:
+            environment: Environment to compile in
+
+        Returns:
+            Ready to render jinja2.Template
+        """
+        from .jinja_templates import html_to_jinja
+
+        return html_to_jinja(self.output, environment)
+
+
+class _Scope:
+    __slots__ = ("kind", "items", "keeps")
+
+    def __init__(self, kind: str, items: List[str]) -> None:
+        self.kind = kind
+        # placeholders, and HTML with placeholders, a fragment inside needs
+        self.items = items
+        # whether the items bind names that outlive the block
+        self.keeps = False
+
+
+class _ScopeTracker:
+    """Follows the block structure of the tokens up to a fragment."""
+
+    def __init__(self, html: str) -> None:
+        self.html = html
+        self.stack: List[_Scope] = [_Scope("", [])]
+        self.in_raw = False
+        self.broken = False
+
+    def feed(self, placeholder: str, token: str) -> None:
+        match = _TAG.fullmatch(token)
+        if self.broken or match is None:
+            return
+        tag, rest = match.groups()
+        top = self.stack[-1]
+        if self.in_raw:
+            if tag == "endraw":
+                self.in_raw = False
+                self.stack.pop()
+            return
+
+        if tag.startswith("end"):
+            if top.kind != tag[3:] or len(self.stack) == 1:
+                self.broken = True
+                return
+            self.stack.pop()
+            parent = self.stack[-1]
+            if top.kind in _DEFINITIONS:
+                # the whole definition, body included
+                start = self.html.find(top.items[0])
+                end = self.html.find(placeholder, start)
+                if start < 0 or end < 0:
+                    self.broken = True
+                    return
+                parent.items.append(self.html[start : end + len(placeholder)])
+                parent.keeps = True
+            elif top.kind == "if" and top.keeps:
+                # assignments in a conditional are visible after it
+                parent.items.extend(top.items)
+                parent.items.append(placeholder)
+                parent.keeps = True
+            # anything else bound inside a closed block stays in there
+        elif tag in ("elif", "else"):
+            top.items.append(placeholder)
+        elif tag in _ASSIGNMENTS and (tag != "set" or "=" in rest):
+            top.items.append(placeholder)
+            top.keeps = True
+        elif tag in _WRAPPING or tag in _ENCLOSING or tag == "block":
+            # including {% set name %}, the block form
+            self.stack.append(_Scope(tag, [placeholder]))
+            self.in_raw = tag == "raw"
+
+    def scopes(self) -> Optional[Tuple[List[str], List[str], List[str]]]:
+        """Get what goes around a fragment here, None if it can't stand alone."""
+        if self.broken:
+            return None
+        before: List[str] = []
+        closers: List[str] = []
+        openers: List[str] = []
+        for scope in self.stack[1:]:
+            if scope.kind in _ENCLOSING:
+                return None
+            if scope.kind == "block":
+                # only the names bound inside it so far
+                before.extend(scope.items[1:])
+                continue
+            before.extend(scope.items)
+            closers.append(f"{{% end{scope.kind} %}}")
+            openers.append(scope.items[0])
+        before = self.stack[0].items + before
+        return before, closers[::-1], openers
+
+
+def make_fragments(
+    marked: Mapping[str, Tuple[str, int]],
+    html: str,
+    token_map: Dict[str, str],
+    static_context: Optional[Mapping[str, Any]] = None,
+) -> Dict[str, Fragment]:
+    """Make standalone templates of the elements found by `convert_fragments`.
+
+    Each element is put inside the `for`, `if`, `with`, `filter`,
+    `autoescape` and `raw` blocks around it in the template, keeping only
+    the tags of their branches, and after the `set`, `import`, `from` and
+    `macro` tags it can see. Conditionals before it are kept for the names
+    they assign. Elements inside a macro, call, `{% set %}` or `trans`
+    block render nothing on their own and are left out, and so is
+    everything when the tags can't be matched up.
+
+    Args:
+        marked: Element HTML with placeholders and the number of tokens
+            before it, by name
+        html: The whole document's HTML with placeholders
+        token_map: Mapping of placeholders to Jinja tokens, in source order
+        static_context: Values to evaluate at compile time, see
+            `folding.fold_static`
+
+    Returns:
+        Fragments by name
+    """
+    placeholders = list(token_map)
+    tokens = list(token_map.values())
+    prefix = ""
+    if placeholders:
+        first = placeholders[0]
+        prefix = first[: first.rindex("_", 0, len(first) - 2) + 1]
+
+    fragments: Dict[str, Fragment] = {}
+    tracker = _ScopeTracker(html)
+    fed = 0
+    for name, (element, position) in sorted(marked.items(), key=lambda i: i[1][1]):
+        while fed < position:
+            tracker.feed(placeholders[fed], tokens[fed])
+            fed += 1
+        scopes = tracker.scopes()
+        if scopes is None:
+            continue
+        before, closers, openers = scopes
+
+        # closing tags are not tokens of the template, number them after those
+        closing = {
+            f"{prefix}{number}__": closer
+            for number, closer in enumerate(closers, len(placeholders))
+        }
+        after = list(closing)
+        source = "".join([*before, element, *after])
+        used = (
+            {m.group(): None for m in _placeholder_pattern(prefix).finditer(source)}
+            if prefix
+            else {}
+        )
+        fragment_map = {
+            placeholder: (
+                token_map[placeholder]
+                if placeholder in token_map
+                else closing[placeholder]
+            )
+            for placeholder in used
+        }
+
+        if static_context is None:
+            output = _processor.restore_jinja(source, fragment_map)
+        else:
+            output, fragment_map, _ = fold_static(source, fragment_map, static_context)
+        fragments[name] = Fragment(
+            name,
+            output,
+            fragment_map,
+            tuple(token_map[opener] for opener in openers),
+        )
+    return fragments
+
+
+__all__ = ["Fragment", "make_fragments"]
@@ -0,0 +1,555 @@
+import re
+from bisect import bisect_left, bisect_right
+from time import perf_counter
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from .instrumentation import CompileMetrics
+from .jinja_processor import (
+    _RAW_BOUNDARY,
+    _WELL_FORMED_TOKEN,
+    JinjaProcessor,
+    _placeholder_prefix,
+)
+from .kdl_converter import KdlToHtmlConverter
+from .kdl_events import ARGS, END, START, KdlParseError, _Parser
+
+# source characters compiled together, unless one node is longer
+CHUNK_SIZE = 2048
+
+_processor = JinjaProcessor()
+# elements nested deeper are not split, which keeps building within the recursion limit
+_DEEPEST_SPLIT = 64
+# the rest of the lines of a "{" and a "}" around children on lines of their own
+_AFTER_OPEN = re.compile(r"[^\S\n]*(?://[^\n]*)?\n")
+_AFTER_CLOSE = re.compile(r"[^\S\n]*;?[^\S\n]*(?://[^\n]*)?(?:\n|\Z)")
+# the start of a token, where the scanner found none
+_JINJA_OPENER = re.compile(r"\{[{%#]")
+# a "\" going on with the next line, at the end of the text
+_CONTINUED = re.compile(r"\\[^\S\n]*(?://[^\n]*)?\n\Z")
+
+
+class _Stale(Exception):
+    """The edited source can't be compiled in the pieces it was before."""
+
+
+class _Span(NamedTuple):
+    name: str
+    start: int
+    end: int
+    # positions of the "{" and "}" around the children
+    block: Optional[Tuple[int, int]]
+    children: List["_Span"]
+
+
+class _Head(NamedTuple):
+    length: int
+    tokens: List[str]
+    start: str  # the start tag and the arguments
+    empty: str  # the element without children
+    closer: str
+
+
+class _Unit:
+    """Whole lines of source holding whole nodes, compiled together.
+
+    A unit is either a group of nodes converted as they are, or a single
+    element with its children on lines of their own, whose children are
+    units again.
+    """
+
+    __slots__ = (
+        "length",
+        "tokens",
+        "count",
+        "html",
+        "lined",
+        "elements",
+        "head",
+        "children",
+        "tail",
+    )
+
+    length: int
+    tokens: List[str]  # of a group, those of an element are in its parts
+    count: int  # number of nodes at the unit's level
+    html: str  # of a group, that of an element is written by _write
+    # the HTML with a newline before each node but text, see _has_element_children
+    lined: str
+    elements: bool  # whether a node is not a doctype
+    head: Optional[_Head]
+    children: List["_Unit"]
+    tail: Tuple[int, List[str]]
+
+
+def _common_prefix(a: str, b: str) -> int:
+    # each comparison copies half as much as the one before
+    low, high = 0, min(len(a), len(b))
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a.startswith(b[low:middle], low):
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def _common_suffix(a: str, b: str, limit: int) -> int:
+    low, high = 0, limit
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a.endswith(b[len(b) - middle : len(b) - low], 0, len(a) - low):
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def _spans(masked: str) -> List[_Span]:
+    """Find where the nodes of KDL are, Jinja tokens masked out."""
+    parser = _Parser(masked)
+    spans: List[_Span] = []
+    # per open node: name, start, position of "{" and children
+    stack: List[List] = []
+    for kind, value in parser.events():
+        if kind == START:
+            stack.append([value, parser.node_start, None, []])
+        elif kind == ARGS:
+            if parser.startswith("{"):
+                stack[-1][2] = parser.position
+        elif kind == END:
+            name, start, brace, children = stack.pop()
+            end = parser.position
+            block = None if brace is None else (brace, end - 1)
+            (stack[-1][3] if stack else spans).append(
+                _Span(name, start, end, block, children)
+            )
+    return spans
+
+
+class IncrementalDocument:
+    """A template's output kept in pieces, so an edit only recompiles its part.
+
+    The source is split into units of whole lines holding whole nodes.
+    Elements longer than `CHUNK_SIZE` whose children have lines of their own
+    are split into their children, recursively, and other nodes are grouped
+    into units of about `CHUNK_SIZE` characters. Every unit is extracted,
+    parsed and converted on its own, which gives the same HTML and tokens as
+    compiling the whole source does, as no Jinja token and no KDL construct
+    crosses the lines between units.
+
+    `update` compares an edited source with the last one, descends into the
+    elements whose children hold the whole edit, and compiles the units it
+    touched again, or else their parent, and so on. The HTML of the other
+    units is reused, and the tokens are numbered again in source order.
+    """
+
+    source: str
+    converter: KdlToHtmlConverter
+    output: str
+    tokens: List[str]
+    metrics: Optional[CompileMetrics]
+
+    def __init__(self, source: str, converter: KdlToHtmlConverter) -> None:
+        """Compile a source in units.
+
+        Args:
+            source: KDL source with Jinja syntax
+            converter: Converter to use; minifying is not supported
+
+        Raises:
+            ValueError: If the source can't be compiled in units, e.g. when
+                it has `{% raw %}` blocks, Jinja the units can't be told
+                apart in, or invalid KDL
+        """
+        if converter.minify:
+            raise ValueError("minified output can't be compiled in units")
+        self.converter = converter
+        self.metrics = None
+        self._phases = [0.0, 0.0, 0.0, 0.0]
+        self._nodes = 0
+        self._names: List[str] = []
+        if _RAW_BOUNDARY.search(source) is not None:
+            raise ValueError("sources with raw blocks can't be compiled in units")
+        from .kdl_bindings import BACKEND
+
+        # ckdl parses a document as KDL 2 or else as KDL 1, never as a mix of
+        # both, so every unit is parsed as the version the first build took
+        for version in (2, 1) if BACKEND == "ckdl" else ("any",):
+            self._version = version
+            try:
+                self._units = self._build(source, 0, len(source), 0)
+                break
+            except (_Stale, KdlParseError, ValueError) as e:
+                error = e
+        else:
+            raise ValueError(f"the source can't be compiled in units: {error}")
+        self._finish(source)
+
+    @property
+    def token_map(self) -> Dict[str, str]:
+        """Mapping of placeholders to tokens, as `JinjaProcessor.scan` gives it."""
+        prefix = _placeholder_prefix(self.source)
+        names = self._names
+        if not names or not names[0].startswith(prefix):
+            names.clear()
+        # the placeholders stay the same from one update to the next
+        names.extend(
+            f"{prefix}{number}__" for number in range(len(names), len(self.tokens))
+        )
+        return dict(zip(names, self.tokens))
+
+    def update(self, source: str) -> bool:
+        """Compile an edited source again, reusing the units the edit left alone.
+
+        Args:
+            source: The edited source
+
+        Returns:
+            Whether the source was compiled; if not, e.g. when the edit
+            makes the KDL invalid, changes its version or brings in a
+            `{% raw %}` block, the document is left as it was and should be
+            compiled from scratch
+        """
+        old = self.source
+        self._phases = [0.0, 0.0, 0.0, 0.0]
+        self._nodes = 0
+        prefix = _common_prefix(old, source)
+        suffix = _common_suffix(old, source, min(len(old), len(source)) - prefix)
+        changed_end = len(old) - suffix
+        delta = len(source) - len(old)
+        # the last source had no raw block, so a new one starts by the edit
+        start = source.rfind("{%", 0, prefix + 2)
+        if start < 0:
+            start = source.find("{%", prefix)
+        while 0 <= start <= changed_end + delta:
+            if _RAW_BOUNDARY.match(source, start) is not None:
+                return False
+            start = source.find("{%", start + 1)
+
+        # down to the innermost children holding the whole edit
+        path: List[Tuple[List[_Unit], int, int, int]] = []
+        units = self._units
+        low = 0
+        level = 0
+        while units:
+            bounds = self._bounds(units, low)
+            first, last = self._touched(bounds, prefix, changed_end)
+            if first != last or units[first].head is None:
+                break
+            unit = units[first]
+            children_start = bounds[first] + unit.head.length
+            children_end = bounds[first + 1] - unit.tail[0]
+            if not children_start <= prefix <= changed_end <= children_end:
+                break
+            path.append((units, first, low, level))
+            units = unit.children
+            low = children_start
+            level += 1
+
+        while True:
+            bounds = self._bounds(units, low)
+            if units:
+                first, last = self._touched(bounds, prefix, changed_end)
+            else:
+                first, last = 0, -1
+            # the region must end with a line, so it may take the next unit
+            end = bounds[last + 1] + delta
+            while (
+                end < len(source) and source[end - 1] != "\n" and last + 1 < len(units)
+            ):
+                last += 1
+                end = bounds[last + 1] + delta
+            try:
+                if end < len(source) and source[end - 1] != "\n":
+                    raise _Stale("the edit ends inside a line of the next unit")
+                units[first : last + 1] = self._build(
+                    source, bounds[first] if units else low, end, level
+                )
+                break
+            except (_Stale, KdlParseError, ValueError):
+                if not path:
+                    return False
+                # compile the whole element around the touched children instead
+                units, first, low, level = path.pop()
+                prefix = min(prefix, self._bounds(units, low)[first])
+                changed_end = max(changed_end, self._bounds(units, low)[first + 1])
+
+        for parents, index, _, _ in reversed(path):
+            self._assemble(parents[index])
+        self._finish(source)
+        return True
+
+    def _finish(self, source: str) -> None:
+        parts: List[str] = []
+        self.tokens = []
+        self._write(self._units, False, parts, self.tokens)
+        self.source = source
+        self.output = "".join(parts)
+        extract, parse, convert, restore = self._phases
+        self.metrics = CompileMetrics(
+            origin="update",
+            input_bytes=source,
+            output_bytes=self.output,
+            token_count=len(self.tokens),
+            node_count=self._nodes,
+            extract_seconds=extract,
+            parse_seconds=parse,
+            convert_seconds=convert,
+            restore_seconds=restore,
+        )
+
+    def _write(
+        self, units: List[_Unit], lined: bool, parts: List[str], tokens: List[str]
+    ) -> None:
+        """Collect the HTML and tokens of units, like the converter writes them.
+
+        Elements are written out here instead of being joined when they are
+        compiled, so an edit deep down doesn't copy the HTML of every element
+        around it.
+        """
+        for unit in units:
+            head = unit.head
+            if head is None:
+                parts.append(unit.lined if lined else unit.html)
+                tokens.extend(unit.tokens)
+                continue
+            if lined:
+                parts.append("\n")
+            tokens.extend(head.tokens)
+            children = unit.children
+            if not any(child.count for child in children):
+                parts.append(head.empty)
+                # children commented out with "/-" keep their tokens
+                self._write(children, False, [], tokens)
+            else:
+                parts.append(head.start)
+                # see KdlToHtmlConverter._has_element_children
+                self._write(
+                    children,
+                    self.converter.format_output
+                    and any(child.elements for child in children),
+                    parts,
+                    tokens,
+                )
+                parts.append(head.closer)
+            tokens.extend(unit.tail[1])
+
+    @staticmethod
+    def _bounds(units: List[_Unit], start: int) -> List[int]:
+        bounds = [start]
+        for unit in units:
+            start += unit.length
+            bounds.append(start)
+        return bounds
+
+    @staticmethod
+    def _touched(bounds: List[int], start: int, end: int) -> Tuple[int, int]:
+        """Get the first and last unit the text from start to end is in."""
+        count = len(bounds) - 1
+        first = min(max(bisect_right(bounds, start) - 1, 0), count - 1)
+        last = min(max(bisect_left(bounds, end, 1) - 1, first), count - 1)
+        return first, last
+
+    # compiling
+
+    def _extract(self, text: str) -> Tuple[str, Dict[str, str]]:
+        started = perf_counter()
+        kdl, token_map, _ = _processor.scan(text)
+        for token in token_map.values():
+            # a token Jinja would end elsewhere could reach into the next unit
+            if _WELL_FORMED_TOKEN.fullmatch(token) is None:
+                raise _Stale(f"malformed token {token!r}")
+        self._phases[0] += perf_counter() - started
+        return kdl, token_map
+
+    def _parse(self, kdl: str) -> List:
+        from .kdl_bindings import parse
+
+        started = perf_counter()
+        nodes = parse(kdl, self._version).nodes
+        self._phases[1] += perf_counter() - started
+        return nodes
+
+    def _convert(self, node, level: int, token_map: Dict[str, str]) -> str:
+        started = perf_counter()
+        parts: List[str] = []
+        self._nodes += self.converter.convert_node_to(node, parts.append, level)
+        converted = perf_counter()
+        html = _processor.restore_jinja("".join(parts), token_map)
+        self._phases[2] += converted - started
+        self._phases[3] += perf_counter() - converted
+        return html
+
+    def _build(self, source: str, start: int, end: int, level: int) -> List[_Unit]:
+        """Compile source[start:end], whole lines of whole nodes, in units."""
+        text = source[start:end]
+        parts: List[str] = []
+        last = 0
+        for token_start, token_end in _processor.scan(text).offsets:
+            if token_start and text[token_start - 1] == "{":
+                # "{{%" opens a token one brace earlier for a scan from further up
+                raise _Stale("a brace before a token")
+            parts.append(text[last:token_start])
+            # like a placeholder, as far as the KDL around it is concerned
+            parts.append("x" * (token_end - token_start))
+            last = token_end
+        parts.append(text[last:])
+        masked = "".join(parts)
+        if _JINJA_OPENER.search(masked) is not None:
+            raise _Stale("a Jinja opener without a token")
+
+        spans = _spans(masked)
+        if (
+            spans and spans[-1].end == len(text) and text.endswith("\n")
+        ) or _CONTINUED.search(masked) is not None:
+            # a line continuation, the node goes on after the text
+            raise _Stale("the last node goes on after the text")
+        return self._group(text, masked, 0, len(text), spans, level)
+
+    def _group(
+        self,
+        text: str,
+        masked: str,
+        start: int,
+        end: int,
+        spans: List[_Span],
+        level: int,
+    ) -> List[_Unit]:
+        # nodes sharing lines, by their lines
+        groups: List[List] = []
+        for span in spans:
+            newline = masked.rfind("\n", start, span.start)
+            first_line = newline + 1 if newline >= 0 else start
+            newline = masked.find("\n", max(span.end - 1, span.start), end)
+            after_lines = newline + 1 if newline >= 0 else end
+            if groups and first_line < groups[-1][1]:
+                groups[-1][1] = max(groups[-1][1], after_lines)
+                groups[-1][2].append(span)
+            else:
+                groups.append([first_line, after_lines, [span]])
+
+        units: List[_Unit] = []
+        # blank and comment lines go with the nodes after them
+        chunk_start = cursor = start
+        for index, (_, group_end, group_spans) in enumerate(groups):
+            unit_end = end if index == len(groups) - 1 else group_end
+            span = group_spans[0]
+            if (
+                len(group_spans) == 1
+                and unit_end - cursor > CHUNK_SIZE
+                and level < _DEEPEST_SPLIT
+                and self._splittable(masked, span)
+            ):
+                if chunk_start < cursor:
+                    units.append(self._leaf(text[chunk_start:cursor], level))
+                units.append(self._branch(text, masked, cursor, unit_end, span, level))
+                chunk_start = unit_end
+            elif unit_end - chunk_start >= CHUNK_SIZE:
+                units.append(self._leaf(text[chunk_start:unit_end], level))
+                chunk_start = unit_end
+            cursor = unit_end
+        if chunk_start < end:
+            units.append(self._leaf(text[chunk_start:end], level))
+        return units
+
+    def _splittable(self, masked: str, span: _Span) -> bool:
+        if span.block is None or span.name in self.converter.SPECIAL_NODES:
+            return False
+        opening, closing = span.block
+        closing_line = masked.rfind("\n", 0, closing) + 1
+        return (
+            _AFTER_OPEN.match(masked, opening + 1) is not None
+            and not masked[closing_line:closing].strip()
+            and _AFTER_CLOSE.match(masked, closing + 1) is not None
+        )
+
+    def _leaf(self, text: str, level: int) -> _Unit:
+        kdl, token_map = self._extract(text)
+        nodes = self._parse(kdl)
+        html: List[str] = []
+        lined: List[str] = []
+        elements = False
+        for node in nodes:
+            converted = self._convert(node, level, token_map)
+            html.append(converted)
+            if node.name != "-":
+                lined.append("\n")
+            lined.append(converted)
+            elements = elements or node.name != "!doctype"
+
+        unit = _Unit()
+        unit.length = len(text)
+        unit.tokens = list(token_map.values())
+        unit.count = len(nodes)
+        unit.html = "".join(html)
+        unit.lined = "".join(lined) if self.converter.format_output else unit.html
+        unit.elements = elements
+        unit.head = None
+        unit.children = []
+        unit.tail = (0, [])
+        return unit
+
+    def _branch(
+        self,
+        text: str,
+        masked: str,
+        start: int,
+        end: int,
+        span: _Span,
+        level: int,
+    ) -> _Unit:
+        opening, closing = span.block
+        children_start = _AFTER_OPEN.match(masked, opening + 1).end()
+        children_end = masked.rfind("\n", 0, closing) + 1
+
+        kdl, token_map = self._extract(text[start:children_start])
+        nodes = self._parse(kdl + "}")
+        node = nodes[0] if len(nodes) == 1 else None
+        if node is None or node.children or node.name in self.converter.SPECIAL_NODES:
+            raise _Stale("the element's start doesn't parse on its own")
+        converter = self.converter
+        current_indent = converter.indent * level if converter.format_output else ""
+        parts: List[str] = []
+        converter._write_start_tag(
+            node.name,
+            node.properties.items(),
+            node.args,
+            True,
+            parts.append,
+            current_indent,
+        )
+        closer = converter._end_tag(node.name, current_indent, True)
+        restore = _processor.restore_jinja
+        head = _Head(
+            children_start - start,
+            list(token_map.values()),
+            restore("".join(parts), token_map),
+            self._convert(node, level, token_map),
+            restore(closer, token_map),
+        )
+        tail_tokens = list(self._extract(text[children_end:end])[1].values())
+
+        unit = _Unit()
+        unit.head = head
+        unit.children = self._group(
+            text, masked, children_start, children_end, span.children, level + 1
+        )
+        unit.tail = (end - children_end, tail_tokens)
+        self._assemble(unit)
+        return unit
+
+    def _assemble(self, unit: _Unit) -> None:
+        """Sum up an element's children again after they changed."""
+        assert unit.head is not None
+        unit.length = (
+            unit.head.length
+            + sum(child.length for child in unit.children)
+            + unit.tail[0]
+        )
+        unit.tokens = []
+        unit.count = 1
+        unit.html = unit.lined = ""
+        unit.elements = True
+
+
+__all__ = ["CHUNK_SIZE", "IncrementalDocument"]
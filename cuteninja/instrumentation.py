@@ -0,0 +1,336 @@
+import bisect
+import threading
+from typing import Callable, Dict, List, Sequence, Tuple, Union
+
+PHASES: Tuple[str, ...] = ("extract", "parse", "convert", "restore")
+
+
+class CompileMetrics:
+    """Sizes and per-phase durations of one `KdlTemplate` compilation.
+
+    `origin` is "compile" when the template was compiled, or "memory" or
+    "disk" when it was served from a cache; cached results report zero
+    durations and a node count of 0. After `KdlTemplate.update` it is
+    "update", and the durations and node count are those of the part of
+    the source that was compiled again.
+
+    The sizes can be given as the text itself; it is only encoded when the
+    size is read, so a cache hit nobody inspects does not pay for it.
+    """
+
+    __slots__ = (
+        "origin",
+        "_input",
+        "_output",
+        "token_count",
+        "node_count",
+        "extract_seconds",
+        "parse_seconds",
+        "convert_seconds",
+        "restore_seconds",
+    )
+
+    origin: str
+    token_count: int
+    node_count: int
+    extract_seconds: float
+    parse_seconds: float
+    convert_seconds: float
+    restore_seconds: float
+
+    def __init__(
+        self,
+        origin: str,
+        input_bytes: Union[int, str],
+        output_bytes: Union[int, str],
+        token_count: int,
+        node_count: int = 0,
+        extract_seconds: float = 0.0,
+        parse_seconds: float = 0.0,
+        convert_seconds: float = 0.0,
+        restore_seconds: float = 0.0,
+    ) -> None:
+        self.origin = origin
+        self._input = input_bytes
+        self._output = output_bytes
+        self.token_count = token_count
+        self.node_count = node_count
+        self.extract_seconds = extract_seconds
+        self.parse_seconds = parse_seconds
+        self.convert_seconds = convert_seconds
+        self.restore_seconds = restore_seconds
+
+    @property
+    def input_bytes(self) -> int:
+        """UTF-8 size of the KDL source."""
+        if isinstance(self._input, str):
+            self._input = len(self._input.encode("utf-8", "surrogatepass"))
+        return self._input
+
+    @property
+    def output_bytes(self) -> int:
+        """UTF-8 size of the HTML output."""
+        if isinstance(self._output, str):
+            self._output = len(self._output.encode("utf-8", "surrogatepass"))
+        return self._output
+
+    def _values(self) -> Tuple[object, ...]:
+        return (
+            self.origin,
+            self.input_bytes,
+            self.output_bytes,
+            self.token_count,
+            self.node_count,
+            self.extract_seconds,
+            self.parse_seconds,
+            self.convert_seconds,
+            self.restore_seconds,
+        )
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, CompileMetrics):
+            return NotImplemented
+        return self._values() == other._values()
+
+    def __hash__(self) -> int:
+        return hash(self._values())
+
+    def __repr__(self) -> str:
+        return (
+            f"CompileMetrics(origin={self.origin!r}, "
+            f"input_bytes={self.input_bytes}, output_bytes={self.output_bytes}, "
+            f"token_count={self.token_count}, node_count={self.node_count}, "
+            f"total_seconds={self.total_seconds!r})"
+        )
+
+    @property
+    def total_seconds(self) -> float:
+        return (
+            self.extract_seconds
+            + self.parse_seconds
+            + self.convert_seconds
+            + self.restore_seconds
+        )
+
+    def phases(self) -> Dict[str, float]:
+        """Get the duration of each phase.
+
+        Returns:
+            Mapping of phase names to seconds
+        """
+        return {
+            "extract": self.extract_seconds,
+            "parse": self.parse_seconds,
+            "convert": self.convert_seconds,
+            "restore": self.restore_seconds,
+        }
+
+
+Listener = Callable[[CompileMetrics], None]
+
+_listeners: List[Listener] = []
+
+
+def add_listener(callback: Listener) -> None:
+    """Call `callback` with the CompileMetrics of every new KdlTemplate.
+
+    Args:
+        callback: Callable receiving a CompileMetrics
+    """
+    if callback not in _listeners:
+        _listeners.append(callback)
+
+
+def remove_listener(callback: Listener) -> None:
+    """Stop calling a listener registered with `add_listener`.
+
+    Args:
+        callback: Previously registered callable
+    """
+    try:
+        _listeners.remove(callback)
+    except ValueError:
+        pass
+
+
+def has_listeners() -> bool:
+    return bool(_listeners)
+
+
+def notify(metrics: CompileMetrics) -> None:
+    """Pass metrics to every registered listener.
+
+    Args:
+        metrics: Metrics of a finished compilation
+    """
+    for callback in list(_listeners):
+        callback(metrics)
+
+
+class Histogram:
+    """Cumulative histogram with fixed bucket upper bounds."""
+
+    def __init__(self, buckets: Sequence[float]) -> None:
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        """Get the cumulative bucket counts, ending with `+Inf`.
+
+        Returns:
+            List of (upper bound, count) pairs
+        """
+        result: List[Tuple[str, int]] = []
+        running = 0
+        for bound, count in zip(self.buckets, self.counts):
+            running += count
+            result.append((_format_number(bound), running))
+        result.append(("+Inf", self.count))
+        return result
+
+
+SECONDS_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+BYTES_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+
+def _format_number(value: float) -> str:
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class MetricsRegistry:
+    """Process-wide aggregate of CompileMetrics.
+
+    Not registered by default; call `enable()` to start collecting, so
+    compilation pays nothing for metrics nobody reads.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        """Drop everything collected so far."""
+        with self._lock:
+            self.templates: Dict[str, int] = {}
+            self.tokens_total = 0
+            self.nodes_total = 0
+            self.phase_seconds = {phase: Histogram(SECONDS_BUCKETS) for phase in PHASES}
+            self.compile_seconds = Histogram(SECONDS_BUCKETS)
+            self.input_bytes = Histogram(BYTES_BUCKETS)
+            self.output_bytes = Histogram(BYTES_BUCKETS)
+
+    def enable(self) -> None:
+        """Start collecting metrics of new templates."""
+        add_listener(self.observe)
+
+    def disable(self) -> None:
+        """Stop collecting metrics."""
+        remove_listener(self.observe)
+
+    def observe(self, metrics: CompileMetrics) -> None:
+        """Add the metrics of one template to the aggregate.
+
+        Args:
+            metrics: Metrics of a finished compilation
+        """
+        with self._lock:
+            self.templates[metrics.origin] = self.templates.get(metrics.origin, 0) + 1
+            if metrics.origin != "compile":
+                return
+            self.tokens_total += metrics.token_count
+            self.nodes_total += metrics.node_count
+            for phase, seconds in metrics.phases().items():
+                self.phase_seconds[phase].observe(seconds)
+            self.compile_seconds.observe(metrics.total_seconds)
+            self.input_bytes.observe(metrics.input_bytes)
+            self.output_bytes.observe(metrics.output_bytes)
+
+    def to_prometheus(self, prefix: str = "cuteninja") -> str:
+        """Render the aggregate in the Prometheus text exposition format.
+
+        Args:
+            prefix: Prefix of every metric name
+
+        Returns:
+            Metrics as text, ending with a newline
+        """
+        lines: List[str] = []
+
+        def header(name: str, kind: str, help_text: str) -> str:
+            full = f"{prefix}_{name}"
+            lines.append(f"# HELP {full} {help_text}")
+            lines.append(f"# TYPE {full} {kind}")
+            return full
+
+        def histogram(name: str, help_text: str, series: Dict[str, Histogram]) -> None:
+            # keys are rendered label sets such as 'phase="parse"', or ""
+            full = header(name, "histogram", help_text)
+            for labels, hist in series.items():
+                sep = "," if labels else ""
+                for bound, count in hist.cumulative():
+                    lines.append(f'{full}_bucket{{{labels}{sep}le="{bound}"}} {count}')
+                suffix = f"{{{labels}}}" if labels else ""
+                lines.append(f"{full}_sum{suffix} {_format_number(hist.total)}")
+                lines.append(f"{full}_count{suffix} {hist.count}")
+
+        with self._lock:
+            full = header("templates_total", "counter", "Templates created.")
+            for origin, count in sorted(self.templates.items()):
+                lines.append(f'{full}{{origin="{origin}"}} {count}')
+
+            full = header("tokens_total", "counter", "Jinja tokens extracted.")
+            lines.append(f"{full} {self.tokens_total}")
+            full = header("nodes_total", "counter", "KDL nodes converted.")
+            lines.append(f"{full} {self.nodes_total}")
+
+            histogram(
+                "compile_seconds",
+                "Time to compile a template.",
+                {"": self.compile_seconds},
+            )
+            histogram(
+                "compile_phase_seconds",
+                "Time spent in each compile phase.",
+                {f'phase="{p}"': h for p, h in self.phase_seconds.items()},
+            )
+            histogram(
+                "input_bytes", "Size of compiled KDL sources.", {"": self.input_bytes}
+            )
+            histogram(
+                "output_bytes",
+                "Size of compiled HTML outputs.",
+                {"": self.output_bytes},
+            )
+
+        return "\n".join(lines) + "\n"
+
+
+_registry = MetricsRegistry()
+
+
+def get_registry() -> MetricsRegistry:
+    """Get the process-wide metrics registry.
+
+    Returns:
+        The shared MetricsRegistry, disabled until `enable()` is called
+    """
+    return _registry
+
+
+__all__ = [
+    "CompileMetrics",
+    "Histogram",
+    "MetricsRegistry",
+    "add_listener",
+    "get_registry",
+    "remove_listener",
+]
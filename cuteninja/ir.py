@@ -0,0 +1,451 @@
+import hashlib
+import struct
+import sys
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Union
+
+# instructions, each with two operands
+OPEN = 0  # name string, position of the matching CLOSE
+ARG = 1  # text slice
+ATTR = 2  # key string, text slice
+FLAG = 3  # key string, 0 or 1 for a boolean property
+CLOSE = 4
+
+_MAGIC = b"KDLIR"
+_VERSION = 1
+_HEADER = struct.Struct("<5sBIIIII")
+
+
+def _little_endian(values: "array[int]") -> bytes:
+    if sys.byteorder == "big":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _from_little_endian(typecode: str, data: bytes) -> "array[int]":
+    values = array(typecode)
+    values.frombytes(data)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+
+def _check_bounds(bounds: "array[int]", size: int) -> None:
+    if bounds[0] != 0 or bounds[-1] != size:
+        raise ValueError("corrupt DocumentIR: slices do not cover the data")
+    for start, end in zip(bounds, bounds[1:]):
+        if start > end:
+            raise ValueError("corrupt DocumentIR: slices out of order")
+
+
+def _check_instructions(
+    opcodes: "array[int]", operands: "array[int]", names: int, texts: int
+) -> None:
+    """Check that the instructions are ones `from_nodes` could have written.
+
+    Every operand has to be in range and every `OPEN` has to point at its
+    own `CLOSE`, otherwise walking the nodes could fail or never end.
+    """
+    count = len(opcodes)
+    # the CLOSE of each open node, the top level's last
+    closes = [count - 1]
+    # whether arguments, then properties, may still come in the current node
+    args = props = False
+    for position, opcode in enumerate(opcodes):
+        first = operands[2 * position]
+        second = operands[2 * position + 1]
+        if opcode == OPEN:
+            if first >= names or not position < second < count:
+                raise ValueError(f"corrupt DocumentIR: bad OPEN at {position}")
+            closes.append(second)
+            args = props = True
+        elif opcode == ARG:
+            if not args or first >= texts:
+                raise ValueError(f"corrupt DocumentIR: bad ARG at {position}")
+        elif opcode == ATTR or opcode == FLAG:
+            if opcode == ATTR:
+                valid = second < texts
+            else:
+                valid = second <= 1
+            if not props or first >= names or not valid:
+                raise ValueError(f"corrupt DocumentIR: bad property at {position}")
+            args = False
+        elif opcode == CLOSE:
+            if not closes or closes.pop() != position:
+                raise ValueError(f"corrupt DocumentIR: bad CLOSE at {position}")
+            args = props = False
+        else:
+            raise ValueError(f"corrupt DocumentIR: bad opcode at {position}")
+    if closes:
+        raise ValueError("corrupt DocumentIR: unclosed nodes")
+
+
+class IRNode:
+    """Read-only view of one node of a `DocumentIR`, shaped like a ckdl node."""
+
+    __slots__ = ("name", "args", "properties", "_ir", "_position")
+
+    name: str
+    args: List[str]
+    properties: Dict[str, Any]
+
+    def __init__(self, ir: "DocumentIR", position: int) -> None:
+        strings = ir.strings
+        opcodes = ir.opcodes
+        operands = ir.operands
+        text = ir.text
+        offsets = ir.offsets
+        self.name = strings[operands[2 * position]]
+        self._ir = ir
+
+        args: List[str] = []
+        position += 1
+        opcode = opcodes[position]
+        while opcode == ARG:
+            value = operands[2 * position]
+            args.append(text[offsets[value] : offsets[value + 1]])
+            position += 1
+            opcode = opcodes[position]
+        self.args = args
+
+        properties: Dict[str, Any] = {}
+        while opcode == ATTR or opcode == FLAG:
+            key = strings[operands[2 * position]]
+            value = operands[2 * position + 1]
+            if opcode == FLAG:
+                properties[key] = value == 1
+            else:
+                properties[key] = text[offsets[value] : offsets[value + 1]]
+            position += 1
+            opcode = opcodes[position]
+        self.properties = properties
+        # where the children start
+        self._position = position
+
+    @property
+    def children(self) -> List["IRNode"]:
+        ir = self._ir
+        opcodes = ir.opcodes
+        operands = ir.operands
+        children: List[IRNode] = []
+        position = self._position
+        while opcodes[position] == OPEN:
+            children.append(IRNode(ir, position))
+            position = operands[2 * position + 1] + 1
+        return children
+
+
+class DocumentIR:
+    """A parsed KDL document as flat arrays, built once and emitted any number of times.
+
+    Nodes are an instruction stream in document order: `OPEN` starts a node
+    and points at its `CLOSE`, then come its arguments (`ARG`), its
+    properties (`ATTR`, or `FLAG` for booleans) and its children. Node
+    names and property keys are interned in `strings`; arguments and
+    property values, already converted to text, are deduplicated slices
+    of `text`, bounded by `offsets`. `nodes` gives views shaped like ckdl
+    nodes, so `KdlToHtmlConverter` emits from them as it does from a parse
+    tree, in every output mode.
+    """
+
+    __slots__ = ("strings", "text", "offsets", "opcodes", "operands")
+
+    strings: List[str]
+    text: str
+    offsets: "array[int]"
+    opcodes: "array[int]"
+    operands: "array[int]"
+
+    def __init__(
+        self,
+        strings: List[str],
+        text: str,
+        offsets: "array[int]",
+        opcodes: "array[int]",
+        operands: "array[int]",
+    ) -> None:
+        self.strings = strings
+        self.text = text
+        self.offsets = offsets
+        self.opcodes = opcodes
+        self.operands = operands
+
+    @classmethod
+    def from_nodes(cls, nodes: List[Any]) -> "DocumentIR":
+        """Build the IR of a document.
+
+        Args:
+            nodes: KDL node objects, e.g. the `nodes` of a ckdl document
+
+        Returns:
+            The IR, holding no reference to the nodes
+        """
+        strings: Dict[str, int] = {}
+        texts: Dict[str, int] = {}
+        intern = strings.setdefault
+        slice_of = texts.setdefault
+        # lists grow faster than arrays, they are packed at the end
+        opcodes: List[int] = []
+        operands: List[int] = []
+        emit = opcodes.append
+        extend = operands.extend
+
+        # a node to write, or the position of an OPEN waiting for its CLOSE
+        stack: List[Any] = list(reversed(nodes))
+        while stack:
+            item = stack.pop()
+            if type(item) is int:
+                operands[2 * item + 1] = len(opcodes)
+                emit(CLOSE)
+                extend((0, 0))
+                continue
+
+            stack.append(len(opcodes))
+            emit(OPEN)
+            extend((intern(item.name, len(strings)), 0))
+            for arg in item.args:
+                emit(ARG)
+                extend((slice_of(str(arg), len(texts)), 0))
+            for key, value in item.properties.items():
+                if value is True or value is False:
+                    emit(FLAG)
+                    extend((intern(key, len(strings)), value))
+                else:
+                    emit(ATTR)
+                    extend(
+                        (intern(key, len(strings)), slice_of(str(value), len(texts)))
+                    )
+            children = item.children
+            if children:
+                stack.extend(reversed(children))
+        # the top level ends like a list of children
+        emit(CLOSE)
+        extend((0, 0))
+
+        offsets = array("I", [0])
+        total = 0
+        for value in texts:
+            total += len(value)
+            offsets.append(total)
+        return cls(
+            list(strings),
+            "".join(texts),
+            offsets,
+            array("B", opcodes),
+            array("I", operands),
+        )
+
+    @property
+    def nodes(self) -> List[IRNode]:
+        """Views of the top-level nodes."""
+        nodes: List[IRNode] = []
+        position = 0
+        while self.opcodes[position] == OPEN:
+            nodes.append(IRNode(self, position))
+            position = self.operands[2 * position + 1] + 1
+        return nodes
+
+    def text_at(self, index: int) -> str:
+        """Get an argument or property value by its slice number."""
+        return self.text[self.offsets[index] : self.offsets[index + 1]]
+
+    def values(self) -> List[str]:
+        """Get every argument and property value, by slice number."""
+        text = self.text
+        offsets = self.offsets
+        return [text[offsets[i] : offsets[i + 1]] for i in range(len(offsets) - 1)]
+
+    @property
+    def size(self) -> int:
+        """Approximate number of bytes held by the arrays and strings."""
+        return (
+            len(self.text)
+            + sum(len(value) for value in self.strings)
+            + self.offsets.itemsize * len(self.offsets)
+            + len(self.opcodes)
+            + self.operands.itemsize * len(self.operands)
+        )
+
+    def to_bytes(self) -> bytes:
+        """Serialize the IR, e.g. to cache it.
+
+        Returns:
+            A byte string for `from_bytes`
+        """
+        string_offsets = array("I", [0])
+        for value in self.strings:
+            string_offsets.append(string_offsets[-1] + len(value))
+        strings = "".join(self.strings).encode("utf-8", "surrogatepass")
+        text = self.text.encode("utf-8", "surrogatepass")
+        return b"".join(
+            [
+                _HEADER.pack(
+                    _MAGIC,
+                    _VERSION,
+                    len(strings),
+                    len(text),
+                    len(self.strings),
+                    len(self.offsets) - 1,
+                    len(self.opcodes),
+                ),
+                strings,
+                text,
+                _little_endian(string_offsets),
+                _little_endian(self.offsets),
+                bytes(self.opcodes),
+                _little_endian(self.operands),
+            ]
+        )
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "DocumentIR":
+        """Load an IR serialized by `to_bytes`.
+
+        Args:
+            data: Serialized IR
+
+        Returns:
+            The IR
+
+        Raises:
+            ValueError: If the data is not an IR of this version, or is
+                corrupt
+        """
+        try:
+            magic, version, strings_size, text_size, names, texts, count = (
+                _HEADER.unpack_from(data)
+            )
+        except struct.error:
+            raise ValueError("not a serialized DocumentIR") from None
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError("not a serialized DocumentIR of this version")
+
+        sizes = [
+            strings_size,
+            text_size,
+            (names + 1) * 4,
+            (texts + 1) * 4,
+            count,
+            count * 8,
+        ]
+        if len(data) != _HEADER.size + sum(sizes):
+            raise ValueError("truncated DocumentIR")
+        parts: List[bytes] = []
+        position = _HEADER.size
+        for size in sizes:
+            parts.append(data[position : position + size])
+            position += size
+
+        # UnicodeDecodeError is a ValueError too
+        joined = parts[0].decode("utf-8", "surrogatepass")
+        text = parts[1].decode("utf-8", "surrogatepass")
+        bounds = _from_little_endian("I", parts[2])
+        offsets = _from_little_endian("I", parts[3])
+        opcodes = array("B", parts[4])
+        operands = _from_little_endian("I", parts[5])
+        _check_bounds(bounds, len(joined))
+        _check_bounds(offsets, len(text))
+        _check_instructions(opcodes, operands, names, texts)
+        return cls(
+            [joined[bounds[i] : bounds[i + 1]] for i in range(names)],
+            text,
+            offsets,
+            opcodes,
+            operands,
+        )
+
+
+class DocumentCache:
+    """Thread-safe LRU of document IRs, keyed by a hash of the KDL.
+
+    Building an IR costs about half as much as parsing, which is wasted on
+    a document that is only converted once. So the first `parse` of a
+    document returns ckdl's nodes and only notes the hash; the IR is built
+    and kept from the second parse on, e.g. when the same source is
+    compiled with other options or for a source map.
+    """
+
+    max_entries: int
+    max_bytes: int
+
+    def __init__(
+        self, max_entries: int = 64, max_bytes: int = 32 * 1024 * 1024
+    ) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, DocumentIR]" = OrderedDict()
+        self._total_bytes = 0
+        # hashes of documents parsed once
+        self._seen: "OrderedDict[str, None]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def parse(
+        self, kdl: str, parse: Optional[Callable[[str], Any]] = None
+    ) -> Union[DocumentIR, List[Any]]:
+        """Get the IR of a document, or its nodes if it was not parsed before.
+
+        Args:
+            kdl: KDL source without Jinja
+            parse: KDL parser, defaults to `kdl_bindings.parse`
+
+        Returns:
+            The kept IR, or the parsed nodes
+        """
+        key = hashlib.sha256(kdl.encode("utf-8", "surrogatepass")).hexdigest()
+        with self._lock:
+            ir = self._entries.get(key)
+            if ir is not None:
+                self._entries.move_to_end(key)
+                return ir
+            seen = self._seen.pop(key, False) is None
+            if not seen:
+                self._seen[key] = None
+                while len(self._seen) > 16 * max(self.max_entries, 1):
+                    self._seen.popitem(last=False)
+
+        if parse is None:
+            from .kdl_bindings import parse
+        nodes = parse(kdl).nodes
+        if not seen:
+            return nodes
+        ir = DocumentIR.from_nodes(nodes)
+        size = ir.size
+        with self._lock:
+            if self.max_entries > 0 and size <= self.max_bytes:
+                if key not in self._entries:
+                    self._total_bytes += size
+                self._entries[key] = ir
+                while self._entries and (
+                    len(self._entries) > self.max_entries
+                    or self._total_bytes > self.max_bytes
+                ):
+                    self._total_bytes -= self._entries.popitem(last=False)[1].size
+        return ir
+
+    def clear(self) -> None:
+        """Drop every IR and forget which documents were seen."""
+        with self._lock:
+            self._entries.clear()
+            self._seen.clear()
+            self._total_bytes = 0
+
+
+_document_cache = DocumentCache()
+
+
+def get_document_cache() -> DocumentCache:
+    """Get the process-wide cache of document IRs used by `KdlTemplate`.
+
+    Returns:
+        The shared DocumentCache instance
+    """
+    return _document_cache
+
+
+__all__ = ["DocumentCache", "DocumentIR", "IRNode", "get_document_cache"]
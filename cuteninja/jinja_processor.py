@@ -1,65 +1,324 @@
 import re
-from typing import Dict, Pattern, Tuple
+import threading
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Pattern, Set, Tuple
 
+PLACEHOLDER_PREFIX = "__JINJA"
 
-class JinjaProcessor:
-    """Processor for extracting Jinja from KDL and subsequently restoring it in HTML."""
+# {% include "a" %}, {% extends "a" %}, {% import "a" as m %}, {% from "a" import m %}
+_REFERENCE_PATTERN = re.compile(
+    r"""\{%[-+]?\s*(?:include|extends|import|from)\s+(["'])(.+?)\1"""
+)
+
+# tags that render nothing themselves, and comments
+_STATEMENT = re.compile(
+    r"\{%[-+]?\s*(?:if|elif|else|endif|for|endfor|set|endset|with|endwith"
+    r"|raw|endraw)\b|\{#"
+)
+_RAW_BOUNDARY = re.compile(r"\{%[-+]?\s*(end)?raw\b")
+
+# tags around raw blocks, without the opening brace
+_RAW_TAG = r"%[-+]?\s*raw\s*[-+]?%\}"
+_ENDRAW_TAG = r"\{%[-+]?\s*endraw\s*[-+]?%\}"
+_RAW_OPENER = re.compile(r"\{[{%#]")
+_CLOSERS = {"{": "}}", "%": "%}", "#": "#}"}
+
+
+def _unrolled(plain: str, special: str) -> str:
+    # (plain|special)* without the exponential backtracking on failure
+    return f"{plain}*(?:(?:{special}){plain}*)*"
+
+
+def _token_pattern(multiline: bool, strict: bool = False) -> str:
+    """Build the pattern for a Jinja token after its opening brace.
+
+    String literals and two levels of nested braces inside `{{ }}` and
+    `{% %}` are skipped like Jinja's lexer does, and a backslash outside a
+    string is taken as a KDL escape such as `\\"`. A token that still does
+    not match, e.g. because of an unbalanced quote, ends at the first closer,
+    unless `strict` is set.
+    """
+    newline = "" if multiline else "\\n"
+    escape = "\\\\." if multiline else "\\\\[^\\n]"
+
+    strings = "|".join(
+        quote + _unrolled(f"[^{quote}\\\\{newline}]", escape) + quote for quote in "'\""
+    )
+    skipped = f"{strings}|{escape}"
+    expression = f"[^'\"\\\\{{}}{newline}]"
+    braces = "\\{" + _unrolled(expression, skipped) + "\\}"
+    braces = "\\{" + _unrolled(expression, f"{skipped}|{braces}") + "\\}"
 
+    alternatives = [
+        "\\{" + _unrolled(expression, f"{skipped}|\\}}(?!\\}})|{braces}") + "\\}\\}",
+        "%" + _unrolled(f"[^'\"\\\\%{newline}]", f"{skipped}|%(?!\\}})") + "%\\}",
+        "#" + _unrolled(f"[^#{newline}]", "#(?!\\})") + "#\\}",
+    ]
+    if not strict:
+        alternatives += [
+            # unlike a lazy .*? these cannot be stretched past the first closer
+            "\\{" + _unrolled(f"[^}}{newline}]", "\\}(?!\\})") + "\\}\\}",
+            "%" + _unrolled(f"[^%{newline}]", "%(?!\\})") + "%\\}",
+        ]
+    return "|".join(alternatives)
+
+
+_LINE_TOKEN = f"\\{{(?!{_RAW_TAG})(?:{_token_pattern(multiline=False)})"
+_SINGLE_LINE_TOKEN = re.compile(_LINE_TOKEN)
+# Every alternative starts with a brace, so `re` can skip ahead to it.
+_SCANNER = re.compile(
+    f"\\{{(?:{_RAW_TAG}(.*?){_ENDRAW_TAG}"
+    f"|(?!{_RAW_TAG})(?:{_token_pattern(multiline=True)})"
+    # the rest of the line, if it holds nothing but single-line tokens
+    f"([^\\S\\n]*(?:{_LINE_TOKEN}[^\\S\\n]*)*(?=\\n|\\Z))?"
+    # an unterminated raw block
+    f"|{_RAW_TAG})",
+    re.DOTALL,
+)
+
+
+# a token that ends where Jinja's lexer would end it, whatever follows
+_WELL_FORMED_TOKEN = re.compile(
+    f"\\{{(?:{_token_pattern(multiline=True, strict=True)})", re.DOTALL
+)
+
+
+class Extraction(NamedTuple):
+    """KDL with Jinja replaced by placeholders, as returned by `JinjaProcessor.scan`."""
+
+    kdl: str
     token_map: Dict[str, str]
-    token_counter: int
+    # (start, end) of every token in the original source, by placeholder number
+    offsets: List[Tuple[int, int]]
+
+
+def _is_standalone(source: str, start: int, end: int) -> bool:
+    """Check whether nothing but blanks surrounds a token on its line."""
+    line_start = source.rfind("\n", 0, start) + 1
+    line_end = source.find("\n", end)
+    before = source[line_start:start]
+    after = source[end:line_end] if line_end >= 0 else source[end:]
+    return (not before or before.isspace()) and (not after or after.isspace())
+
+
+def _iter_raw_tokens(source: str, start: int, stop: int) -> Iterator[Tuple[int, int]]:
+    """Yield the spans of tokens between `{% raw %}` and `{% endraw %}`."""
+    # Jinja does not parse anything here, so the first closer ends a token
+    match = _RAW_OPENER.search(source, start, stop)
+    while match is not None:
+        begin = match.start()
+        end = source.find(_CLOSERS[source[begin + 1]], begin + 2, stop)
+        if end < 0:
+            match = _RAW_OPENER.search(source, begin + 1, stop)
+            continue
+        yield begin, end + 2
+        match = _RAW_OPENER.search(source, end + 2, stop)
+
+
+@lru_cache(maxsize=32)
+def _placeholder_pattern(prefix: str) -> Pattern[str]:
+    return re.compile(re.escape(prefix) + r"\d+__")
+
+
+@lru_cache(maxsize=32)
+def _placeholder_lines(prefix: str) -> Pattern[str]:
+    placeholder = re.escape(prefix) + r"\d+__"
+    return re.compile(f"{placeholder}(?:\n{placeholder})*")
+
+
+def _placeholder_prefix(source: str) -> str:
+    """Pick a placeholder prefix that does not occur anywhere in the source.
+
+    Placeholders look like `__JINJA_0__`. If the source already contains
+    `__JINJA`, a hex salt is inserted (`__JINJA1_0__`, `__JINJA2_0__`, ...)
+    until the prefix is unique, so restoring can never touch user content.
+    """
+    if PLACEHOLDER_PREFIX not in source:
+        return PLACEHOLDER_PREFIX + "_"
+
+    salt = 1
+    while True:
+        prefix = f"{PLACEHOLDER_PREFIX}{salt:x}_"
+        if prefix not in source:
+            return prefix
+        salt += 1
+
+
+def find_template_references(tokens: Iterable[str]) -> List[str]:
+    """Find templates referenced by literal name in Jinja tokens.
+
+    Only `include`, `extends`, `import` and `from` tags with a string literal
+    are considered; names computed at render time cannot be known here.
+
+    Args:
+        tokens: Jinja tokens, e.g. the values of a token map
+
+    Returns:
+        Referenced template names in order of appearance, without duplicates
+    """
+    names: Dict[str, None] = {}
+    for token in tokens:
+        match = _REFERENCE_PATTERN.match(token)
+        if match is not None:
+            names[match.group(2)] = None
+    return list(names)
+
+
+def find_statements(token_map: Dict[str, str]) -> Set[str]:
+    """Find the placeholders of tokens that never render any text themselves.
+
+    These are comments and the tags of `if`, `for`, `set`, `with` and `raw`
+    blocks. Tokens inside a raw block are rendered as text and don't count.
+
+    Args:
+        token_map: Mapping of placeholders to Jinja tokens, in source order
+
+    Returns:
+        Placeholders of the silent tokens
+    """
+    statements: Set[str] = set()
+    in_raw = False
+    for placeholder, token in token_map.items():
+        boundary = _RAW_BOUNDARY.match(token)
+        if in_raw:
+            if boundary is not None and boundary.group(1):
+                in_raw = False
+                statements.add(placeholder)
+        elif _STATEMENT.match(token) is not None:
+            in_raw = boundary is not None
+            statements.add(placeholder)
+    return statements
+
+
+class JinjaProcessor:
+    """Processor for extracting Jinja from KDL and subsequently restoring it in HTML.
+
+    `scan` and `restore_jinja` keep all their state local to the call, so one
+    processor can be shared by any number of threads. Only the token map of
+    the last `extract_jinja` call is remembered for `get_source_map`, per
+    thread.
+    """
 
     def __init__(self) -> None:
-        self.token_map = {}
-        self.token_counter = 0
+        self._last = threading.local()
 
-    def extract_jinja(self, source: str) -> Tuple[str, Dict[str, str]]:
-        """Extract Jinja blocks from source and replace with placeholders.
+    @property
+    def token_map(self) -> Dict[str, str]:
+        """Token map of the last `extract_jinja` call in this thread."""
+        return getattr(self._last, "token_map", {})
+
+    @property
+    def token_counter(self) -> int:
+        """Number of tokens found by the last `extract_jinja` call in this thread."""
+        return len(self.token_map)
+
+    def scan(self, source: str) -> Extraction:
+        """Replace Jinja tokens in source with placeholders in a single pass.
+
+        String literals inside `{{ }}` and `{% %}` are skipped, so
+        `{{ "}}" }}` is one token. Inside `{% raw %}` blocks the first closer
+        ends a token, as Jinja does not parse anything there. A line holding
+        nothing but single-line tokens becomes a KDL text node, and so does a
+        token spanning several lines.
 
         Args:
             source: KDL source with Jinja syntax
 
         Returns:
-            Tuple of cleaned KDL and mapping of placeholders to tokens
+            The cleaned KDL, the token map and the source span of each token
         """
-        self.token_map = {}
-        self.token_counter = 0
-
-        # pattern to match Jinja syntax: {{ }}, {% %}, {# #}
-        pattern = r"(\{\{.*?\}\}|\{%.*?%\}|\{#.*?#\})"
-
-        def replace_jinja(match: re.Match[str]) -> str:
-            token = match.group(0)
-            placeholder = f"__JINJA_{self.token_counter}__"
-            self.token_map[placeholder] = token
-            self.token_counter += 1
+        token_map: Dict[str, str] = {}
+        offsets: List[Tuple[int, int]] = []
+        prefix = _placeholder_prefix(source)
 
+        def add(start: int, end: int, standalone: bool = False) -> str:
+            placeholder = f"{prefix}{len(offsets)}__"
+            token = source[start:end]
+            token_map[placeholder] = token
+            offsets.append((start, end))
             # If the token contains newlines then wrap it as a KDL text node
-            if "\n" in token:
+            if standalone or "\n" in token:
                 return f'- "{placeholder}"'
             return placeholder
 
-        # replace all Jinja blocks with placeholders
-        cleaned = re.sub(pattern, replace_jinja, source, flags=re.DOTALL)
+        def replace(match: "re.Match[str]") -> str:
+            if match.lastindex is None:
+                # a token with something else on its line, the common case
+                placeholder = f"{prefix}{len(offsets)}__"
+                token = match.group()
+                token_map[placeholder] = token
+                offsets.append(match.span())
+                if "\n" in token:
+                    return f'- "{placeholder}"'
+                return placeholder
 
-        # handle standalone single-line Jinja blocks
-        lines = cleaned.split("\n")
-        final_lines: list[str] = []
+            start, end = match.span()
+            tail = match.start(2)
+            if tail < 0:
+                # a raw block, taken literally up to the closing tag
+                spans = [
+                    (start, match.start(1)),
+                    *_iter_raw_tokens(source, *match.span(1)),
+                    (match.end(1), end),
+                ]
+                parts: List[str] = []
+                last = start
+                for begin, stop in spans:
+                    parts.append(source[last:begin])
+                    parts.append(add(begin, stop, _is_standalone(source, begin, stop)))
+                    last = stop
+                return "".join(parts)
 
-        for line in lines:
-            stripped = line.strip()
-            # check if line is only a placeholder (i.e. standalone block)
-            if re.fullmatch(r"__JINJA_\d+__", stripped):
-                # to KDL text node
-                indent = len(line) - len(line.lstrip())
-                final_lines.append(" " * indent + f'- "{stripped}"')
+            # only blanks and single-line tokens follow on this line
+            placeholder = f"{prefix}{len(offsets)}__"
+            token = source[start:tail]
+            token_map[placeholder] = token
+            offsets.append((start, tail))
+            if "\n" in token:
+                standalone = False
+                placeholder = f'- "{placeholder}"'
             else:
-                final_lines.append(line)
+                line_start = source.rfind("\n", 0, start) + 1
+                standalone = line_start == start or source[line_start:start].isspace()
+            if tail == end:
+                # alone on its line, to a KDL text node
+                return f'- "{placeholder}"' if standalone else placeholder
+
+            parts = [placeholder]
+            for token in _SINGLE_LINE_TOKEN.finditer(source, tail, end):
+                begin, stop = token.span()
+                parts.append(source[tail:begin])
+                parts.append(add(begin, stop))
+                tail = stop
+            if standalone:
+                # keep the blanks between the tokens, drop the trailing ones
+                return '- "' + "".join(parts) + '"'
+            parts.append(source[tail:end])
+            return "".join(parts)
+
+        return Extraction(_SCANNER.sub(replace, source), token_map, offsets)
+
+    def extract_jinja(self, source: str) -> Tuple[str, Dict[str, str]]:
+        """Extract Jinja blocks from source and replace with placeholders.
+
+        Args:
+            source: KDL source with Jinja syntax
 
-        return "\n".join(final_lines), self.token_map
+        Returns:
+            Tuple of cleaned KDL and mapping of placeholders to tokens
+        """
+        kdl, token_map, _ = self.scan(source)
+        self._last.token_map = token_map
+        return kdl, token_map
 
     def restore_jinja(self, html: str, token_map: Dict[str, str]) -> str:
         """Restore Jinja blocks from placeholders in HTML.
 
+        The HTML is scanned once and every placeholder is spliced in place,
+        so the cost is linear in the size of the HTML regardless of the
+        number of tokens. Maps made by `scan` are matched by their prefix,
+        any other map by its keys.
+
         Args:
             html: HTML with placeholders
             token_map: Mapping of placeholders to Jinja tokens
@@ -67,13 +326,34 @@ class JinjaProcessor:
         Returns:
             HTML with restored Jinja syntax
         """
-        result = html
-        for placeholder, token in token_map.items():
-            result = result.replace(placeholder, token)
-        return result
+        if not token_map:
+            return html
+
+        # all placeholders of one extraction share the same prefix
+        first = next(iter(token_map))
+        prefix = first[: first.rfind("_", 0, len(first) - 2) + 1]
+        keys = "\n".join(token_map)
+        if (
+            prefix
+            and keys.count("\n") == len(token_map) - 1
+            and _placeholder_lines(prefix).fullmatch(keys)
+        ):
+            pattern = _placeholder_pattern(prefix)
+        else:
+            # any other map: match its keys themselves, longest first
+            ordered = sorted(filter(None, token_map), key=len, reverse=True)
+            if not ordered:
+                return html
+            pattern = re.compile("|".join(map(re.escape, ordered)))
+
+        def lookup(match: re.Match[str]) -> str:
+            placeholder = match.group(0)
+            return token_map.get(placeholder, placeholder)
+
+        return pattern.sub(lookup, html)
 
     def get_source_map(self) -> Dict[str, str]:
-        """Get the current token mapping.
+        """Get the token mapping of the last `extract_jinja` call in this thread.
 
         Returns:
             Mapping of placeholders to Jinja tokens
@@ -0,0 +1,119 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Optional
+
+from jinja2 import Environment, Template
+
+from .cache import make_key
+
+# same default as jinja2.Environment(cache_size=...)
+CACHE_SIZE = 400
+
+
+class _TemplateCache:
+    """Small thread-safe LRU of compiled Jinja templates keyed by HTML hash."""
+
+    def __init__(self, max_entries: int = CACHE_SIZE) -> None:
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Template]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Template]:
+        with self._lock:
+            template = self._entries.get(key)
+            if template is not None:
+                self._entries.move_to_end(key)
+            return template
+
+    def set(self, key: str, template: Template) -> None:
+        with self._lock:
+            self._entries[key] = template
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+_ATTRIBUTE = "_cuteninja_templates"
+_default_cache = _TemplateCache()
+_attach_lock = threading.Lock()
+
+
+def _cache_for(environment: Optional[Environment]) -> _TemplateCache:
+    if environment is None:
+        return _default_cache
+
+    # Kept on the environment itself: a module-level WeakKeyDictionary would
+    # pin the environment, because every Template refers back to it.
+    cache = environment.__dict__.get(_ATTRIBUTE)
+    if cache is None:
+        with _attach_lock:
+            cache = environment.__dict__.get(_ATTRIBUTE)
+            if cache is None:
+                cache = _TemplateCache()
+                setattr(environment, _ATTRIBUTE, cache)
+    return cache
+
+
+def html_to_jinja(html: str, environment: Optional[Environment] = None) -> Template:
+    """Compile HTML with Jinja2 syntax to a Jinja template, memoized.
+
+    Templates are memoized per environment by a hash of the HTML, so the
+    Jinja lexer, parser and code generator run once per template and
+    environment. The memo lives as long as the environment does.
+
+    Args:
+        html: HTML with Jinja2 syntax, e.g. `KdlTemplate.render()`
+        environment: Environment to compile in, defaults to the shared one
+            used by `jinja2.Template`
+
+    Returns:
+        Ready to render jinja2.Template
+    """
+    cache = _cache_for(environment)
+    key = make_key(html)
+    template = cache.get(key)
+    if template is None:
+        if environment is None:
+            template = Template(html)
+        else:
+            template = environment.from_string(html)
+        cache.set(key, template)
+    return template
+
+
+def compile_to_jinja(
+    source: str, environment: Optional[Environment] = None, **options: Any
+) -> Template:
+    """Compile KDL source straight to a memoized Jinja template.
+
+    Args:
+        source: KDL markup as string
+        environment: Environment to compile in, defaults to the shared one
+            used by `jinja2.Template`
+        **options: Options passed on to `KdlTemplate`
+
+    Returns:
+        Ready to render jinja2.Template
+    """
+    from .core import KdlTemplate
+
+    return html_to_jinja(KdlTemplate(source, **options).render(), environment)
+
+
+def clear_jinja_cache(environment: Optional[Environment] = None) -> None:
+    """Forget the memoized templates of an environment.
+
+    Args:
+        environment: Environment whose memo to clear, defaults to the shared one
+    """
+    _cache_for(environment).clear()
+
+
+__all__ = ["clear_jinja_cache", "compile_to_jinja", "html_to_jinja"]
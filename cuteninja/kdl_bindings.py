@@ -1,50 +1,54 @@
+import os
 from typing import Any
 
+from .kdl_events import KdlParseError
 
-class KdlParseError(Exception):
-    """Error raised when KDL parsing fails."""
-
+# "ckdl" or "python", otherwise ckdl if it is installed
+_REQUESTED = os.environ.get("CUTENINJA_KDL_BACKEND", "").strip().lower()
 
 try:
+    if _REQUESTED == "python":
+        raise ImportError("pure-Python KDL parser requested")
     import ckdl
 
-    def parse(source: str) -> Any:
+    def parse(source: str, version: Any = "any") -> Any:
         """Parse KDL source using ckdl.
 
         Args:
             source: KDL markup as string
+            version: KDL version, 1 or 2, or "any" to try both
 
         Returns:
             Parsed KDL document
         """
-        return ckdl.parse(source)
+        return ckdl.parse(source, version=version)
 
     Document = ckdl.Document
     Node = ckdl.Node
+    BACKEND = "ckdl"
 
 except ImportError:
+    if _REQUESTED == "ckdl":
+        raise
+
+    from .kdl_events import Document, Node, parse_document
 
-    def parse(source: str) -> Any:
-        """Parse KDL source: requires ckdl to be installed.
+    def parse(source: str, version: Any = "any") -> Any:
+        """Parse KDL source using the pure-Python parser, as ckdl is not installed.
 
         Args:
             source: KDL markup as string
+            version: Ignored, both KDL versions are always accepted
+
+        Returns:
+            Parsed KDL document
 
         Raises:
-            NotImplementedError: When ckdl is not installed
+            KdlParseError: If the source is not valid KDL
         """
-        raise NotImplementedError("ckdl not installed")
-
-    class Document:
-        """Document class: requires ckdl to be installed."""
-
-        def __init__(self) -> None:
-            raise NotImplementedError("ckdl not installed")
-
-    class Node:
-        """Node class: requires ckdl to be installed."""
+        return parse_document(source)
 
-        pass
+    BACKEND = "python"
 
 
-__all__ = ["parse", "Document", "Node", "KdlParseError"]
+__all__ = ["BACKEND", "parse", "Document", "Node", "KdlParseError"]
@@ -1,4 +1,26 @@
-from typing import Any, Dict, List, Set
+import copy
+import re
+from typing import (
+    AbstractSet,
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
+
+from .ir import ARG, ATTR, CLOSE, FLAG, DocumentIR
+from .kdl_events import ARGS, END, PROPS, START, build_nodes
+from .jinja_processor import PLACEHOLDER_PREFIX
+
+_WHITESPACE = re.compile(r"\s+")
+_PLACEHOLDER = re.compile(re.escape(PLACEHOLDER_PREFIX) + r"[0-9a-f]*_(\d+)__")
+# characters that end an unquoted attribute value or make it ambiguous
+_UNQUOTED_VALUE = re.compile(r"[^\s\"'=<>`]+")
 
 
 class KdlToHtmlConverter:
@@ -24,12 +46,108 @@ class KdlToHtmlConverter:
 
     SPECIAL_NODES: Set[str] = {"!doctype", "-"}
 
+    # https://html.spec.whatwg.org/multipage/syntax.html#optional-tags
+    # element -> (elements that may follow it, whether it may end its parent)
+    OPTIONAL_END_TAGS: Dict[str, Tuple[AbstractSet[str], bool]] = {
+        "li": ({"li"}, True),
+        "dt": ({"dt", "dd"}, False),
+        "dd": ({"dt", "dd"}, True),
+        "p": (
+            {
+                "address",
+                "article",
+                "aside",
+                "blockquote",
+                "details",
+                "div",
+                "dl",
+                "fieldset",
+                "figcaption",
+                "figure",
+                "footer",
+                "form",
+                "h1",
+                "h2",
+                "h3",
+                "h4",
+                "h5",
+                "h6",
+                "header",
+                "hgroup",
+                "hr",
+                "main",
+                "menu",
+                "nav",
+                "ol",
+                "p",
+                "pre",
+                "section",
+                "table",
+                "ul",
+            },
+            True,
+        ),
+        "rt": ({"rt", "rp"}, True),
+        "rp": ({"rt", "rp"}, True),
+        "optgroup": ({"optgroup"}, True),
+        "option": ({"option", "optgroup"}, True),
+        "thead": ({"tbody", "tfoot"}, False),
+        "tbody": ({"tbody", "tfoot"}, True),
+        "tfoot": (set(), True),
+        "tr": ({"tr"}, True),
+        "td": ({"td", "th"}, True),
+        "th": ({"td", "th"}, True),
+    }
+
+    # a p ending one of these, or a custom element, needs its end tag
+    P_END_TAG_REQUIRED: Set[str] = {
+        "a",
+        "audio",
+        "del",
+        "ins",
+        "map",
+        "noscript",
+        "video",
+    }
+
+    # whitespace is kept as written inside these
+    PREFORMATTED: Set[str] = {"pre", "textarea", "script", "style", "listing", "xmp"}
+
+    # property naming a fragment explicitly, otherwise an element's id does;
+    # fragments leave it out, other output keeps it as an attribute
+    FRAGMENT_PROPERTY: str = "fragment"
+
     indent: str
     format_output: bool
+    iterative: bool
+    minify: bool
+    fragments: bool
 
-    def __init__(self, indent: str = "    ", format_output: bool = True) -> None:
+    def __init__(
+        self,
+        indent: str = "    ",
+        format_output: bool = True,
+        iterative: bool = False,
+        minify: bool = False,
+        fragments: bool = False,
+    ) -> None:
+        """Create a converter.
+
+        Args:
+            indent: Indentation used for each nesting level
+            format_output: Whether to format the output with indentation
+            iterative: Walk the tree with an explicit stack instead of
+                recursion, so nesting depth is not bound by the recursion limit
+            minify: Write the smallest equivalent HTML instead, see
+                `convert_document_to`; implies `format_output=False`
+            fragments: Leave out the `FRAGMENT_PROPERTY`, which only names
+                elements for `convert_fragments`
+        """
         self.indent = indent
-        self.format_output = format_output
+        self.format_output = format_output and not minify
+        self.iterative = iterative
+        self.minify = minify
+        self.fragments = fragments
 
     def convert_node(self, node: Any, level: int = 0) -> str:
         """Convert a KDL node to HTML.
@@ -41,75 +159,554 @@ class KdlToHtmlConverter:
         Returns:
             HTML string representation of the node
         """
-        current_indent = self.indent * level if self.format_output else ""
+        parts: List[str] = []
+        self.convert_node_to(node, parts.append, level)
+        return "".join(parts)
+
+    def convert_node_to(
+        self, node: Any, write: Callable[[str], Any], level: int = 0
+    ) -> int:
+        """Write the HTML for a KDL node fragment by fragment.
+
+        Every fragment is passed to `write` exactly once, so a subtree is
+        never copied into its parent.
+
+        Args:
+            node: KDL node object
+            write: Callable receiving each HTML fragment, e.g. `list.append`
+                or the `write` method of a text file
+            level: Current indentation level
+
+        Returns:
+            Number of nodes converted, including descendants
+        """
+        if self.minify:
+            return self._convert_minified([node], write, frozenset(), None, False)
+        if self.iterative:
+            return self._convert_iterative([node], write, level)
+        return self._convert_recursive(node, write, level)
+
+    def _doctype(self, args: List[Any], current_indent: str) -> str:
+        doctype_value = args[0] if args else "html"
         newline = "\n" if self.format_output else ""
+        return f"{current_indent}<!DOCTYPE {doctype_value}>{newline}"
+
+    def _write_start_tag(
+        self,
+        name: str,
+        props: Iterable[Tuple[str, Any]],
+        args: List[Any],
+        children: bool,
+        write: Callable[[str], Any],
+        current_indent: str,
+        minify: bool = False,
+        preformatted: bool = False,
+    ) -> bool:
+        """Write an element's start tag and the text of its arguments.
+
+        Every walker writes elements with this and `_end_tag`, and only
+        decides what comes in between.
+
+        Args:
+            name: Element name
+            props: The element's properties, as key and value pairs
+            args: The element's arguments, written as its text
+            children: Whether the element has children
+            write: Callable receiving each HTML fragment
+            current_indent: Indentation before the start tag
+            minify: Leave out quotes where that is unambiguous, end void
+                elements in `>` and collapse whitespace in the text
+            preformatted: Whether the text keeps its whitespace when minifying
+
+        Returns:
+            Whether the element needs an end tag; a void element without
+            arguments and children is complete already
+        """
+        write(f"{current_indent}<{name}")
+        skipped = self.FRAGMENT_PROPERTY if self.fragments else None
+        for key, value in props:
+            if key == skipped:
+                continue
+            if isinstance(value, bool):
+                if value:
+                    write(f" {key}")
+                continue
+            value = str(value)
+            if (
+                minify
+                and _UNQUOTED_VALUE.fullmatch(value)
+                and PLACEHOLDER_PREFIX not in value
+            ):
+                write(f" {key}={value}")
+            else:
+                escaped_value = value.replace('"', "&quot;")
+                write(f' {key}="{escaped_value}"')
+
+        if not args and not children and name.lower() in self.VOID_ELEMENTS:
+            newline = "\n" if self.format_output else ""
+            write(">" if minify else f" />{newline}")
+            return False
+        write(">")
+        if args:
+            text = " ".join(str(arg) for arg in args)
+            write(_WHITESPACE.sub(" ", text) if minify and not preformatted else text)
+        return True
+
+    def _end_tag(self, name: str, current_indent: str, children: bool) -> str:
+        # formatted, an end tag after children goes on a line of its own
+        if not self.format_output:
+            return f"</{name}>"
+        if children:
+            return f"\n{current_indent}</{name}>\n"
+        return f"</{name}>\n"
+
+    def _has_element_children(self, children: List[Any]) -> bool:
+        return any(
+            child.name not in self.SPECIAL_NODES or child.name == "-"
+            for child in children
+        )
 
+    def _convert_recursive(
+        self, node: Any, write: Callable[[str], Any], level: int
+    ) -> int:
+        current_indent = self.indent * level if self.format_output else ""
         node_name = node.name
 
         # Handle special nodes
         if node_name == "!doctype":
-            doctype_value = node.args[0] if node.args else "html"
-            return f"{current_indent}<!DOCTYPE {doctype_value}>{newline}"
+            write(self._doctype(node.args, current_indent))
+            return 1
 
         if node_name == "-":
-            text = " ".join(str(arg) for arg in node.args)
-            return text
+            write(" ".join(str(arg) for arg in node.args))
+            return 1
 
-        tag_name = node_name
+        children = node.children
+        if not self._write_start_tag(
+            node_name,
+            node.properties.items(),
+            node.args,
+            bool(children),
+            write,
+            current_indent,
+        ):
+            return 1
 
-        opening = f"{current_indent}<{tag_name}"
+        if not children:
+            write(self._end_tag(node_name, current_indent, False))
+            return 1
 
-        props: Dict[str, Any] = node.properties
-        for key, value in props.items():
-            if isinstance(value, bool):
-                if value:
-                    opening += f" {key}"
+        count = 1
+        if self._has_element_children(children) and self.format_output:
+            for child in children:
+                if child.name != "-":
+                    write("\n")
+                count += self._convert_recursive(child, write, level + 1)
+        else:
+            for child in children:
+                count += self._convert_recursive(child, write, level + 1)
+
+        write(self._end_tag(node_name, current_indent, True))
+        return count
+
+    def _convert_iterative(
+        self, nodes: List[Any], write: Callable[[str], Any], level: int
+    ) -> int:
+        format_output = self.format_output
+
+        # pending work: either a (node, level) pair to open or a string to
+        # write verbatim, such as a closing tag queued behind the children
+        stack: List[Any] = [(node, level) for node in reversed(nodes)]
+        count = 0
+
+        while stack:
+            item = stack.pop()
+            if type(item) is str:
+                write(item)
+                continue
+
+            node, level = item
+            count += 1
+            current_indent = self.indent * level if format_output else ""
+            node_name = node.name
+
+            if node_name == "!doctype":
+                write(self._doctype(node.args, current_indent))
+                continue
+
+            if node_name == "-":
+                write(" ".join(str(arg) for arg in node.args))
+                continue
+
+            children = node.children
+            if not self._write_start_tag(
+                node_name,
+                node.properties.items(),
+                node.args,
+                bool(children),
+                write,
+                current_indent,
+            ):
+                continue
+
+            if not children:
+                write(self._end_tag(node_name, current_indent, False))
+                continue
+
+            stack.append(self._end_tag(node_name, current_indent, True))
+
+            child_level = level + 1
+            if self._has_element_children(children) and format_output:
+                for child in reversed(children):
+                    stack.append((child, child_level))
+                    if child.name != "-":
+                        stack.append("\n")
             else:
-                escaped_value = str(value).replace('"', "&quot;")
-                opening += f' {key}="{escaped_value}"'
+                for child in reversed(children):
+                    stack.append((child, child_level))
 
-        if (
-            tag_name.lower() in self.VOID_ELEMENTS
-            and not node.args
-            and not node.children
-        ):
-            return f"{opening} />{newline}"
+        return count
+
+    def _is_silent(self, node: Any, statements: AbstractSet[str]) -> bool:
+        # a text node of statement placeholders and blanks
+        if node.name != "-" or not statements:
+            return False
+        text = " ".join(str(arg) for arg in node.args)
+        rest = _PLACEHOLDER.sub(
+            lambda match: "" if match.group() in statements else "x", text
+        )
+        return not rest.strip()
+
+    def _summarize_siblings(
+        self, siblings: List[Any], statements: AbstractSet[str]
+    ) -> Optional[Tuple[Set[str], bool]]:
+        # None without statements among them, else the names of the other
+        # element siblings and whether there is other text
+        names: Set[str] = set()
+        has_text = False
+        has_statements = False
+        for sibling in siblings:
+            if self._is_silent(sibling, statements):
+                has_statements = True
+            elif sibling.name in self.SPECIAL_NODES:
+                has_text = True
+            else:
+                names.add(sibling.name.lower())
+        return (names, has_text) if has_statements else None
+
+    def _may_omit_end_tag(
+        self,
+        name: str,
+        siblings: List[Any],
+        index: int,
+        parent: Optional[str],
+        summary: Optional[Tuple[Set[str], bool]],
+    ) -> bool:
+        rule = self.OPTIONAL_END_TAGS.get(name)
+        # a template without a parent may be included anywhere
+        if rule is None or parent is None:
+            return False
+        followers, may_end_parent = rule
+        if name == "p" and (parent in self.P_END_TAG_REQUIRED or "-" in parent):
+            may_end_parent = False
+
+        if summary is None:
+            if index + 1 == len(siblings):
+                return may_end_parent
+            following = siblings[index + 1].name
+            return (
+                following not in self.SPECIAL_NODES and following.lower() in followers
+            )
 
-        opening += ">"
+        # loops and conditionals may put any sibling after this one
+        names, has_text = summary
+        return may_end_parent and not has_text and names <= followers
 
-        content_parts: List[str] = []
+    def _convert_minified(
+        self,
+        nodes: List[Any],
+        write: Callable[[str], Any],
+        statements: AbstractSet[str],
+        parent: Optional[str],
+        preformatted: bool,
+    ) -> int:
+        # pending work: a (siblings, index, parent, summary, preformatted)
+        # tuple to open siblings[index], or an end tag to write verbatim
+        summary = self._summarize_siblings(nodes, statements)
+        stack: List[Any] = [
+            (nodes, index, parent, summary, preformatted)
+            for index in range(len(nodes) - 1, -1, -1)
+        ]
+        count = 0
 
-        if node.args:
-            text_content = " ".join(str(arg) for arg in node.args)
-            content_parts.append(text_content)
+        while stack:
+            item = stack.pop()
+            if type(item) is str:
+                write(item)
+                continue
 
-        if node.children:
+            siblings, index, parent, summary, preformatted = item
+            node = siblings[index]
+            count += 1
+            node_name = node.name
+
+            if node_name == "!doctype":
+                write(self._doctype(node.args, ""))
+                continue
+
+            if node_name == "-":
+                text = " ".join(str(arg) for arg in node.args)
+                if self._is_silent(node, statements):
+                    write("".join(m.group() for m in _PLACEHOLDER.finditer(text)))
+                elif preformatted:
+                    write(text)
+                else:
+                    write(_WHITESPACE.sub(" ", text))
+                continue
+
+            name = node_name.lower()
             children = node.children
-            has_element_children = any(
-                child.name not in self.SPECIAL_NODES or child.name == "-"
-                for child in children
+            preformatted = preformatted or name in self.PREFORMATTED
+            if not self._write_start_tag(
+                node_name,
+                node.properties.items(),
+                node.args,
+                bool(children),
+                write,
+                "",
+                minify=True,
+                preformatted=preformatted,
+            ):
+                continue
+
+            if not self._may_omit_end_tag(name, siblings, index, parent, summary):
+                stack.append(self._end_tag(node_name, "", True))
+            if children:
+                summary = self._summarize_siblings(children, statements)
+                for child in range(len(children) - 1, -1, -1):
+                    stack.append((children, child, name, summary, preformatted))
+
+        return count
+
+    def _convert_ir(self, ir: DocumentIR, write: Callable[[str], Any]) -> int:
+        opcodes = ir.opcodes
+        operands = ir.operands
+        strings = ir.strings
+        values = ir.values()
+        format_output = self.format_output
+        indent = self.indent
+
+        # per open element: its end tag, whether its children go on lines of
+        # their own and its level; the document itself is the bottom one
+        frames: List[Tuple[Optional[str], bool, int]] = [(None, False, -1)]
+        position = 0
+        count = 0
+        while True:
+            opcode = opcodes[position]
+            if opcode == CLOSE:
+                closer = frames.pop()[0]
+                if closer is None:
+                    return count
+                write(closer)
+                position += 1
+                continue
+
+            count += 1
+            _, on_lines, level = frames[-1]
+            level += 1
+            name = strings[operands[2 * position]]
+            end = operands[2 * position + 1]
+            if on_lines and name != "-":
+                write("\n")
+
+            position += 1
+            args: List[str] = []
+            while opcodes[position] == ARG:
+                args.append(values[operands[2 * position]])
+                position += 1
+
+            current_indent = indent * level if format_output else ""
+            if name == "!doctype":
+                write(self._doctype(args, current_indent))
+                position = end + 1
+                continue
+            if name == "-":
+                write(" ".join(args))
+                position = end + 1
+                continue
+
+            props: List[Tuple[str, Any]] = []
+            opcode = opcodes[position]
+            while opcode == ATTR or opcode == FLAG:
+                key = strings[operands[2 * position]]
+                value = operands[2 * position + 1]
+                props.append((key, values[value] if opcode == ATTR else bool(value)))
+                position += 1
+                opcode = opcodes[position]
+
+            children = opcode != CLOSE
+            if not self._write_start_tag(
+                name, props, args, children, write, current_indent
+            ):
+                position += 1
+                continue
+            if not children:
+                write(self._end_tag(name, current_indent, False))
+                position += 1
+                continue
+
+            # like _has_element_children, walking the children's OPENs
+            element_children = False
+            if format_output:
+                child = position
+                while opcodes[child] != CLOSE:
+                    if strings[operands[2 * child]] != "!doctype":
+                        element_children = True
+                        break
+                    child = operands[2 * child + 1] + 1
+            frames.append(
+                (self._end_tag(name, current_indent, True), element_children, level)
+            )
+
+    def convert_ir_to(
+        self,
+        ir: DocumentIR,
+        write: Callable[[str], Any],
+        statements: AbstractSet[str] = frozenset(),
+    ) -> int:
+        """Write the HTML for a document IR fragment by fragment.
+
+        The output is the same as `convert_document_to` gives for the nodes
+        the IR was built from, in every mode. Formatted and compact output
+        is written straight from the IR's arrays, without node objects.
+
+        Args:
+            ir: Document as built by `DocumentIR.from_nodes`
+            write: Callable receiving each HTML fragment
+            statements: Placeholders of tags rendering nothing, for minifying
+
+        Returns:
+            Number of nodes converted, including descendants
+        """
+        if self.minify:
+            return self.convert_document_to(ir.nodes, write, statements)
+        return self._convert_ir(ir, write)
+
+    def convert_events_to(
+        self,
+        events: Iterable[Tuple[str, Any]],
+        write: Callable[[str], Any],
+        statements: AbstractSet[str] = frozenset(),
+    ) -> int:
+        """Write the HTML for a stream of parse events as they come.
+
+        The output is the same as `convert_document_to` gives for the nodes
+        the events describe. Formatted and compact output is written while
+        the events are consumed, holding only the open elements, so memory is
+        bounded by nesting depth rather than document size; minifying needs
+        the siblings around each element and builds the tree first.
+
+        Args:
+            events: Events as yielded by `kdl_events.parse_events`
+            write: Callable receiving each HTML fragment
+            statements: Placeholders of tags rendering nothing, for minifying
+
+        Returns:
+            Number of nodes converted, including descendants
+        """
+        if self.minify:
+            return self._convert_minified(
+                build_nodes(events), write, statements, None, False
             )
 
-            if has_element_children and self.format_output:
-                for child in children:
-                    child_html = self.convert_node(child, level + 1)
-                    if child.name == "-":
-                        content_parts.append(child_html)
+        format_output = self.format_output
+        indent = self.indent
+        newline = "\n" if format_output else ""
+
+        # per open element: its name, its level, whether its children go
+        # on lines of their own (None until a child other than a doctype
+        # settles it, like _has_element_children) and the doctypes written
+        # before that; the document itself is the bottom one
+        frames: List[List[Any]] = [[None, -1, False, []]]
+        # the element whose start tag waits to learn if it has children
+        pending: Optional[Tuple[str, Dict[str, Any], List[str], str, int]] = None
+        name = ""
+        props: Dict[str, Any] = {}
+        # depth inside the children of a text or doctype node, not converted
+        skip = 0
+        count = 0
+
+        def settle(frame: List[Any], on_lines: bool) -> None:
+            frame[2] = on_lines
+            for doctype in frame[3]:
+                if on_lines:
+                    write(newline)
+                write(doctype)
+            frame[3] = []
+
+        for kind, value in events:
+            if skip:
+                if kind == START:
+                    skip += 1
+                elif kind == END:
+                    skip -= 1
+                continue
+
+            if kind == START:
+                if pending is not None:
+                    # the first child of the pending element
+                    tag_name, tag_props, args, current_indent, level = pending
+                    self._write_start_tag(
+                        tag_name, tag_props.items(), args, True, write, current_indent
+                    )
+                    frames.append(
+                        [tag_name, level, None if format_output else False, []]
+                    )
+                    pending = None
+                name = value
+                count += 1
+            elif kind == PROPS:
+                props = value
+            elif kind == ARGS:
+                args = [str(arg) for arg in value]
+                frame = frames[-1]
+                level = frame[1] + 1
+                current_indent = indent * level if format_output else ""
+                if name == "!doctype":
+                    doctype = self._doctype(args, current_indent)
+                    if frame[2] is None:
+                        frame[3].append(doctype)
                     else:
-                        content_parts.append(newline + child_html)
-            else:
-                for child in children:
-                    content_parts.append(self.convert_node(child, level + 1))
+                        if frame[2]:
+                            write(newline)
+                        write(doctype)
+                    skip = 1
+                    continue
 
-        if content_parts:
-            content = "".join(content_parts)
-            if node.children and self.format_output:
-                closing = f"{newline}{current_indent}</{tag_name}>{newline}"
+                if frame[2] is None:
+                    settle(frame, True)
+                if name == "-":
+                    write(" ".join(args))
+                    skip = 1
+                    continue
+                if frame[2]:
+                    write(newline)
+                pending = (name, props, args, current_indent, level)
+            elif pending is not None:
+                # an element without children
+                tag_name, tag_props, args, current_indent, _ = pending
+                if self._write_start_tag(
+                    tag_name, tag_props.items(), args, False, write, current_indent
+                ):
+                    write(self._end_tag(tag_name, current_indent, False))
+                pending = None
             else:
-                closing = f"</{tag_name}>{newline}"
-            return f"{opening}{content}{closing}"
-        else:
-            return f"{opening}</{tag_name}>{newline}"
+                frame = frames.pop()
+                if frame[2] is None:
+                    settle(frame, False)
+                current_indent = indent * frame[1] if format_output else ""
+                write(self._end_tag(frame[0], current_indent, True))
+        return count
 
     def convert_document(self, nodes: List[Any]) -> str:
         """Convert a list of KDL nodes to HTML.
@@ -121,10 +718,104 @@ class KdlToHtmlConverter:
             Complete HTML string
         """
         parts: List[str] = []
-        for node in nodes:
-            parts.append(self.convert_node(node, level=0))
+        self.convert_document_to(nodes, parts.append)
         return "".join(parts)
 
+    def convert_document_to(
+        self,
+        nodes: Union[List[Any], DocumentIR],
+        write: Callable[[str], Any],
+        statements: AbstractSet[str] = frozenset(),
+    ) -> int:
+        """Write the HTML for a list of KDL nodes fragment by fragment.
+
+        When minifying, optional end tags are omitted, attribute values are
+        written unquoted where that is unambiguous, void elements end in `>`
+        and runs of whitespace in text collapse to one space, except inside
+        `pre` and the like. Jinja placeholders are never altered, and values
+        holding one stay quoted. An end tag is only omitted if whatever can
+        follow at render time allows it; `statements` are the placeholders
+        of tags that render nothing (see `jinja_processor.find_statements`),
+        siblings made of them alone are dropped together with their
+        whitespace and let loops and conditionals be seen through.
+
+        Args:
+            nodes: List of KDL node objects, or a document IR
+            write: Callable receiving each HTML fragment, e.g. `list.append`
+                or the `write` method of a text file
+            statements: Placeholders of tags rendering nothing, for minifying
+
+        Returns:
+            Number of nodes converted, including descendants
+        """
+        if isinstance(nodes, DocumentIR):
+            return self.convert_ir_to(nodes, write, statements)
+        if self.minify:
+            return self._convert_minified(nodes, write, statements, None, False)
+        if self.iterative:
+            return self._convert_iterative(nodes, write, 0)
+
+        count = 0
+        for node in nodes:
+            count += self._convert_recursive(node, write, 0)
+        return count
+
+    def _fragment_name(self, node: Any) -> Optional[str]:
+        props: Dict[str, Any] = node.properties
+        name = props.get(self.FRAGMENT_PROPERTY, props.get("id"))
+        # a name computed at render time can't be looked up
+        if isinstance(name, str) and name and PLACEHOLDER_PREFIX not in name:
+            return name
+        return None
+
+    def convert_fragments(
+        self,
+        nodes: Union[List[Any], DocumentIR],
+        statements: AbstractSet[str] = frozenset(),
+    ) -> Dict[str, Tuple[str, int]]:
+        """Write the HTML of every named element on its own.
+
+        Elements are named by their `fragment` property or else by their
+        `id`, if it holds no Jinja; the first element with a name wins. Each
+        one is converted as a document of its own, the way
+        `convert_document_to` would convert it, but without the `fragment`
+        property.
+
+        Args:
+            nodes: List of KDL node objects, or a document IR
+            statements: Placeholders of tags rendering nothing, for minifying
+
+        Returns:
+            Mapping of names to the element's HTML with placeholders and the
+            number of Jinja tokens before it in the source
+        """
+        if isinstance(nodes, DocumentIR):
+            nodes = nodes.nodes
+        converter = self
+        if not self.fragments:
+            converter = copy.copy(self)
+            converter.fragments = True
+        fragments: Dict[str, Tuple[str, int]] = {}
+        # placeholders are numbered in source order, which is pre-order
+        position = 0
+        stack: List[Any] = list(reversed(nodes))
+        while stack:
+            node = stack.pop()
+            if node.name not in self.SPECIAL_NODES:
+                name = self._fragment_name(node)
+                if name is not None and name not in fragments:
+                    parts: List[str] = []
+                    converter.convert_document_to([node], parts.append, statements)
+                    fragments[name] = ("".join(parts), position)
+
+            props: Dict[str, Any] = node.properties
+            for value in (*props.values(), *node.args):
+                if isinstance(value, str):
+                    for number in _PLACEHOLDER.findall(value):
+                        position = max(position, int(number) + 1)
+            stack.extend(reversed(node.children))
+        return fragments
+
 
 def parse_and_convert(kdl_source: str, format_output: bool = True) -> str:
     """Parse KDL source and convert to HTML.
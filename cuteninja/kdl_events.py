@@ -0,0 +1,541 @@
+import re
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+
+class KdlParseError(Exception):
+    """Error raised when KDL parsing fails."""
+
+
+# event kinds, see `parse_events`
+START = "start"
+PROPS = "props"
+ARGS = "args"
+END = "end"
+
+Event = Tuple[str, Any]
+
+_SPACE = "\t \u00a0\u1680\u2000\u2001\u2002\u2003\u2004\u2005\u2006\u2007\u2008\u2009\u200a\u202f\u205f\u3000\ufeff"
+_NEWLINES = "\r\n\x85\x0b\x0c\u2028\u2029"
+_WHITESPACE = re.compile(f"[{_SPACE}]+")
+_NEWLINE = re.compile(f"\r\n|[{_NEWLINES}]")
+_TO_LINE_END = re.compile(f"[^{_NEWLINES}]*")
+# characters that can't be part of a bare identifier
+_IDENTIFIER = re.compile(f'[^{_SPACE}{_NEWLINES}\\\\/(){{}};\\[\\]"#=]+')
+_NUMBER = re.compile(
+    r"[+-]?(?:0x([0-9a-fA-F][0-9a-fA-F_]*)|0o([0-7][0-7_]*)|0b([01][01_]*)"
+    r"|[0-9][0-9_]*(\.[0-9][0-9_]*)?([eE][+-]?[0-9][0-9_]*)?)"
+)
+_LOOKS_NUMERIC = re.compile(r"[+-]?\.?[0-9]")
+_PLAIN_STRING = re.compile(r'"([^"\\\r\n\x85\x0b\x0c\u2028\u2029]*)"')
+_ESCAPE = re.compile(r"\\(?:u\{([0-9a-fA-F]{1,6})\}|([\s\S]))")
+_ESCAPES = {
+    "n": "\n",
+    "r": "\r",
+    "t": "\t",
+    "\\": "\\",
+    '"': '"',
+    "/": "/",
+    "b": "\b",
+    "f": "\f",
+    "s": " ",
+}
+_KEYWORDS: Dict[str, Any] = {
+    "true": True,
+    "false": False,
+    "null": None,
+    "inf": float("inf"),
+    "-inf": float("-inf"),
+    "nan": float("nan"),
+}
+# bare words KDL 1 reads as keywords
+_LEGACY_KEYWORDS = {"true": True, "false": False, "null": None}
+# where a node ends without a terminator of its own
+_NODE_END = re.compile(f"[{_NEWLINES};}}]|//|\\Z")
+
+
+class _Parser:
+    """Reads KDL node by node, keeping only the open nodes around."""
+
+    def __init__(self, source: str) -> None:
+        self.source = source
+        self.position = 0
+        # where the last reported node starts, for a caller following along
+        self.node_start = 0
+
+    def error(self, message: str, position: Optional[int] = None) -> KdlParseError:
+        if position is None:
+            position = self.position
+        line = self.source.count("\n", 0, position) + 1
+        column = position - self.source.rfind("\n", 0, position)
+        return KdlParseError(f"{message} at line {line}, column {column}")
+
+    def startswith(self, prefix: str) -> bool:
+        return self.source.startswith(prefix, self.position)
+
+    def peek(self) -> str:
+        return self.source[self.position : self.position + 1]
+
+    # whitespace and comments
+
+    def block_comment(self) -> None:
+        source = self.source
+        start = self.position
+        depth = 0
+        position = start
+        while True:
+            opening = source.find("/*", position)
+            closing = source.find("*/", position)
+            if closing < 0:
+                raise self.error("unterminated comment", start)
+            if 0 <= opening < closing:
+                depth += 1
+                position = opening + 2
+            else:
+                depth -= 1
+                position = closing + 2
+                if depth == 0:
+                    self.position = position
+                    return
+
+    def node_space(self) -> bool:
+        """Skip blanks, block comments and line continuations on one line."""
+        start = self.position
+        source = self.source
+        while True:
+            match = _WHITESPACE.match(source, self.position)
+            if match is not None:
+                self.position = match.end()
+            if self.startswith("/*"):
+                self.block_comment()
+            elif self.startswith("\\"):
+                self.position += 1
+                self.node_space()
+                if self.startswith("//"):
+                    self.position = _TO_LINE_END.match(source, self.position).end()
+                newline = _NEWLINE.match(source, self.position)
+                if newline is None and self.position < len(source):
+                    raise self.error("expected a newline after '\\'")
+                if newline is not None:
+                    self.position = newline.end()
+            elif match is None:
+                return self.position > start
+
+    def line_space(self) -> None:
+        """Skip blanks, comments, newlines and stray semicolons."""
+        source = self.source
+        while True:
+            self.node_space()
+            newline = _NEWLINE.match(source, self.position)
+            if newline is not None:
+                self.position = newline.end()
+            elif self.startswith("//"):
+                self.position = _TO_LINE_END.match(source, self.position).end()
+            elif self.startswith(";"):
+                self.position += 1
+            else:
+                return
+
+    # values
+
+    def string(self) -> Optional[str]:
+        """Read a quoted or raw string, None if there is none here."""
+        source = self.source
+        position = self.position
+        plain = _PLAIN_STRING.match(source, position)
+        if plain is not None and not source.startswith('"""', position):
+            self.position = plain.end()
+            return plain.group(1)
+
+        hashes = 0
+        if source.startswith("r", position) and source.startswith(
+            ('r"', "r#"), position
+        ):
+            # KDL 1 raw string
+            position += 1
+            while source.startswith("#", position + hashes):
+                hashes += 1
+            if not source.startswith('"', position + hashes):
+                return None
+            raw = True
+        elif source.startswith("#", position):
+            while source.startswith("#", position + hashes):
+                hashes += 1
+            if not source.startswith('"', position + hashes):
+                return None
+            raw = True
+        elif source.startswith('"', position):
+            raw = False
+        else:
+            return None
+
+        start = position + hashes
+        if source.startswith('"""', start) and _NEWLINE.match(source, start + 3):
+            closer = '"""' + "#" * hashes
+            end = self.find_closer(closer, start + 3, raw)
+            self.position = end + len(closer)
+            return self.dedent(source[start + 3 : end], raw)
+
+        closer = '"' + "#" * hashes
+        end = self.find_closer(closer, start + 1, raw)
+        self.position = end + len(closer)
+        text = source[start + 1 : end]
+        return text if raw else self.unescape(text, start)
+
+    def find_closer(self, closer: str, position: int, raw: bool) -> int:
+        source = self.source
+        while True:
+            end = source.find(closer, position)
+            if end < 0:
+                raise self.error("unterminated string", position)
+            if raw:
+                return end
+            # the quote is escaped if an odd number of backslashes precede it
+            backslashes = 0
+            while source[end - 1 - backslashes] == "\\":
+                backslashes += 1
+            if backslashes % 2 == 0:
+                return end
+            position = end + 1
+
+    def unescape(self, text: str, position: int) -> str:
+        if "\\" not in text:
+            return text
+
+        def replace(match: "re.Match[str]") -> str:
+            code, character = match.groups()
+            if code is not None:
+                return chr(int(code, 16))
+            if character in _ESCAPES:
+                return _ESCAPES[character]
+            if character in _SPACE or character in _NEWLINES:
+                # a whitespace escape, see below
+                return "\\" + character
+            raise self.error(f"invalid escape '\\{character}'", position)
+
+        text = _ESCAPE.sub(replace, text)
+        # a backslash before whitespace removes all of it
+        return re.sub(f"\\\\[{_SPACE}{_NEWLINES}]+", "", text)
+
+    def dedent(self, text: str, raw: bool) -> str:
+        lines = _NEWLINE.split(text)
+        # the first line is empty, the last holds the indentation
+        prefix = lines[-1]
+        if prefix.strip(_SPACE):
+            raise self.error("multi-line string must end on a line of its own")
+        body: List[str] = []
+        for line in lines[1:-1]:
+            if not line.strip(_SPACE):
+                body.append("")
+            elif line.startswith(prefix):
+                body.append(line[len(prefix) :])
+            else:
+                raise self.error("multi-line string line is not indented enough")
+        joined = "\n".join(body)
+        return joined if raw else self.unescape(joined, self.position)
+
+    def annotation(self) -> Optional[str]:
+        if not self.startswith("("):
+            return None
+        self.position += 1
+        self.node_space()
+        name = self.string()
+        if name is None:
+            name = self.identifier()
+        self.node_space()
+        if name is None or not self.startswith(")"):
+            raise self.error("invalid type annotation")
+        self.position += 1
+        return name
+
+    def identifier(self) -> Optional[str]:
+        match = _IDENTIFIER.match(self.source, self.position)
+        if match is None or _LOOKS_NUMERIC.match(match.group()):
+            return None
+        self.position = match.end()
+        return match.group()
+
+    def number(self) -> Any:
+        source = self.source
+        match = _NUMBER.match(source, self.position)
+        if match is None:
+            raise self.error("invalid value")
+        end = match.end()
+        if _IDENTIFIER.match(source, end):
+            raise self.error("invalid number")
+        self.position = end
+        text = match.group().replace("_", "")
+        hexadecimal, octal, binary, fraction, exponent = match.groups()
+        sign = -1 if text.startswith("-") else 1
+        if hexadecimal is not None:
+            return sign * int(hexadecimal.replace("_", ""), 16)
+        if octal is not None:
+            return sign * int(octal.replace("_", ""), 8)
+        if binary is not None:
+            return sign * int(binary.replace("_", ""), 2)
+        if fraction is not None or exponent is not None:
+            return float(text)
+        return int(text)
+
+    def value(self) -> Any:
+        annotation = self.annotation()
+        if annotation is not None:
+            self.node_space()
+        source = self.source
+        if source.startswith("#", self.position) and not source.startswith(
+            '"', self.position + 1
+        ):
+            match = _IDENTIFIER.match(source, self.position + 1)
+            if match is None or match.group() not in _KEYWORDS:
+                raise self.error("unknown keyword")
+            self.position = match.end()
+            value = _KEYWORDS[match.group()]
+        else:
+            value = self.string()
+            if value is None:
+                word = self.identifier()
+                if word is None:
+                    value = self.number()
+                else:
+                    value = _LEGACY_KEYWORDS.get(word, word)
+        if annotation is not None:
+            # what ckdl's annotated values turn into as text
+            return f"({annotation}){value}"
+        return value
+
+    # nodes
+
+    def header(self) -> Tuple[str, List[Any], Dict[str, Any]]:
+        """Read a node's name, arguments and properties."""
+        self.annotation()
+        name = self.string()
+        if name is None:
+            name = self.identifier()
+        if name is None:
+            raise self.error("expected a node name")
+
+        args: List[Any] = []
+        props: Dict[str, Any] = {}
+        source = self.source
+        while True:
+            spaced = self.node_space()
+            if _NODE_END.match(source, self.position) or self.startswith("{"):
+                return name, args, props
+            skipped = False
+            if self.startswith("/-"):
+                resume = self.position
+                self.position += 2
+                self.node_space()
+                if self.startswith("{"):
+                    # a slashdashed block of children, the caller's to skip
+                    self.position = resume
+                    return name, args, props
+                skipped = True
+            elif not spaced:
+                raise self.error("expected a space")
+
+            start = self.position
+            key = None
+            if not self.startswith("("):
+                key = self.string()
+                if key is None:
+                    key = self.identifier()
+            if key is not None:
+                self.node_space()
+                if self.startswith("="):
+                    self.position += 1
+                    self.node_space()
+                    value = self.value()
+                    if not skipped:
+                        props[key] = value
+                    continue
+            self.position = start
+            value = self.value()
+            if not skipped:
+                args.append(value)
+
+    def events(self) -> Iterator[Event]:
+        source = self.source
+        # open blocks of children: node name and whether it is reported, and
+        # for a slashdashed block the header of the node it belongs to
+        stack: List[Tuple[str, bool, Optional[Tuple[Any, ...]]]] = []
+        while True:
+            self.line_space()
+            if self.position >= len(source):
+                if stack:
+                    raise self.error("unclosed '{'")
+                return
+            if self.startswith("}"):
+                if not stack:
+                    raise self.error("unexpected '}'")
+                self.position += 1
+                name, emit, pending = stack.pop()
+                if pending is not None:
+                    yield from self.finish(*pending, stack)
+                    continue
+                if emit:
+                    yield (END, name)
+                self.node_space()
+                if self.startswith("/-"):
+                    # slashdashed children after the children
+                    self.position += 2
+                    self.node_space()
+                    if not self.startswith("{"):
+                        raise self.error("expected '{'")
+                    self.position += 1
+                    stack.append((name, False, None))
+                elif not _NODE_END.match(source, self.position):
+                    raise self.error("expected the end of the node")
+                continue
+
+            emit = not stack or stack[-1][1]
+            if emit:
+                self.node_start = self.position
+            if self.startswith("/-"):
+                self.position += 2
+                self.line_space()
+                emit = False
+            name, args, props = self.header()
+            yield from self.finish(name, args, props, emit, stack)
+
+    def finish(
+        self,
+        name: str,
+        args: List[Any],
+        props: Dict[str, Any],
+        emit: bool,
+        stack: List[Tuple[str, bool, Optional[Tuple[Any, ...]]]],
+    ) -> Iterator[Event]:
+        """Report a node whose header was read, and open its children."""
+        self.node_space()
+        if self.startswith("/-"):
+            self.position += 2
+            self.node_space()
+            if not self.startswith("{"):
+                raise self.error("expected '{'")
+            self.position += 1
+            stack.append((name, False, (name, args, props, emit)))
+            return
+        if emit:
+            yield (START, name)
+            yield (PROPS, props)
+            yield (ARGS, args)
+        if self.startswith("{"):
+            self.position += 1
+            stack.append((name, emit, None))
+            return
+        if not _NODE_END.match(self.source, self.position):
+            raise self.error("expected the end of the node")
+        if self.startswith(";"):
+            self.position += 1
+        if emit:
+            yield (END, name)
+
+
+def parse_events(source: str) -> Iterator[Event]:
+    """Parse KDL into a stream of events, without building a tree.
+
+    For every node, `(START, name)`, `(PROPS, properties)` and
+    `(ARGS, arguments)` are yielded once its header has been read, then the
+    events of its children, then `(END, name)`. Slashdashed nodes,
+    arguments, properties and children yield nothing. Besides the source,
+    only the nodes that are still open are held, so memory is bounded by
+    the nesting depth.
+
+    KDL 1 and 2 are both accepted, like ckdl's `version="any"`: values are
+    str, int, float, bool or None; type annotations are dropped from node
+    names and kept in front of values as text, as ckdl prints them.
+
+    Args:
+        source: KDL markup as string
+
+    Yields:
+        Events in document order
+
+    Raises:
+        KdlParseError: If the source is not valid KDL, once the parser gets
+            there
+    """
+    if source.startswith("\ufeff"):
+        source = source[1:]
+    return _Parser(source).events()
+
+
+class Node:
+    """A KDL node built by `parse_document`, shaped like ckdl's."""
+
+    __slots__ = ("name", "args", "properties", "children")
+
+    def __init__(
+        self,
+        name: str,
+        args: List[Any],
+        properties: Dict[str, Any],
+        children: List["Node"],
+    ) -> None:
+        self.name = name
+        self.args = args
+        self.properties = properties
+        self.children = children
+
+    def __repr__(self) -> str:
+        return f"<Node {self.name}>"
+
+
+class Document(NamedTuple):
+    """A KDL document built by `parse_document`."""
+
+    nodes: List[Node]
+
+
+def build_nodes(events: Iterable[Event]) -> List[Node]:
+    """Build the tree of nodes an event stream describes.
+
+    Args:
+        events: Events as yielded by `parse_events`
+
+    Returns:
+        The top-level nodes
+    """
+    nodes: List[Node] = []
+    stack: List[List[Node]] = [nodes]
+    for kind, value in events:
+        if kind == START:
+            node = Node(value, [], {}, [])
+            stack[-1].append(node)
+            stack.append(node.children)
+        elif kind == PROPS:
+            stack[-2][-1].properties = value
+        elif kind == ARGS:
+            stack[-2][-1].args = value
+        else:
+            stack.pop()
+    return nodes
+
+
+def parse_document(source: str) -> Document:
+    """Parse KDL into a tree of nodes with the pure-Python parser.
+
+    Args:
+        source: KDL markup as string
+
+    Returns:
+        The document
+
+    Raises:
+        KdlParseError: If the source is not valid KDL
+    """
+    return Document(build_nodes(parse_events(source)))
+
+
+__all__ = [
+    "ARGS",
+    "END",
+    "PROPS",
+    "START",
+    "Document",
+    "KdlParseError",
+    "Node",
+    "build_nodes",
+    "parse_document",
+    "parse_events",
+]
@@ -0,0 +1,301 @@
+import asyncio
+import hashlib
+import posixpath
+import weakref
+from concurrent.futures import Executor
+from functools import partial
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    List,
+    MutableMapping,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+)
+
+from jinja2 import BaseLoader, Environment, Template, TemplateNotFound
+
+from .aio import get_executor, single_flight
+from .cache import get_compile_cache
+from .core import KdlTemplate
+from .flatten import DependencyGraph, flatten
+
+UptodateFunc = Optional[Callable[[], bool]]
+
+
+def _checksum(source: str) -> str:
+    return hashlib.sha256(source.encode("utf-8", "surrogatepass")).hexdigest()
+
+
+class KdlLoader(BaseLoader):
+    """Jinja2 loader that converts KDL templates to HTML on load.
+
+    Wraps another loader such as `FileSystemLoader` or `PackageLoader`.
+    Templates whose name ends in one of `extensions` are run through
+    `KdlTemplate`; everything else is passed through unchanged, so HTML and
+    KDL templates can include and extend each other.
+
+    The returned `uptodate` callable first asks the wrapped loader, which
+    usually compares modification times. When that reports a change, the
+    source is re-read and compared by content hash, so touching a file
+    without editing it keeps Jinja's compiled template.
+
+    With `flatten=True`, KDL templates included or extended by literal name
+    are inlined before conversion (see `flatten.flatten`), so Jinja does not
+    load them again on every render. `partials/nav.html` refers to
+    `partials/nav.kdl` when there is no such HTML template. A template is
+    out of date as soon as anything inlined into it changes.
+
+    Args:
+        loader: Loader that provides the raw template sources
+        extensions: File name suffixes treated as KDL
+        format_output: Whether to format the output with indentation
+        indent: Indentation used for each nesting level
+        use_cache: Whether to use the compile caches
+        flatten: Whether to inline literal includes and layouts
+    """
+
+    has_source_access = True
+
+    loader: BaseLoader
+    extensions: Tuple[str, ...]
+    format_output: bool
+    indent: str
+    use_cache: bool
+    flatten: bool
+    graph: DependencyGraph
+
+    def __init__(
+        self,
+        loader: BaseLoader,
+        extensions: Sequence[str] = (".kdl",),
+        format_output: bool = True,
+        indent: str = "    ",
+        use_cache: bool = True,
+        flatten: bool = False,
+    ) -> None:
+        self.loader = loader
+        self.extensions = tuple(extensions)
+        self.format_output = format_output
+        self.indent = indent
+        self.use_cache = use_cache
+        self.flatten = flatten
+        self.graph = DependencyGraph()
+        # compile cache key of every flattened template, for invalidate
+        self._keys: Dict[str, str] = {}
+
+    def is_kdl(self, template: str) -> bool:
+        """Check whether a template name refers to a KDL source.
+
+        Args:
+            template: Template name
+
+        Returns:
+            True when the name ends in one of the KDL extensions
+        """
+        return template.endswith(self.extensions)
+
+    def get_source(
+        self, environment: Environment, template: str
+    ) -> Tuple[str, Optional[str], UptodateFunc]:
+        source, filename, uptodate = self.loader.get_source(environment, template)
+        if not self.is_kdl(template):
+            return source, filename, uptodate
+
+        uptodates = [uptodate]
+        if self.flatten:
+            source, uptodates = self._flatten(environment, template, source, uptodate)
+        compiled = KdlTemplate(
+            source,
+            format_output=self.format_output,
+            indent=self.indent,
+            use_cache=self.use_cache,
+        )
+        if self.flatten and self.use_cache:
+            self._keys[template] = compiled.cache_key
+        return (
+            compiled.render(),
+            filename,
+            self._make_uptodate(environment, template, source, uptodates),
+        )
+
+    def invalidate(self, template: str) -> Set[str]:
+        """Drop the compiled templates a changed template was inlined into.
+
+        Jinja notices changes through `uptodate` on its own; this also drops
+        the stale entries from the compile cache right away.
+
+        Args:
+            template: Name of the KDL template that changed
+
+        Returns:
+            The template and every flattened template that inlined it
+        """
+        affected = self.graph.affected([template])
+        cache = get_compile_cache()
+        for name in affected:
+            key = self._keys.pop(name, None)
+            if key is not None:
+                cache.invalidate(key)
+        return affected
+
+    def _find_kdl(
+        self, environment: Environment, name: str
+    ) -> Optional[Tuple[str, str, UptodateFunc]]:
+        candidates = [name]
+        if not self.is_kdl(name):
+            try:
+                self.loader.get_source(environment, name)
+            except TemplateNotFound:
+                stem = posixpath.splitext(name)[0]
+                candidates = [stem + extension for extension in self.extensions]
+            else:
+                return None
+        for candidate in candidates:
+            try:
+                source, _, uptodate = self.loader.get_source(environment, candidate)
+            except TemplateNotFound:
+                continue
+            return candidate, source, uptodate
+        return None
+
+    def _flatten(
+        self,
+        environment: Environment,
+        template: str,
+        source: str,
+        uptodate: UptodateFunc,
+    ) -> Tuple[str, List[UptodateFunc]]:
+        uptodates = [uptodate]
+        found: Dict[str, str] = {}
+
+        def load(name: str) -> Optional[str]:
+            result = self._find_kdl(environment, name)
+            if result is None:
+                return None
+            found[name], kdl, dependency_uptodate = result
+            uptodates.append(dependency_uptodate)
+            return kdl
+
+        flattened = flatten(source, load, template)
+        self.graph.set_dependencies(
+            template, (found[name] for name in flattened.dependencies)
+        )
+        return flattened.source, uptodates
+
+    def _read(
+        self, environment: Environment, template: str
+    ) -> Tuple[str, List[UptodateFunc]]:
+        source, _, uptodate = self.loader.get_source(environment, template)
+        if self.flatten:
+            return self._flatten(environment, template, source, uptodate)
+        return source, [uptodate]
+
+    def _make_uptodate(
+        self,
+        environment: Environment,
+        template: str,
+        source: str,
+        uptodates: List[UptodateFunc],
+    ) -> UptodateFunc:
+        if uptodates[0] is None:
+            return None
+
+        checksum = _checksum(source)
+        current = uptodates
+
+        def check() -> bool:
+            nonlocal current
+            if all(uptodate is None or uptodate() for uptodate in current):
+                return True
+            try:
+                new_source, new_uptodates = self._read(environment, template)
+            except TemplateNotFound:
+                return False
+            if _checksum(new_source) != checksum:
+                return False
+            # content unchanged, only timestamps moved
+            current = new_uptodates
+            return True
+
+        return check
+
+    def list_templates(self) -> List[str]:
+        return self.loader.list_templates()
+
+
+class AsyncKdlLoader(KdlLoader):
+    """`KdlLoader` that can load templates without blocking an event loop.
+
+    `get_template_async` reads, converts and compiles a template in an
+    executor, and concurrent loads of the same template share one run.
+    Loading through `Environment.get_template` still works as usual.
+
+    Args:
+        loader: Loader that provides the raw template sources
+        extensions: File name suffixes treated as KDL
+        format_output: Whether to format the output with indentation
+        indent: Indentation used for each nesting level
+        use_cache: Whether to use the compile caches
+        executor: Executor to load in, defaults to the one from
+            `aio.set_executor`
+        flatten: Whether to inline literal includes and layouts
+    """
+
+    executor: Optional[Executor]
+
+    def __init__(
+        self,
+        loader: BaseLoader,
+        extensions: Sequence[str] = (".kdl",),
+        format_output: bool = True,
+        indent: str = "    ",
+        use_cache: bool = True,
+        executor: Optional[Executor] = None,
+        flatten: bool = False,
+    ) -> None:
+        super().__init__(loader, extensions, format_output, indent, use_cache, flatten)
+        self.executor = executor
+
+    async def get_template_async(
+        self,
+        environment: Environment,
+        name: str,
+        parent: Optional[str] = None,
+        globals: Optional[MutableMapping[str, Any]] = None,
+    ) -> Template:
+        """Load a template like `Environment.get_template` off the event loop.
+
+        Args:
+            environment: Environment using this loader
+            name: Template name
+            parent: Name of the template importing this one
+            globals: Extra globals for the template
+
+        Returns:
+            The compiled template
+        """
+        if (
+            environment.cache is not None
+            and environment.loader is not None
+            and not environment.auto_reload
+            and parent is None
+            and globals is None
+        ):
+            # the key Environment uses, nothing can be stale without auto_reload
+            cached = environment.cache.get((weakref.ref(environment.loader), name))
+            if cached is not None:
+                return cached
+
+        load = partial(environment.get_template, name, parent, globals)
+        if globals is not None:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor or get_executor(), load)
+        flight = ("template", id(environment), name, parent)
+        return await single_flight(flight, load, self.executor)
+
+
+__all__ = ["AsyncKdlLoader", "KdlLoader"]
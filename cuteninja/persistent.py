@@ -0,0 +1,306 @@
+import fnmatch
+import json
+import os
+import tempfile
+from typing import BinaryIO, List, Optional, Tuple
+
+from .cache import CompiledTemplate, make_key
+from .utils import atomic_write
+from .version import __version__
+
+# bump when the on-disk layout changes
+CACHE_FORMAT = 1
+CACHE_MAGIC = b"cuteninja-cc\0" + str(CACHE_FORMAT).encode("ascii") + b"\n"
+
+
+class Bucket:
+    """Holds the compiled template for one cache key.
+
+    Buckets are created by a `PersistentCache` and handed to its load and
+    dump routines. Payloads that are truncated, corrupted or belong to
+    another key are rejected and leave the bucket empty.
+    """
+
+    key: str
+    compiled: Optional[CompiledTemplate]
+
+    def __init__(self, key: str) -> None:
+        self.key = key
+        self.reset()
+
+    def reset(self) -> None:
+        """Unload the compiled template."""
+        self.compiled = None
+
+    def load(self, f: BinaryIO) -> None:
+        """Load the compiled template from a binary file object.
+
+        Args:
+            f: File object positioned at the start of a cache entry
+        """
+        self.loads(f.read())
+
+    def loads(self, data: bytes) -> None:
+        """Load the compiled template from bytes.
+
+        Args:
+            data: Serialized cache entry
+        """
+        self.reset()
+        if not data.startswith(CACHE_MAGIC):
+            return
+        try:
+            payload = json.loads(
+                data[len(CACHE_MAGIC) :].decode("utf-8", "surrogatepass")
+            )
+            if payload["key"] != self.key or payload["version"] != __version__:
+                return
+            output = payload["output"]
+            token_map = payload["tokens"]
+            folded = payload.get("folded", [])
+        except (ValueError, KeyError, TypeError):
+            return
+        if (
+            not isinstance(output, str)
+            or not isinstance(token_map, dict)
+            or not isinstance(folded, list)
+            or not all(isinstance(value, str) for value in folded)
+            or not all(
+                isinstance(key, str) and isinstance(value, str)
+                for key, value in token_map.items()
+            )
+        ):
+            return
+        self.compiled = CompiledTemplate(output, token_map, tuple(folded))
+
+    def dump(self, f: BinaryIO) -> None:
+        """Write the compiled template to a binary file object.
+
+        Args:
+            f: Writable binary file object
+        """
+        f.write(self.dumps())
+
+    def dumps(self) -> bytes:
+        """Serialize the compiled template.
+
+        Returns:
+            Serialized cache entry
+
+        Raises:
+            TypeError: When the bucket is empty
+        """
+        if self.compiled is None:
+            raise TypeError("can't write empty bucket")
+        payload = {
+            "key": self.key,
+            "version": __version__,
+            "output": self.compiled.output,
+            "tokens": self.compiled.token_map,
+            "folded": self.compiled.folded,
+        }
+        return CACHE_MAGIC + json.dumps(payload, ensure_ascii=False).encode(
+            "utf-8", "surrogatepass"
+        )
+
+
+class PersistentCache:
+    """Base class for caches that keep compiled templates across processes.
+
+    Subclasses implement `load_bucket` and `dump_bucket`; key derivation and
+    validation of the stored payload are handled here and in `Bucket`.
+    """
+
+    def load_bucket(self, bucket: Bucket) -> None:
+        """Fill the bucket from the backing store, leave it empty on a miss.
+
+        Args:
+            bucket: Bucket to fill
+        """
+        raise NotImplementedError()
+
+    def dump_bucket(self, bucket: Bucket) -> None:
+        """Write the bucket to the backing store.
+
+        Args:
+            bucket: Bucket holding a compiled template
+        """
+        raise NotImplementedError()
+
+    def clear(self) -> None:
+        """Remove every entry from the backing store."""
+
+    def get_cache_key(self, source: str, *options: object) -> str:
+        """Build the key for a source; includes the cuteninja version.
+
+        Args:
+            source: KDL markup as string
+            *options: Converter options that influence the output
+
+        Returns:
+            Hex digest identifying the compiled result
+        """
+        return make_key(source, __version__, *options)
+
+    def get_bucket(self, source: str, *options: object) -> Bucket:
+        """Get a bucket for a source, loaded from the backing store if present.
+
+        Args:
+            source: KDL markup as string
+            *options: Converter options that influence the output
+
+        Returns:
+            Bucket for the source, possibly empty
+        """
+        bucket = Bucket(self.get_cache_key(source, *options))
+        self.load_bucket(bucket)
+        return bucket
+
+    def set_bucket(self, bucket: Bucket) -> None:
+        """Store a filled bucket.
+
+        Args:
+            bucket: Bucket holding a compiled template
+        """
+        self.dump_bucket(bucket)
+
+
+class FileSystemCache(PersistentCache):
+    """Persistent cache that stores one file per compiled template.
+
+    Writes go through a temporary file and a rename, so several processes
+    can share the same directory. If no directory is given, a per-user
+    directory in the system temp directory is used.
+
+    Args:
+        directory: Directory holding the cache files
+        pattern: File name pattern, `%s` is replaced with the cache key
+        max_bytes: Size budget enforced by `prune` when no limit is passed
+    """
+
+    directory: str
+    pattern: str
+    max_bytes: Optional[int]
+
+    def __init__(
+        self,
+        directory: Optional[str] = None,
+        pattern: str = "__cuteninja_%s.cache",
+        max_bytes: Optional[int] = None,
+    ) -> None:
+        if directory is None:
+            directory = self._get_default_cache_dir()
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.pattern = pattern
+        self.max_bytes = max_bytes
+
+    def _get_default_cache_dir(self) -> str:
+        tmpdir = tempfile.gettempdir()
+        if not hasattr(os, "getuid"):
+            return os.path.join(tmpdir, "_cuteninja-cache")
+        return os.path.join(tmpdir, f"_cuteninja-cache-{os.getuid()}")
+
+    def _get_cache_filename(self, bucket: Bucket) -> str:
+        return os.path.join(self.directory, self.pattern % (bucket.key,))
+
+    def load_bucket(self, bucket: Bucket) -> None:
+        filename = self._get_cache_filename(bucket)
+        try:
+            f = open(filename, "rb")
+        except (FileNotFoundError, IsADirectoryError, PermissionError):
+            return
+
+        with f:
+            bucket.load(f)
+
+        if bucket.compiled is None:
+            # unreadable entry: drop it so the next dump replaces it
+            try:
+                os.remove(filename)
+            except OSError:
+                pass
+
+    def dump_bucket(self, bucket: Bucket) -> None:
+        atomic_write(self._get_cache_filename(bucket), bucket.dumps())
+
+    def _list_entries(self) -> List[Tuple[float, int, str]]:
+        entries: List[Tuple[float, int, str]] = []
+        pattern = self.pattern % ("*",)
+        for entry in os.scandir(self.directory):
+            if not fnmatch.fnmatch(entry.name, pattern):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def prune(self, max_bytes: Optional[int] = None) -> int:
+        """Delete the oldest entries until the cache fits in the size budget.
+
+        Args:
+            max_bytes: Size budget, defaults to the one given at construction
+
+        Returns:
+            Number of files removed
+        """
+        if max_bytes is None:
+            max_bytes = self.max_bytes
+        if max_bytes is None:
+            return 0
+
+        entries = sorted(self._list_entries())
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, path in entries:
+            if total <= max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        return removed
+
+    def clear(self) -> None:
+        for _, _, path in self._list_entries():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+_persistent_cache: Optional[PersistentCache] = None
+
+
+def get_persistent_cache() -> Optional[PersistentCache]:
+    """Get the process-wide persistent cache, if one is configured.
+
+    Returns:
+        The configured PersistentCache or None
+    """
+    return _persistent_cache
+
+
+def set_persistent_cache(cache: Optional[PersistentCache]) -> None:
+    """Configure the persistent cache used by `KdlTemplate` and `render_kdl`.
+
+    Args:
+        cache: PersistentCache instance, or None to disable it
+    """
+    global _persistent_cache
+    _persistent_cache = cache
+
+
+__all__ = [
+    "Bucket",
+    "FileSystemCache",
+    "PersistentCache",
+    "get_persistent_cache",
+    "set_persistent_cache",
+]
@@ -0,0 +1,178 @@
+import sys
+from bisect import bisect_right
+from time import perf_counter
+from types import FrameType
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Tuple
+
+from .sourcemap import SourceMap
+
+if TYPE_CHECKING:
+    from jinja2 import Environment
+
+    from .core import KdlTemplate
+
+
+class RenderProfile:
+    """Time spent rendering a template, per line of its KDL source.
+
+    Time is self time: a line calling a macro or block defined in the same
+    template is not charged for the lines of the macro. Calls into Python
+    code, filters and other templates are charged to the calling line.
+    Lines that could not be mapped back to the KDL source are kept under
+    `None`.
+    """
+
+    output: str
+    seconds: Dict[Optional[int], float]
+    hits: Dict[Optional[int], int]
+
+    def __init__(
+        self,
+        output: str,
+        seconds: Dict[Optional[int], float],
+        hits: Dict[Optional[int], int],
+    ) -> None:
+        self.output = output
+        self.seconds = seconds
+        self.hits = hits
+
+    @property
+    def total_seconds(self) -> float:
+        return sum(self.seconds.values())
+
+    def top(self, limit: int = 10) -> List[Tuple[Optional[int], float, int]]:
+        """Get the most expensive lines.
+
+        Args:
+            limit: Maximum number of lines to return
+
+        Returns:
+            (KDL line, seconds, times executed) tuples, slowest first
+        """
+        ranked = sorted(self.seconds.items(), key=lambda item: item[1], reverse=True)
+        return [(line, seconds, self.hits.get(line, 0)) for line, seconds in ranked][
+            :limit
+        ]
+
+    def report(self, source: Optional[str] = None, limit: int = 10) -> str:
+        """Format the most expensive lines as a table.
+
+        Args:
+            source: KDL source to quote the lines from
+            limit: Maximum number of lines to show
+
+        Returns:
+            Human readable table
+        """
+        lines = source.split("\n") if source is not None else []
+        total = self.total_seconds or 1.0
+        rows = [f"{'line':>6} {'ms':>10} {'%':>6} {'hits':>7}  source"]
+        for line, seconds, hits in self.top(limit):
+            text = ""
+            if line is not None and 0 < line <= len(lines):
+                text = lines[line - 1].strip()
+            rows.append(
+                f"{line if line is not None else '-':>6} {seconds * 1000:>10.3f} "
+                f"{seconds / total * 100:>5.1f}% {hits:>7}  {text}"
+            )
+        return "\n".join(rows)
+
+
+class _LineTracer:
+    """`sys.settrace` hook charging elapsed time to the KDL line running."""
+
+    def __init__(
+        self,
+        namespace: Dict[str, Any],
+        debug_info: List[Tuple[int, int]],
+        source_map: SourceMap,
+    ) -> None:
+        self.namespace = namespace
+        self.template_lines = [template_line for template_line, _ in debug_info]
+        self.code_lines = [code_line for _, code_line in debug_info]
+        self.source_map = source_map
+        self.seconds: Dict[Optional[int], float] = {}
+        self.hits: Dict[Optional[int], int] = {}
+        self.kdl_lines: Dict[int, Optional[int]] = {}
+        self.line: Optional[int] = None
+        self.active = False
+        self.last = 0.0
+
+    def kdl_line(self, code_line: int) -> Optional[int]:
+        # same lookup as jinja2.Template.get_corresponding_lineno
+        index = bisect_right(self.code_lines, code_line) - 1
+        output_line = self.template_lines[index] if index >= 0 else 1
+        return self.source_map.kdl_line(output_line)
+
+    def switch(self, code_line: Optional[int]) -> None:
+        now = perf_counter()
+        if self.active:
+            self.seconds[self.line] = self.seconds.get(self.line, 0.0) + now - self.last
+        if code_line is None:
+            self.active = False
+        else:
+            line = self.kdl_lines.get(code_line, -1)
+            if line == -1:
+                line = self.kdl_lines[code_line] = self.kdl_line(code_line)
+            self.line = line
+            self.active = True
+            self.hits[line] = self.hits.get(line, 0) + 1
+        self.last = perf_counter()
+
+    def trace(self, frame: FrameType, event: str, arg: Any) -> Optional[Callable]:
+        # blocks and macros share the module namespace of the template
+        if frame.f_globals is not self.namespace:
+            return None
+        self.switch(frame.f_lineno)
+        return self.trace_lines
+
+    def trace_lines(self, frame: FrameType, event: str, arg: Any) -> Callable:
+        if event == "line":
+            self.switch(frame.f_lineno)
+        elif event == "return":
+            caller = frame.f_back
+            if caller is not None and caller.f_globals is self.namespace:
+                self.switch(caller.f_lineno)
+            else:
+                self.switch(None)
+        return self.trace_lines
+
+
+def profile_render(
+    template: "KdlTemplate",
+    environment: Optional["Environment"] = None,
+    **context: Any,
+) -> RenderProfile:
+    """Render a template while timing every line of its KDL source.
+
+    The generated Jinja code is traced with `sys.settrace`, so rendering is
+    much slower than usual and only the calling thread is profiled. Jinja's
+    debug information maps the code back to lines of the HTML, and the
+    template's source map maps those to KDL lines.
+
+    Args:
+        template: Template to render, its source must not be released
+        environment: Environment to compile in, as for `KdlTemplate.to_jinja`
+        **context: Variables passed to the template
+
+    Returns:
+        The rendered output with the time spent per KDL line
+    """
+    jinja_template = template.to_jinja(environment)
+    tracer = _LineTracer(
+        jinja_template.root_render_func.__globals__,
+        jinja_template.debug_info,
+        template.source_map(),
+    )
+
+    previous = sys.gettrace()
+    sys.settrace(tracer.trace)
+    try:
+        output = jinja_template.render(**context)
+    finally:
+        sys.settrace(previous)
+        tracer.switch(None)
+    return RenderProfile(output, tracer.seconds, tracer.hits)
+
+
+__all__ = ["RenderProfile", "profile_render"]
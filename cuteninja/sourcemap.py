@@ -0,0 +1,103 @@
+from bisect import bisect_right
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from .jinja_processor import Extraction, _placeholder_pattern
+
+
+class Span(NamedTuple):
+    """Where one Jinja token ended up in the output and where it came from."""
+
+    output_start: int
+    output_end: int
+    source_start: int
+    source_end: int
+
+
+def _line_starts(text: str) -> List[int]:
+    starts = [0]
+    index = text.find("\n")
+    while index >= 0:
+        starts.append(index + 1)
+        index = text.find("\n", index + 1)
+    return starts
+
+
+class SourceMap:
+    """Links a compiled template's output back to its KDL source.
+
+    Every Jinja token is recorded with its offsets in the output and in the
+    source, and every output line holding a token is mapped to the KDL line
+    the token was written on. Lines of plain HTML are not mapped, because the
+    KDL parser does not report node positions.
+    """
+
+    __slots__ = ("spans", "_lines")
+
+    spans: List[Span]
+    _lines: Dict[int, int]
+
+    def __init__(self, spans: List[Span], output: str, source: str) -> None:
+        self.spans = spans
+        self._lines = {}
+        output_lines = _line_starts(output)
+        source_lines = _line_starts(source)
+        for span in spans:
+            output_line = bisect_right(output_lines, span.output_start)
+            source_line = bisect_right(source_lines, span.source_start)
+            # a token spanning lines maps each of its lines
+            count = source.count("\n", span.source_start, span.source_end)
+            for offset in range(count + 1):
+                self._lines.setdefault(output_line + offset, source_line + offset)
+
+    def __len__(self) -> int:
+        return len(self._lines)
+
+    def __iter__(self) -> Iterator[Tuple[int, int]]:
+        return iter(sorted(self._lines.items()))
+
+    def kdl_line(self, output_line: int) -> Optional[int]:
+        """Get the KDL line an output line was compiled from.
+
+        Args:
+            output_line: 1-based line number in the output
+
+        Returns:
+            1-based line number in the KDL source, None if it is not known
+        """
+        return self._lines.get(output_line)
+
+
+def restore_with_spans(html: str, extraction: Extraction) -> Tuple[str, List[Span]]:
+    """Restore Jinja tokens in HTML like `JinjaProcessor.restore_jinja`, recording spans.
+
+    Args:
+        html: HTML with placeholders
+        extraction: Result of scanning the KDL source
+
+    Returns:
+        The HTML with restored Jinja syntax and a span for every token in it
+    """
+    token_map = extraction.token_map
+    if not token_map:
+        return html, []
+
+    first = next(iter(token_map))
+    prefix = first[: first.rindex("_", 0, len(first) - 2) + 1]
+
+    parts: List[str] = []
+    spans: List[Span] = []
+    length = 0
+    last = 0
+    for match in _placeholder_pattern(prefix).finditer(html):
+        token = token_map.get(match.group())
+        if token is None:
+            continue
+        parts.append(html[last : match.start()])
+        length += match.start() - last
+        index = int(match.group()[len(prefix) : -2])
+        spans.append(Span(length, length + len(token), *extraction.offsets[index]))
+        parts.append(token)
+        length += len(token)
+        last = match.end()
+    parts.append(html[last:])
+    return "".join(parts), spans
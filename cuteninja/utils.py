@@ -0,0 +1,28 @@
+import os
+import tempfile
+
+
+def atomic_write(path: str, data: bytes) -> None:
+    """Write bytes to a file so that readers never see a partial file.
+
+    The data is written to a temporary file in the same directory and then
+    renamed over the destination, which is atomic on POSIX and Windows.
+
+    Args:
+        path: Destination file path
+        data: File contents
+    """
+    directory = os.path.dirname(path) or "."
+    fd, tmp_path = tempfile.mkstemp(
+        dir=directory, prefix=".tmp-", suffix=os.path.basename(path)
+    )
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
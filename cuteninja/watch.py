@@ -0,0 +1,244 @@
+import os
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from .build import (
+    BuildResult,
+    _remove_output,
+    convert_file,
+    iter_build,
+    output_name,
+)
+from .flatten import DependencyGraph
+from .jinja_processor import JinjaProcessor, find_template_references
+
+FileState = Tuple[int, int]
+
+
+class Watcher:
+    """Polls a tree of KDL templates and re-converts what changed.
+
+    A change to a template also re-converts every template that references
+    it through a literal `include`, `extends`, `import` or `from` tag,
+    transitively. Changes are collected until the tree has been quiet for
+    `debounce` seconds, so a bulk save converts each file once.
+
+    Args:
+        src_dir: Directory holding the KDL sources
+        out_dir: Directory receiving the HTML outputs
+        format_output: Whether to format the output with indentation
+        indent: Indentation used for each nesting level
+        extensions: File name suffixes treated as KDL
+        suffix: Suffix of the output files
+        interval: Seconds between polls
+        debounce: Seconds without further changes before converting
+    """
+
+    def __init__(
+        self,
+        src_dir: str,
+        out_dir: str,
+        format_output: bool = True,
+        indent: str = "    ",
+        extensions: Sequence[str] = (".kdl",),
+        suffix: str = ".html",
+        interval: float = 0.05,
+        debounce: float = 0.03,
+    ) -> None:
+        self.src_dir = src_dir
+        self.out_dir = out_dir
+        self.format_output = format_output
+        self.indent = indent
+        self.extensions = tuple(extensions)
+        self.suffix = suffix
+        self.interval = interval
+        self.debounce = debounce
+        self.graph = DependencyGraph()
+        self.states: Dict[str, FileState] = {}
+        self._processor = JinjaProcessor()
+
+    def scan(self) -> Dict[str, FileState]:
+        """Stat every source in the tree.
+
+        Returns:
+            Mapping of source paths to (mtime in ns, size)
+        """
+        states: Dict[str, FileState] = {}
+        stack = [(self.src_dir, "")]
+        while stack:
+            directory, prefix = stack.pop()
+            try:
+                entries = os.scandir(directory)
+            except OSError:
+                continue
+            with entries:
+                for entry in entries:
+                    name = entry.name
+                    if entry.is_dir():
+                        if not name.startswith("."):
+                            stack.append((entry.path, f"{prefix}{name}/"))
+                    elif name.endswith(self.extensions):
+                        try:
+                            stat = entry.stat()
+                        except OSError:
+                            continue
+                        states[prefix + name] = (stat.st_mtime_ns, stat.st_size)
+        return states
+
+    def poll(self) -> Set[str]:
+        """Compare the tree with the previous scan.
+
+        Returns:
+            Sources that were added, modified or removed
+        """
+        states = self.scan()
+        changed = {
+            source
+            for source in states.keys() | self.states.keys()
+            if states.get(source) != self.states.get(source)
+        }
+        self.states = states
+        return changed
+
+    def resolve(self, name: str) -> str:
+        """Map a template name used in a Jinja tag to a source path.
+
+        `partials/nav.html` and `partials/nav.kdl` both refer to the source
+        `partials/nav.kdl`.
+
+        Args:
+            name: Template name as written in the tag
+
+        Returns:
+            Source path relative to the source directory
+        """
+        if name.endswith(self.extensions):
+            return name
+        stem = os.path.splitext(name)[0]
+        for extension in self.extensions:
+            if stem + extension in self.states:
+                return stem + extension
+        return stem + self.extensions[0]
+
+    def update_dependencies(self, source: str) -> None:
+        """Re-read the literal template references of a source.
+
+        Args:
+            source: Source path relative to the source directory
+        """
+        try:
+            with open(os.path.join(self.src_dir, source), encoding="utf-8") as f:
+                text = f.read()
+        except (OSError, UnicodeDecodeError):
+            self.graph.remove(source)
+            return
+        token_map = self._processor.scan(text).token_map
+        references = find_template_references(token_map.values())
+        self.graph.set_dependencies(source, (self.resolve(r) for r in references))
+
+    def rebuild(self, changed: Iterable[str]) -> List[BuildResult]:
+        """Convert changed sources and everything that depends on them.
+
+        The outputs of removed sources are deleted, with their gzip copies.
+
+        Args:
+            changed: Sources that were added, modified or removed
+
+        Returns:
+            BuildResult for each converted source, in path order
+        """
+        changed = set(changed)
+        removed = [source for source in changed if source not in self.states]
+        for source in changed:
+            if source in self.states:
+                self.update_dependencies(source)
+            else:
+                self.graph.remove(source)
+        if removed:
+            outputs = {output_name(source, self.suffix) for source in self.states}
+            for source in removed:
+                output = output_name(source, self.suffix)
+                if output not in outputs:
+                    # as iter_build does, so it is not served as current
+                    _remove_output(os.path.join(self.out_dir, output))
+
+        results: List[BuildResult] = []
+        for source in sorted(self.graph.affected(changed)):
+            if source not in self.states:
+                continue
+            results.append(
+                convert_file(
+                    self.src_dir,
+                    self.out_dir,
+                    source,
+                    output_name(source, self.suffix),
+                    format_output=self.format_output,
+                    indent=self.indent,
+                )
+            )
+        return results
+
+    def build_all(self, jobs: Optional[int] = None) -> List[BuildResult]:
+        """Scan the tree and convert every source that changed since the last build.
+
+        Uses `iter_build`, so the first round runs in a process pool and
+        skips files recorded as unchanged in the build manifest.
+
+        Args:
+            jobs: Number of worker processes, defaults to the CPU count
+
+        Returns:
+            BuildResult for each source, in path order
+        """
+        self.states = self.scan()
+        for source in self.states:
+            self.update_dependencies(source)
+        return list(
+            iter_build(
+                self.src_dir,
+                self.out_dir,
+                jobs=jobs,
+                format_output=self.format_output,
+                indent=self.indent,
+                extensions=self.extensions,
+                suffix=self.suffix,
+            )
+        )
+
+    def wait_for_changes(self) -> Set[str]:
+        """Block until something changed and the tree has settled.
+
+        Returns:
+            Sources that changed since the previous poll
+        """
+        changed: Set[str] = set()
+        while not changed:
+            time.sleep(self.interval)
+            changed = self.poll()
+
+        quiet_since = time.monotonic()
+        while time.monotonic() - quiet_since < self.debounce:
+            time.sleep(min(self.interval, self.debounce))
+            more = self.poll()
+            if more:
+                changed |= more
+                quiet_since = time.monotonic()
+        return changed
+
+    def run(
+        self,
+        on_results: Callable[[List[BuildResult]], None],
+        should_stop: Optional[Callable[[], bool]] = None,
+    ) -> None:
+        """Convert the whole tree, then keep converting changes.
+
+        Args:
+            on_results: Called with the results of every conversion round
+            should_stop: Checked after each round, stops watching when True
+        """
+        on_results(self.build_all())
+        while should_stop is None or not should_stop():
+            on_results(self.rebuild(self.wait_for_changes()))
+
+
+__all__ = ["DependencyGraph", "Watcher"]
@@ -1,3 +1,5 @@
+import pytest
+
 from cuteninja import render_kdl, KdlTemplate
 
 
@@ -468,3 +470,52 @@ def test_jinja_tests():
 
     assert "{% if user is defined %}" in html
     assert "{% endif %}" in html
+
+
+def test_placeholder_text_in_content_is_preserved():
+    kdl = 'p "__JINJA_0__ and {{ value }}"'
+    html = render_kdl(kdl, format_output=False)
+
+    assert html == "<p>__JINJA_0__ and {{ value }}</p>"
+
+
+def test_many_jinja_tokens():
+    kdl = "\n".join(f'p "{{{{ item_{i} }}}}"' for i in range(2500))
+    html = render_kdl(kdl, format_output=False)
+
+    assert "__JINJA" not in html
+    assert "<p>{{ item_0 }}</p>" in html
+    assert "<p>{{ item_2499 }}</p>" in html
+
+
+def test_lazy_template_compiles_on_first_render():
+    template = KdlTemplate('p "{{ lazy }}"', format_output=False, lazy=True)
+
+    assert not template.compiled
+    assert template.render() == "<p>{{ lazy }}</p>"
+    assert template.compiled
+
+
+def test_lazy_template_compiles_on_token_access():
+    template = KdlTemplate('p "{{ lazy }}"', lazy=True)
+
+    assert list(template.get_jinja_tokens().values()) == ["{{ lazy }}"]
+
+
+def test_template_can_release_source_and_tokens():
+    template = KdlTemplate(
+        'p "{{ lean }}"', format_output=False, keep_source=False, keep_tokens=False
+    )
+
+    assert template.original_source is None
+    assert template.render() == "<p>{{ lean }}</p>"
+    with pytest.raises(RuntimeError):
+        template.get_jinja_tokens()
+
+
+def test_template_has_no_instance_dict():
+    template = KdlTemplate("div")
+
+    assert not hasattr(template, "__dict__")
+    assert template.converter is KdlTemplate("span").converter
+    assert template.jinja_processor is KdlTemplate("span").jinja_processor
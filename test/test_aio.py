@@ -0,0 +1,160 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from cuteninja import KdlTemplate
+from cuteninja.aio import compile_kdl_async, in_flight, set_executor
+from cuteninja.instrumentation import add_listener, remove_listener
+
+
+@pytest.fixture(autouse=True)
+def executor():
+    # an idle worker left behind would make later fork()s warn
+    pool = ThreadPoolExecutor(1)
+    set_executor(pool)
+    yield pool
+    set_executor(None)
+    pool.shutdown()
+
+
+def large_source(seed: int, sections: int = 1500) -> str:
+    return "\n".join(
+        f'section id=s{seed}-{i} {{ h2 "{{{{ title }}}}"; p "text {i}" }}'
+        for i in range(sections)
+    )
+
+
+def test_compile_kdl_async_matches_sync():
+    source = 'p "{{ name }}"'
+    template = asyncio.run(compile_kdl_async(source, use_cache=False))
+
+    assert template.output == KdlTemplate(source, use_cache=False).output
+
+
+def test_concurrent_misses_share_one_compilation():
+    compiled = []
+    listener = add_listener(lambda metrics: compiled.append(metrics.origin))
+
+    async def main():
+        source = large_source(0, sections=200)
+        return await asyncio.gather(
+            *(compile_kdl_async(source, use_cache=False) for _ in range(10))
+        )
+
+    try:
+        templates = asyncio.run(main())
+    finally:
+        remove_listener(listener)
+
+    assert compiled == ["compile"]
+    assert all(template is templates[0] for template in templates)
+
+
+def test_cancelled_waiter_does_not_cancel_compilation():
+    async def main():
+        source = large_source(1, sections=500)
+        first = asyncio.ensure_future(compile_kdl_async(source, use_cache=False))
+        second = asyncio.ensure_future(compile_kdl_async(source, use_cache=False))
+        await asyncio.sleep(0)
+        assert in_flight() == 1
+        first.cancel()
+        template = await second
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return template, in_flight()
+
+    template, remaining = asyncio.run(main())
+
+    assert template.output.startswith("<section")
+    assert remaining == 0
+
+
+def test_cached_sources_skip_the_executor(tmp_path):
+    from cuteninja.persistent import FileSystemCache
+
+    source = large_source(7, sections=3)
+    persistent = FileSystemCache(str(tmp_path))
+
+    async def main():
+        # a miss compiles in the executor, even with the caches on
+        pending = asyncio.ensure_future(
+            compile_kdl_async(source, persistent_cache=persistent)
+        )
+        await asyncio.sleep(0)
+        running = in_flight()
+        first = await pending
+        second = await compile_kdl_async(source, persistent_cache=persistent)
+        return running, first, second, in_flight()
+
+    running, first, second, remaining = asyncio.run(main())
+
+    assert running == 1
+    assert second.output == first.output
+    assert second.metrics.origin == "memory"
+    assert remaining == 0
+
+
+def test_errors_reach_every_waiter():
+    async def main():
+        return await asyncio.gather(
+            *(compile_kdl_async('p "unclosed', use_cache=False) for _ in range(3)),
+            return_exceptions=True,
+        )
+
+    results = asyncio.run(main())
+
+    assert len(results) == 3
+    assert all(isinstance(result, Exception) for result in results)
+
+
+def test_event_loop_stays_responsive_during_misses():
+    sources = [large_source(seed) for seed in range(4)]
+    start = time.perf_counter()
+    KdlTemplate(sources[0], use_cache=False)
+    blocking = time.perf_counter() - start
+
+    async def main():
+        lags = []
+        done = False
+
+        async def heartbeat():
+            while not done:
+                before = time.perf_counter()
+                await asyncio.sleep(0.001)
+                lags.append(time.perf_counter() - before)
+
+        beat = asyncio.ensure_future(heartbeat())
+        await asyncio.gather(
+            *(compile_kdl_async(source, use_cache=False) for source in sources)
+        )
+        done = True
+        await beat
+        return max(lags)
+
+    # compiling inline would stall the loop for `blocking` seconds per source
+    assert asyncio.run(main()) < blocking
+
+
+def test_async_loader_shares_loads():
+    jinja2 = pytest.importorskip("jinja2")
+    from cuteninja.loaders import AsyncKdlLoader
+
+    loader = AsyncKdlLoader(
+        jinja2.DictLoader({"page.kdl": 'p "{{ name }}"'}), use_cache=False
+    )
+    env = jinja2.Environment(loader=loader, auto_reload=False)
+
+    async def main():
+        first = await asyncio.gather(
+            *(loader.get_template_async(env, "page.kdl") for _ in range(5))
+        )
+        again = await loader.get_template_async(env, "page.kdl")
+        return first, again
+
+    first, again = asyncio.run(main())
+
+    assert all(template is first[0] for template in first)
+    assert again is first[0]
+    assert again.render(name="x") == "<p>x</p>"
@@ -0,0 +1,80 @@
+import gzip
+import zlib
+
+import pytest
+
+from cuteninja import KdlTemplate
+from cuteninja.artifacts import make_artifact
+
+PAGE = 'html { body { p "Hello, World!" } }\n' * 20
+
+
+def test_artifact_encodings():
+    artifact = make_artifact("<p>Hello</p>")
+
+    assert artifact.body == b"<p>Hello</p>"
+    assert gzip.decompress(artifact.gzip) == artifact.body
+    assert zlib.decompress(artifact.deflate) == artifact.body
+    assert artifact.encoded(None) == artifact.body
+    assert artifact.encoded("gzip") == artifact.gzip
+    with pytest.raises(ValueError):
+        artifact.encoded("br")
+
+
+def test_artifact_is_deterministic():
+    artifact = make_artifact("<p>Hello</p>")
+    make_artifact.cache_clear()
+    again = make_artifact("<p>Hello</p>")
+
+    assert again is not artifact
+    assert again == artifact
+    assert artifact.etag.startswith('"') and artifact.etag.endswith('"')
+    assert make_artifact("<p>Bye</p>").etag != artifact.etag
+
+
+def test_negotiate():
+    artifact = KdlTemplate(PAGE).artifact
+
+    body, encoding, etag = artifact.negotiate("deflate, gzip;q=0.5")
+    assert (body, encoding) == (artifact.gzip, "gzip")
+    assert etag == artifact.etag[:-1] + '-gzip"'
+    assert artifact.negotiate("gzip;q=0, deflate")[1] == "deflate"
+    assert artifact.negotiate("*")[1] == "gzip"
+    assert artifact.negotiate("br") == (artifact.body, None, artifact.etag)
+    assert artifact.negotiate() == (artifact.body, None, artifact.etag)
+
+    # compressing a tiny body only makes it bigger
+    tiny = make_artifact("<p></p>")
+    assert tiny.negotiate("gzip") == (tiny.body, None, tiny.etag)
+
+
+def test_negotiate_respects_refused_codings():
+    artifact = KdlTemplate(PAGE).artifact
+
+    assert artifact.negotiate("gzip;q=0, *")[1] == "deflate"
+    assert artifact.negotiate("gzip;q=0, deflate;q=0, *")[1] is None
+
+    # without the plain body, even a bigger compressed one is better
+    tiny = make_artifact("<p></p>")
+    assert tiny.negotiate("gzip, identity;q=0") == (
+        tiny.gzip,
+        "gzip",
+        tiny.etag[:-1] + '-gzip"',
+    )
+    assert tiny.negotiate("deflate, *;q=0")[1] == "deflate"
+
+
+def test_template_artifact():
+    template = KdlTemplate(PAGE)
+    assert template.is_static
+    assert template.artifact.body == template.output.encode()
+    assert template.artifact is KdlTemplate(PAGE, use_cache=False).artifact
+
+    jinja = KdlTemplate('p "{{ name }}"')
+    assert not jinja.is_static
+    assert jinja.artifact is None
+
+    # static once the static context decided every token
+    folded = KdlTemplate('p "{{ name }}"', static_context={"name": "A"})
+    assert folded.is_static
+    assert folded.artifact.body == b"<p>A</p>\n"
@@ -0,0 +1,30 @@
+from benchmarks.generators import WORKLOADS
+from benchmarks.suite import PHASES, compare, run_suite
+
+from cuteninja import render_kdl
+
+
+def test_generators_produce_valid_kdl():
+    for name, generator in WORKLOADS.items():
+        html = render_kdl(generator(5), use_cache=False)
+        assert html, name
+
+
+def test_suite_reports_every_phase():
+    report = run_suite(["tokens"], scale=0.005, format_output=False, repeat=1)
+    result = report["results"]["tokens"]
+
+    assert set(result["phases"]) == set(PHASES)
+    assert result["tokens"] == 50
+    assert result["output_bytes"] > 0
+
+
+def test_compare_flags_slower_phases():
+    def report(ms):
+        phases = {phase: {"ms": ms, "peak_kib": 1.0} for phase in PHASES}
+        return {"results": {"wide": {"phases": phases}}}
+
+    assert compare(report(1.1), report(1.0), threshold=0.15) == []
+    regressions = compare(report(2.0), report(1.0), threshold=0.15)
+    assert len(regressions) == len(PHASES)
+    assert regressions[0].startswith("wide/extract_jinja")
@@ -0,0 +1,148 @@
+import gzip
+import json
+
+from cuteninja.build import MANIFEST_NAME, build
+from cuteninja.cli import main
+
+
+def write_tree(root):
+    (root / "partials").mkdir(parents=True)
+    (root / "index.kdl").write_text('h1 "{{ title }}"')
+    (root / "partials" / "nav.kdl").write_text('nav { a href="/" "Home" }')
+    (root / "broken.kdl").write_text("div {")
+    (root / "notes.txt").write_text("not a template")
+
+
+def test_build_converts_tree(tmp_path):
+    src, out = tmp_path / "src", tmp_path / "out"
+    write_tree(src)
+
+    report = build(str(src), str(out), jobs=1, format_output=False)
+
+    assert [r.source for r in report.built] == ["index.kdl", "partials/nav.kdl"]
+    assert [r.source for r in report.failed] == ["broken.kdl"]
+    assert "ParseError" in report.failed[0].error
+    assert (out / "index.html").read_text() == "<h1>{{ title }}</h1>"
+    assert (out / "partials" / "nav.html").read_text() == (
+        '<nav><a href="/">Home</a></nav>'
+    )
+    assert not (out / "notes.html").exists()
+
+
+def test_rebuild_skips_unchanged_files(tmp_path):
+    src, out = tmp_path / "src", tmp_path / "out"
+    write_tree(src)
+    build(str(src), str(out), jobs=1)
+
+    (src / "index.kdl").write_text('h1 "changed"')
+    report = build(str(src), str(out), jobs=1)
+
+    assert [r.source for r in report.built] == ["index.kdl"]
+    assert [r.source for r in report.skipped] == ["partials/nav.kdl"]
+    # failed files are retried on every run
+    assert [r.source for r in report.failed] == ["broken.kdl"]
+
+    manifest = json.loads((out / MANIFEST_NAME).read_text())
+    assert sorted(manifest["files"]) == ["index.kdl", "partials/nav.kdl"]
+
+
+def test_rebuild_removes_outputs_of_deleted_sources(tmp_path):
+    src, out = tmp_path / "src", tmp_path / "out"
+    write_tree(src)
+    build(str(src), str(out), jobs=1)
+    assert (out / "partials" / "nav.html.gz").exists()
+
+    (src / "partials" / "nav.kdl").unlink()
+    report = build(str(src), str(out), jobs=1)
+
+    assert [r.source for r in report.skipped] == ["index.kdl"]
+    assert not (out / "partials" / "nav.html").exists()
+    assert not (out / "partials" / "nav.html.gz").exists()
+    assert (out / "index.html").exists()
+    manifest = json.loads((out / MANIFEST_NAME).read_text())
+    assert sorted(manifest["files"]) == ["index.kdl"]
+
+
+def test_rebuild_reports_unreadable_sources(tmp_path):
+    src, out = tmp_path / "src", tmp_path / "out"
+    write_tree(src)
+    build(str(src), str(out), jobs=1)
+
+    (src / "index.kdl").unlink()
+    (src / "index.kdl").symlink_to(src / "missing.kdl")
+    report = build(str(src), str(out), jobs=1)
+
+    assert [r.source for r in report.failed] == ["broken.kdl", "index.kdl"]
+    assert "FileNotFoundError" in report.failed[1].error
+
+
+def test_changed_options_rebuild_everything(tmp_path):
+    src, out = tmp_path / "src", tmp_path / "out"
+    write_tree(src)
+    build(str(src), str(out), jobs=1)
+
+    report = build(str(src), str(out), jobs=1, format_output=False)
+
+    assert len(report.built) == 2
+    assert not report.skipped
+
+
+def test_build_with_process_pool(tmp_path):
+    src, out = tmp_path / "src", tmp_path / "out"
+    src.mkdir()
+    for i in range(20):
+        (src / f"page{i}.kdl").write_text(f'p "{{{{ value_{i} }}}}"')
+
+    report = build(str(src), str(out), jobs=2, format_output=False)
+
+    assert len(report.built) == 20
+    assert (out / "page7.html").read_text() == "<p>{{ value_7 }}</p>"
+
+
+def test_cli_build_exit_code(tmp_path, capsys):
+    src, out = tmp_path / "src", tmp_path / "out"
+    write_tree(src)
+
+    assert main(["build", str(src), str(out), "--compact"]) == 1
+    captured = capsys.readouterr()
+    assert "failed  broken.kdl" in captured.err
+    assert "2 built, 0 unchanged, 1 failed" in captured.out
+
+    (src / "broken.kdl").unlink()
+    assert main(["build", str(src), str(out), "--compact", "-q"]) == 0
+    assert "0 built, 2 unchanged, 0 failed" in capsys.readouterr().out
+
+
+def test_build_compresses_static_outputs(tmp_path):
+    src, out = tmp_path / "src", tmp_path / "out"
+    write_tree(src)
+    build(str(src), str(out), jobs=1, format_output=False)
+
+    nav = out / "partials" / "nav.html"
+    assert gzip.decompress((out / "partials" / "nav.html.gz").read_bytes()) == (
+        nav.read_bytes()
+    )
+    # pages holding Jinja syntax are rendered, not served as they are
+    assert not (out / "index.html.gz").exists()
+    manifest = json.loads((out / MANIFEST_NAME).read_text())
+    assert manifest["files"]["partials/nav.kdl"]["compressed"] is True
+
+    # a missing .gz is written again, a stale one is removed
+    (out / "partials" / "nav.html.gz").unlink()
+    (src / "partials" / "nav.kdl").write_text('nav "{{ home }}"')
+    (src / "index.kdl").write_text('h1 "Index"')
+    (out / "index.html.gz").write_bytes(b"stale")
+    report = build(str(src), str(out), jobs=1, format_output=False)
+
+    assert sorted(r.source for r in report.built) == ["index.kdl", "partials/nav.kdl"]
+    assert not (out / "partials" / "nav.html.gz").exists()
+    assert gzip.decompress((out / "index.html.gz").read_bytes()) == b"<h1>Index</h1>"
+
+
+def test_build_without_gzip(tmp_path):
+    src, out = tmp_path / "src", tmp_path / "out"
+    write_tree(src)
+
+    assert main(["build", str(src), str(out), "--no-gzip", "-q"]) == 1
+    assert (out / "partials" / "nav.html").exists()
+    assert not (out / "partials" / "nav.html.gz").exists()
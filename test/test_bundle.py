@@ -0,0 +1,94 @@
+import json
+import zipfile
+
+import pytest
+
+jinja2 = pytest.importorskip("jinja2")
+
+from cuteninja import kdl_bindings  # noqa: E402
+from cuteninja.bundle import (  # noqa: E402
+    STAMP_NAME,
+    BundleLoader,
+    StaleBundleError,
+    compile_bundle,
+)
+from cuteninja.cli import main  # noqa: E402
+
+
+def write_tree(root):
+    (root / "partials").mkdir(parents=True)
+    (root / "layout.kdl").write_text(
+        "main {\n    {% block content %}\n    {% endblock %}\n}"
+    )
+    (root / "partials" / "nav.kdl").write_text('nav "{{ site }}"')
+    (root / "page.kdl").write_text(
+        '{% extends "layout.kdl" %}\n{% block content %}\n'
+        '{% include "partials/nav.kdl" %}\np "{{ body }}"\n{% endblock %}'
+    )
+    (root / "plain.html").write_text("<b>{{ x }}</b>")
+
+
+@pytest.mark.parametrize("zip", ["deflated", None])
+def test_bundle_renders_without_kdl(tmp_path, monkeypatch, zip):
+    src = tmp_path / "src"
+    write_tree(src)
+    target = str(tmp_path / ("bundle.zip" if zip else "bundle"))
+
+    names = compile_bundle(str(src), target, zip=zip, format_output=False)
+    assert names == ["layout.kdl", "page.kdl", "partials/nav.kdl", "plain.html"]
+
+    def no_parse(source):
+        raise AssertionError("KDL parsed at runtime")
+
+    monkeypatch.setattr(kdl_bindings, "parse", no_parse)
+    env = jinja2.Environment(loader=BundleLoader(target))
+
+    html = env.get_template("page.kdl").render(site="Demo", body="text")
+    assert html == "<main><nav>Demo</nav><p>text</p></main>"
+    assert env.get_template("plain.html").render(x=1) == "<b>1</b>"
+    assert env.list_templates() == names
+
+
+def test_stale_bundle_is_rejected(tmp_path):
+    src = tmp_path / "src"
+    write_tree(src)
+    target = tmp_path / "bundle"
+    compile_bundle(str(src), str(target), zip=None)
+
+    stamp = json.loads((target / STAMP_NAME).read_text())
+    stamp["cuteninja"] = "0.0.0"
+    (target / STAMP_NAME).write_text(json.dumps(stamp))
+
+    with pytest.raises(StaleBundleError):
+        BundleLoader(str(target))
+
+
+def test_bundle_without_stamp_is_rejected(tmp_path):
+    target = tmp_path / "plain.zip"
+    with zipfile.ZipFile(target, "w") as archive:
+        archive.writestr("tmpl_x.py", "")
+
+    with pytest.raises(StaleBundleError):
+        BundleLoader(str(target))
+
+
+def test_syntax_errors_abort_bundle(tmp_path):
+    src = tmp_path / "src"
+    src.mkdir()
+    (src / "bad.kdl").write_text('p "{% if x %}"')
+    target = tmp_path / "bundle.zip"
+
+    with pytest.raises(jinja2.TemplateSyntaxError):
+        compile_bundle(str(src), str(target))
+    assert not target.exists()
+    assert list(tmp_path.iterdir()) == [src]
+
+
+def test_cli_bundle(tmp_path, capsys):
+    src = tmp_path / "src"
+    write_tree(src)
+    target = tmp_path / "bundle.zip"
+
+    assert main(["bundle", str(src), str(target), "-q"]) == 0
+    assert "4 templates bundled" in capsys.readouterr().out
+    assert BundleLoader(str(target)).stamp["options"]["format_output"] is True
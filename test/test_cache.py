@@ -0,0 +1,92 @@
+from cuteninja import CompileCache, KdlTemplate, get_compile_cache, render_kdl
+from cuteninja.cache import CompiledTemplate, make_key
+
+
+def test_render_kdl_uses_compile_cache():
+    cache = get_compile_cache()
+    cache.clear()
+
+    first = render_kdl('p "{{ cached }}"', format_output=False)
+    second = render_kdl('p "{{ cached }}"', format_output=False)
+
+    assert first == second == "<p>{{ cached }}</p>"
+    assert cache.stats()["misses"] == 1
+    assert cache.stats()["hits"] == 1
+
+
+def test_cache_key_includes_options():
+    assert make_key("div", True, "    ") != make_key("div", False, "    ")
+    assert make_key("div", True, "    ") != make_key("div", True, "  ")
+    assert make_key("div", True, "    ") == make_key("div", True, "    ")
+
+
+def test_cached_template_tokens_are_isolated():
+    get_compile_cache().clear()
+    source = 'p "{{ isolated }}"'
+
+    first = KdlTemplate(source)
+    first.get_jinja_tokens().clear()
+    second = KdlTemplate(source)
+
+    assert list(second.get_jinja_tokens().values()) == ["{{ isolated }}"]
+
+
+def test_use_cache_false_bypasses_cache():
+    cache = get_compile_cache()
+    cache.clear()
+
+    render_kdl("div", use_cache=False)
+
+    assert len(cache) == 0
+    assert cache.stats()["misses"] == 0
+
+
+def test_lru_eviction_by_entries():
+    cache = CompileCache(max_entries=2)
+    cache.set("a", CompiledTemplate("a", {}))
+    cache.set("b", CompiledTemplate("b", {}))
+    cache.get("a")
+    cache.set("c", CompiledTemplate("c", {}))
+
+    assert "a" in cache
+    assert "b" not in cache
+    assert "c" in cache
+    assert cache.evictions == 1
+
+
+def test_eviction_by_byte_budget():
+    cache = CompileCache(max_bytes=10)
+    cache.set("a", CompiledTemplate("x" * 6, {}))
+    cache.set("b", CompiledTemplate("y" * 6, {}))
+
+    assert "a" not in cache
+    assert cache.total_bytes == 6
+
+    cache.set("c", CompiledTemplate("z" * 11, {}))
+    assert "c" not in cache
+
+
+def test_invalidate_and_clear():
+    cache = CompileCache()
+    cache.set("a", CompiledTemplate("a", {}))
+    cache.set("b", CompiledTemplate("b", {}))
+
+    assert cache.invalidate("a") is True
+    assert cache.invalidate("a") is False
+    assert "b" in cache
+
+    cache.clear()
+    assert len(cache) == 0
+    assert cache.total_bytes == 0
+
+
+def test_configure_shrinks_cache():
+    cache = CompileCache()
+    for name in "abcd":
+        cache.set(name, CompiledTemplate(name, {}))
+
+    cache.configure(max_entries=1)
+
+    assert len(cache) == 1
+    assert "d" in cache
+    assert cache.stats()["evictions"] == 3
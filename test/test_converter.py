@@ -0,0 +1,151 @@
+from cuteninja import render_kdl
+from cuteninja.kdl_bindings import parse
+from cuteninja.kdl_converter import KdlToHtmlConverter
+
+MIXED_KDL = """
+!doctype html
+html lang=en {
+    head {
+        meta charset=utf-8
+        title "Mixed"
+    }
+    body {
+        - "leading text"
+        p "Hello" "World" {
+            - "inner"
+            br
+            span class="a \\"b\\"" hidden=#true skip=#false
+        }
+        img src="x.png"
+        ul {
+            li "one"
+            li
+        }
+    }
+}
+"""
+
+
+def test_iterative_matches_recursive():
+    nodes = parse(MIXED_KDL).nodes
+
+    for format_output in (True, False):
+        recursive = KdlToHtmlConverter(format_output=format_output)
+        iterative = KdlToHtmlConverter(format_output=format_output, iterative=True)
+
+        assert iterative.convert_document(nodes) == recursive.convert_document(nodes)
+        for node in nodes:
+            assert iterative.convert_node(node, level=2) == recursive.convert_node(
+                node, level=2
+            )
+
+
+def test_writer_receives_same_output():
+    nodes = parse(MIXED_KDL).nodes
+    converter = KdlToHtmlConverter()
+    parts = []
+
+    converter.convert_document_to(nodes, parts.append)
+
+    assert "".join(parts) == converter.convert_document(nodes)
+
+
+def test_very_deep_document_compact():
+    depth = 10_000
+    kdl = "div {\n" * depth + 'p "bottom"\n' + "}\n" * depth
+
+    html = render_kdl(kdl, format_output=False, use_cache=False)
+
+    assert html == "<div>" * depth + "<p>bottom</p>" + "</div>" * depth
+
+
+def test_very_deep_document_formatted():
+    depth = 10_000
+    kdl = "section {\n" * depth + "}\n" * depth
+    nodes = parse(kdl).nodes
+
+    html = KdlToHtmlConverter(indent=" ", iterative=True).convert_document(nodes)
+
+    lines = [line for line in html.split("\n") if line]
+    assert len(lines) == 2 * depth - 1
+    assert lines[depth - 1] == " " * (depth - 1) + "<section></section>"
+    assert lines[-1] == "</section>"
+
+
+def test_minify():
+    converter = KdlToHtmlConverter(minify=True)
+
+    assert converter.convert_document(parse(MIXED_KDL).nodes) == (
+        "<!DOCTYPE html><html lang=en><head><meta charset=utf-8><title>Mixed"
+        "</title></head><body>leading text<p>Hello Worldinner<br>"
+        '<span class="a &quot;b&quot;" hidden></span></p><img src=x.png>'
+        "<ul><li>one<li></ul></body></html>"
+    )
+
+
+def test_minify_keeps_end_tags_it_cannot_prove_optional():
+    source = """
+    div {
+        p "text"
+        span "inline"
+        ul {
+            li "a"
+            - "{{ more }}"
+        }
+        a { p "in a link" }
+    }
+    p "top level"
+    """
+
+    html = render_kdl(source, minify=True, use_cache=False)
+
+    assert html == (
+        "<div><p>text</p><span>inline</span><ul><li>a</li>{{ more }}</ul>"
+        "<a><p>in a link</p></a></div><p>top level</p>"
+    )
+
+
+def test_minify_sees_through_statements():
+    source = """
+    ul class="{{ css }}" data-x=plain {
+        {% for item in items %} {# one per item #}
+        li title="{{ item.title }}" "{{ item.name }}  -   {{ item.price }}"
+        {% endfor %}
+    }
+    pre "  as   written "
+    """
+
+    html = render_kdl(source, minify=True, use_cache=False)
+
+    assert html == (
+        '<ul class="{{ css }}" data-x=plain>'
+        "{% for item in items %}{# one per item #}"
+        '<li title="{{ item.title }}">{{ item.name }} - {{ item.price }}'
+        "{% endfor %}</ul><pre>  as   written </pre>"
+    )
+
+
+def test_convert_fragments():
+    nodes = parse(
+        'main id=a { p "__JINJA_0__"; p fragment=b id=c "x"; p id="__JINJA_1__" }'
+    ).nodes
+    fragments = KdlToHtmlConverter(format_output=False).convert_fragments(nodes)
+
+    assert fragments == {
+        "a": (
+            '<main id="a"><p>__JINJA_0__</p><p id="c">x</p>'
+            '<p id="__JINJA_1__"></p></main>',
+            0,
+        ),
+        "b": ('<p id="c">x</p>', 1),
+    }
+
+
+def test_plain_output_keeps_the_fragment_property():
+    nodes = parse('div fragment="x" { p "hi" }').nodes
+
+    plain = KdlToHtmlConverter(format_output=False)
+    fragments = KdlToHtmlConverter(format_output=False, fragments=True)
+
+    assert plain.convert_document(nodes) == '<div fragment="x"><p>hi</p></div>'
+    assert fragments.convert_document(nodes) == "<div><p>hi</p></div>"
@@ -0,0 +1,171 @@
+import pytest
+
+jinja2 = pytest.importorskip("jinja2")
+
+from cuteninja import get_compile_cache  # noqa: E402
+from cuteninja.flatten import flatten  # noqa: E402
+from cuteninja.loaders import KdlLoader  # noqa: E402
+
+BASE = """
+html {
+    head {
+        title "{% block title %}Site{% endblock %}"
+    }
+    body {
+        {% include "partials/nav.kdl" %}
+        main {
+            {% block content %}
+            p "default"
+            {% block aside %}
+            aside "{{ note }}"
+            {% endblock %}
+            {% endblock %}
+        }
+        {% block footer %}
+        footer "{{ x | default('unset') }}"
+        {% endblock %}
+    }
+}
+"""
+
+NAV = """
+{% set x = "nav" %}
+nav {
+    {% for link in links %}
+    a href="{{ link }}" "{{ x }}"
+    {% endfor %}
+}
+"""
+
+PAGE = """
+{% extends "layout.kdl" %}
+// the layout fills in the rest
+{# page specific #}
+{% block content %}
+{% include "partials/nav.kdl" %}
+p "mine"
+{% endblock %}
+"""
+
+
+def write_tree(tmp_path, files):
+    for name, source in files.items():
+        path = tmp_path / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(source)
+
+
+def make_env(tmp_path, **options):
+    loader = KdlLoader(
+        jinja2.FileSystemLoader(str(tmp_path)), format_output=False, **options
+    )
+    return jinja2.Environment(loader=loader, auto_reload=True)
+
+
+def test_flattened_templates_render_the_same(tmp_path):
+    write_tree(
+        tmp_path,
+        {"layout.kdl": BASE, "partials/nav.kdl": NAV, "page.kdl": PAGE},
+    )
+    context = {"links": ["/a", "/b"], "note": "n"}
+    expected = make_env(tmp_path).get_template("page.kdl").render(context)
+
+    env = make_env(tmp_path, flatten=True)
+    html = env.get_template("page.kdl").render(context)
+
+    assert html == expected
+    assert env.loader.graph.dependencies("page.kdl") == {
+        "layout.kdl",
+        "partials/nav.kdl",
+    }
+
+
+def test_flatten_inlines_sources():
+    files = {"base.kdl": BASE, "partials/nav.kdl": NAV}
+
+    result = flatten(PAGE.replace("layout", "base"), files.get, "page.kdl")
+
+    assert "extends" not in result.source
+    assert "include" not in result.source
+    assert result.source.count("{% with %}") == 2
+    assert result.dependencies == ["partials/nav.kdl", "base.kdl"]
+
+
+def test_html_names_refer_to_kdl_partials(tmp_path):
+    write_tree(
+        tmp_path,
+        {"nav.kdl": 'nav "{{ site }}"', "page.kdl": '{% include "nav.html" %}'},
+    )
+    env = make_env(tmp_path, flatten=True)
+
+    assert env.get_template("page.kdl").render(site="Demo") == "<nav>Demo</nav>"
+
+
+@pytest.mark.parametrize(
+    "source",
+    [
+        'div "{% include "nav.kdl" %}"',
+        '{% include "nav.kdl" ignore missing %}',
+        '{% include "nav.kdl" without context %}',
+        '{%- include "nav.kdl" %}',
+        '{% include "missing.kdl" %}',
+        '{% include "page.kdl" %}',
+        '{% raw %}\n{% include "nav.kdl" %}\n{% endraw %}',
+        '{% extends "nav.kdl" %}\n{% block a %}{{ super() }}{% endblock %}',
+        '{% extends "nav.kdl" %}\n{% set x = 1 %}',
+    ],
+)
+def test_flatten_leaves_what_it_cannot_inline(source):
+    files = {"nav.kdl": 'nav "{% block a %}{% endblock %}"'}
+
+    assert flatten(source, files.get, "page.kdl").source == source
+
+
+def test_partials_with_blocks_stay_included(tmp_path):
+    write_tree(
+        tmp_path,
+        {
+            "box.kdl": 'div class=box "{% block label %}box{% endblock %}"',
+            "layout.kdl": (
+                'main {\n{% include "box.kdl" %}\n'
+                "{% block content %}{% endblock %}\n}"
+            ),
+            "child.kdl": (
+                '{% extends "layout.kdl" %}\n'
+                '{% block label %}\n- "child"\n{% endblock %}\n'
+                '{% block content %}\np "content"\n{% endblock %}'
+            ),
+        },
+    )
+    expected = make_env(tmp_path).get_template("child.kdl").render()
+
+    env = make_env(tmp_path, flatten=True)
+    html = env.get_template("child.kdl").render()
+
+    assert html == expected
+    assert '<div class="box">box</div>' in html
+    layout = (tmp_path / "layout.kdl").read_text()
+    files = {"box.kdl": (tmp_path / "box.kdl").read_text()}
+    assert flatten(layout, files.get, "layout.kdl").source == layout
+
+
+def test_partial_change_invalidates_dependents(tmp_path):
+    write_tree(
+        tmp_path,
+        {"layout.kdl": BASE, "partials/nav.kdl": NAV, "page.kdl": PAGE},
+    )
+    env = make_env(tmp_path, flatten=True)
+    template = env.get_template("page.kdl")
+    cache = get_compile_cache()
+    key = env.loader._keys["page.kdl"]
+    assert key in cache
+
+    (tmp_path / "partials/nav.kdl").write_text('nav "changed"')
+
+    assert not template.is_up_to_date
+    assert env.loader.invalidate("partials/nav.kdl") == {
+        "partials/nav.kdl",
+        "page.kdl",
+    }
+    assert key not in cache
+    assert "changed" in env.get_template("page.kdl").render(links=[])
@@ -0,0 +1,100 @@
+import pytest
+
+from cuteninja import KdlTemplate, render_kdl
+
+SOURCE = """
+html {
+    head {
+        title "{{ site.name }} - {{ page }}"
+        link rel=stylesheet href="{{ static_url }}/app.css"
+    }
+    body {
+        {% if flags.beta %}
+        p "beta"
+        {% elif user %}
+        p "{{ user }}"
+        {% else %}
+        p "nobody"
+        {% endif %}
+        {% if build == "dev" %}
+        pre "{{ build }}"
+        {% endif %}
+        {% for site in sites %}
+        i "{{ site.name }}"
+        {% endfor %}
+    }
+}
+"""
+
+STATIC = {
+    "site": {"name": "A & B"},
+    "static_url": "/static",
+    "flags": {"beta": False},
+    "build": "dev",
+}
+
+
+def test_folds_expressions_and_conditions():
+    template = KdlTemplate(SOURCE, format_output=False, static_context=STATIC)
+
+    assert template.output == (
+        "<html><head><title>{{ site.name }} - {{ page }}</title>"
+        '<link rel="stylesheet" href="/static/app.css" /></head><body>'
+        "{% if user %}<p>{{ user }}</p>{% else %}<p>nobody</p>{% endif %}"
+        "<pre>dev</pre>"
+        "{% for site in sites %}<i>{{ site.name }}</i>{% endfor %}</body></html>"
+    )
+    assert template.folded == (
+        "{{ static_url }}",
+        "{% if flags.beta %}",
+        '{% if build == "dev" %}',
+        "{{ build }}",
+        "{% endif %}",
+    )
+    assert "{{ static_url }}" not in template.token_map.values()
+
+
+def test_renders_like_jinja():
+    jinja2 = pytest.importorskip("jinja2")
+    environment = jinja2.Environment(autoescape=True)
+    source = SOURCE.replace("site", "owner")
+    static = {**STATIC, "owner": {"name": "<A & 'B'>"}}
+
+    for flags in ({"beta": True}, {"beta": False}):
+        static["flags"] = flags
+        folded = render_kdl(source, use_cache=False, static_context=static)
+        plain = render_kdl(source, use_cache=False)
+        for user in ("", "ann"):
+            context = {**static, "page": "Home", "user": user, "owners": []}
+            expected = environment.from_string(plain).render(context)
+            actual = environment.from_string(folded).render(context)
+            assert actual.split() == expected.split()
+
+
+@pytest.mark.parametrize(
+    "source, value",
+    [
+        ('p "{{ x }}"\n{% set x = 2 %}', 1),
+        ('p "{{ x }}"', [1, 2]),
+        ('p "{{ x }}"', "{{ y }}"),
+        ('p "{{ x.upper }}"', "a"),
+        ('p "{{- x }}"', 1),
+        ('{% raw %}\np "{{ x }}"\n{% endraw %}', 1),
+        ("{% if x -%}\np a\n{% endif %}", 1),
+        ("{% if x|length %}\np a\n{% endif %}", 1),
+    ],
+)
+def test_leaves_what_it_cannot_fold(source, value):
+    template = KdlTemplate(source, use_cache=False, static_context={"x": value})
+
+    assert template.folded == ()
+    assert template.output == render_kdl(source, use_cache=False)
+
+
+def test_static_context_is_part_of_the_cache_key():
+    first = KdlTemplate('p "{{ x }}"', static_context={"x": 1})
+    second = KdlTemplate('p "{{ x }}"', format_output=False, static_context={"x": 2})
+
+    assert first.cache_key != second.cache_key
+    assert second.output == "<p>2</p>"
+    assert KdlTemplate('p "{{ x }}"').cache_key != first.cache_key
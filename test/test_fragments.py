@@ -0,0 +1,112 @@
+import re
+
+import pytest
+
+from cuteninja import KdlTemplate
+
+PAGE = """
+{% import "forms.html" as forms %}
+{% set title = "Orders" %}
+{% if compact %}{% set size = "s" %}{% else %}{% set size = "l" %}{% endif %}
+{% macro badge(text) %}
+span class=badge "{{ text }}"
+{% endmacro %}
+html {
+    body {
+        {% for x in ignored %}{% set title = "loop" %}{% endfor %}
+        h1 id=title "{{ title }}"
+        table {
+            tbody id=rows {
+                {% for row in rows %}
+                {% if row.done %}
+                tr id="row-{{ row.id }}" fragment=done {
+                    td class="{{ size }}" "{{ badge(row.name) }}"
+                }
+                {% else %}
+                tr fragment=open { td "{{ row.name }}" }
+                {% endif %}
+                {% endfor %}
+            }
+        }
+        {% call forms.panel() %}
+        div id=inside "x"
+        {% endcall %}
+    }
+}
+"""
+
+ROWS = [{"id": 1, "name": "a", "done": True}, {"id": 2, "name": "b", "done": False}]
+
+
+def test_finds_named_elements():
+    template = KdlTemplate(PAGE)
+
+    # the id holding Jinja is not a name, the element inside a call is lost
+    assert sorted(template.fragments) == ["done", "open", "rows", "title"]
+    assert template.fragment("rows").scopes == ()
+    assert template.fragment("done").scopes == (
+        "{% for row in rows %}",
+        "{% if row.done %}",
+    )
+    with pytest.raises(KeyError):
+        template.fragment("inside")
+
+
+def test_keeps_what_the_element_needs():
+    fragment = KdlTemplate(PAGE, format_output=False).fragment("open")
+
+    assert fragment.output == (
+        '{% import "forms.html" as forms %}{% set title = "Orders" %}'
+        '{% if compact %}{% set size = "s" %}{% else %}{% set size = "l" %}'
+        "{% endif %}{% macro badge(text) %}"
+        '<span class="badge">{{ text }}</span>{% endmacro %}'
+        "{% for row in rows %}{% if row.done %}{% else %}"
+        "<tr><td>{{ row.name }}</td></tr>{% endif %}{% endfor %}"
+    )
+    assert "{% endfor %}" in fragment.token_map.values()
+    assert "{{ title }}" not in fragment.token_map.values()
+
+
+def test_renders_the_element_of_the_page():
+    jinja2 = pytest.importorskip("jinja2")
+    loader = jinja2.DictLoader(
+        {"forms.html": "{% macro panel() %}{{ caller() }}{% endmacro %}"}
+    )
+    environment = jinja2.Environment(loader=loader, autoescape=True)
+    template = KdlTemplate(PAGE, format_output=False)
+    page = template.to_jinja(environment).render(rows=ROWS, compact=True)
+    # fragments leave out the property naming them
+    page = re.sub(r' fragment="\w+"', "", page)
+
+    for name in ("title", "rows", "done", "open"):
+        part = (
+            template.fragment(name)
+            .to_jinja(environment)
+            .render(rows=ROWS, compact=True)
+        )
+        assert part and part in page, name
+    done = template.fragment("done").to_jinja(environment).render(rows=ROWS)
+    assert done == (
+        '<tr id="row-1"><td class="l">' '<span class="badge">a</span></td></tr>'
+    )
+
+
+def test_fragment_property_is_no_attribute_of_fragments():
+    for options in ({}, {"format_output": False}, {"minify": True}):
+        template = KdlTemplate(PAGE, **options)
+        # the page is written as before fragments existed
+        assert "fragment=" in template.output
+        for name in template.fragments:
+            assert "fragment=" not in template.fragment(name).output, name
+
+
+def test_minify_and_static_context():
+    source = 'ul id=list {\n{% if beta %}\nli "{{ name }}"\n{% endif %}\n}'
+    template = KdlTemplate(source, minify=True, static_context={"beta": True})
+
+    assert template.fragment("list").output == "<ul id=list><li>{{ name }}</ul>"
+
+
+def test_unbalanced_tags_give_no_fragments():
+    template = KdlTemplate('{% endif %}\np id=a "x"')
+    assert template.fragments == {}
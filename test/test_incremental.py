@@ -0,0 +1,165 @@
+import random
+
+import pytest
+
+from benchmarks.generators import WORKLOADS
+from cuteninja import KdlTemplate, incremental
+from cuteninja.instrumentation import add_listener, remove_listener
+
+OPTIONS = [{}, {"format_output": False}, {"indent": "\t"}]
+
+# pieces of KDL and Jinja an edit puts in or takes the place of
+SNIPPETS = [
+    "\n",
+    "{",
+    "}",
+    ";",
+    '"',
+    "\\",
+    "/-",
+    "//",
+    "/*",
+    "*/",
+    "{{ x }}",
+    "{{",
+    "}}",
+    "{%",
+    "{% if a %}",
+    "{% endif %}",
+    "{#",
+    "#}",
+    "{% raw %}",
+    'p "hi"\n',
+    "    div {\n",
+    "    }\n",
+    " class=a",
+]
+
+
+def nested(source):
+    lines = "".join(f"        {line}\n" for line in source.splitlines())
+    return f"html {{\n    body {{\n{lines}    }}\n}}\n"
+
+
+def compile_or_error(source, options):
+    try:
+        return KdlTemplate(source, use_cache=False, **options)
+    except Exception as e:
+        return e
+
+
+@pytest.fixture
+def small_chunks(monkeypatch):
+    # split the small test documents like large ones
+    monkeypatch.setattr(incremental, "CHUNK_SIZE", 128)
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_random_edits_compile_like_a_full_rebuild(small_chunks, seed):
+    rng = random.Random(seed)
+    for _ in range(12):
+        name = rng.choice(sorted(WORKLOADS))
+        source = WORKLOADS[name](rng.randint(5, 30))
+        if rng.random() < 0.5:
+            source = nested(source)
+        options = rng.choice(OPTIONS)
+        template = KdlTemplate(source, use_cache=False, **options)
+        for _ in range(10):
+            start = rng.randrange(len(source) + 1)
+            end = min(len(source), start + rng.choice([0, 0, 1, 5, 30]))
+            edited = source[:start] + rng.choice(SNIPPETS + [""]) + source[end:]
+
+            expected = compile_or_error(edited, options)
+            if isinstance(expected, Exception):
+                with pytest.raises(type(expected)):
+                    template.update(edited)
+                assert template.original_source == source
+                continue
+            template.update(edited)
+            assert template.output == expected.output, (name, edited)
+            assert template.token_map == expected.token_map, (name, edited)
+            source = edited
+
+
+def test_recompiles_only_the_edited_nodes(small_chunks):
+    source = nested(WORKLOADS["mixed"](20))
+    template = KdlTemplate(source, use_cache=False)
+    template.update(source)
+    edited = source.replace('"Read more"', '"Read on"', 1)
+
+    template.update(edited)
+
+    expected = KdlTemplate(edited, use_cache=False)
+    assert template.output == expected.output
+    assert template.token_map == expected.token_map
+    assert template.metrics.origin == "update"
+    assert 0 < template.metrics.node_count < expected.metrics.node_count / 10
+
+
+def test_updates_reach_listeners(small_chunks):
+    source = WORKLOADS["wide"](30)
+    template = KdlTemplate(source, use_cache=False)
+    template.update(source)
+    seen = []
+    add_listener(seen.append)
+    try:
+        template.update(source.replace("cell 7", "cell seven"))
+    finally:
+        remove_listener(seen.append)
+    assert [metrics.origin for metrics in seen] == ["update"]
+
+
+def test_placeholders_are_numbered_across_the_whole_source(small_chunks):
+    source = 'p "__JINJA_0__"\n' + WORKLOADS["tokens"](20)
+    template = KdlTemplate(source, use_cache=False)
+    template.update(source.replace("items[3].css", "items[3].style"))
+    assert all(name.startswith("__JINJA1_") for name in template.token_map)
+    assert "{{ items[3].style }}" in template.token_map.values()
+
+
+@pytest.mark.parametrize(
+    "options",
+    [{"minify": True}, {"static_context": {"items": []}}, {"keep_source": False}],
+)
+def test_other_templates_compile_from_scratch(options):
+    source = WORKLOADS["tokens"](5)
+    edited = source.replace("items[2]", "entries[2]")
+    template = KdlTemplate(source, use_cache=False, **options)
+
+    template.update(edited)
+
+    expected = KdlTemplate(edited, use_cache=False, **options)
+    assert template.output == expected.output
+    assert template.metrics.origin != "update"
+
+
+def test_raw_blocks_compile_from_scratch(small_chunks):
+    source = nested(WORKLOADS["wide"](20))
+    template = KdlTemplate(source, use_cache=False)
+    template.update(source)
+    edited = source.replace(
+        'span "cell 3"', 'span "{% raw %}{{ cell }}{% endraw %}"', 1
+    )
+
+    template.update(edited)
+
+    assert template.output == KdlTemplate(edited, use_cache=False).output
+    assert "{{ cell }}" in template.output
+    assert template.metrics.origin != "update"
+
+
+def test_invalid_edits_leave_the_template_as_it_was(small_chunks):
+    source = nested(WORKLOADS["wide"](20))
+    template = KdlTemplate(source, use_cache=False)
+    template.update(source)
+    output = template.output
+
+    invalid = source.replace('"cell 3"', '"cell 3')
+    with pytest.raises(type(compile_or_error(invalid, {}))):
+        template.update(invalid)
+
+    assert template.original_source == source
+    assert template.output == output
+    edited = source.replace("cell 3", "cell three")
+    template.update(edited)
+    assert template.output == KdlTemplate(edited, use_cache=False).output
@@ -0,0 +1,102 @@
+from cuteninja import KdlTemplate, get_compile_cache
+from cuteninja.instrumentation import (
+    CompileMetrics,
+    MetricsRegistry,
+    add_listener,
+    remove_listener,
+)
+
+
+def test_template_records_metrics():
+    source = 'div {\n    {% if x %}\n    p "{{ y }}"\n    {% endif %}\n}'
+    template = KdlTemplate(source, format_output=False, use_cache=False)
+    metrics = template.metrics
+
+    assert metrics.origin == "compile"
+    assert metrics.input_bytes == len(source)
+    assert metrics.output_bytes == len(template.render())
+    assert metrics.token_count == 3
+    # div, p and the two text nodes holding the block tags
+    assert metrics.node_count == 4
+    assert set(metrics.phases()) == {"extract", "parse", "convert", "restore"}
+    assert metrics.total_seconds > 0
+
+
+def test_cache_hit_metrics():
+    get_compile_cache().clear()
+    KdlTemplate('p "{{ hit }}"')
+    metrics = KdlTemplate('p "{{ hit }}"').metrics
+
+    assert metrics.origin == "memory"
+    assert metrics.token_count == 1
+    assert metrics.total_seconds == 0
+
+
+def test_cache_hits_measure_sizes_when_read():
+    source = 'p "{{ hit }} é"'
+    KdlTemplate(source)
+    template = KdlTemplate(source)
+
+    assert template.metrics.origin == "memory"
+    assert template.metrics.input_bytes == len(source.encode("utf-8"))
+    assert template.metrics.output_bytes == len(template.output.encode("utf-8"))
+    released = KdlTemplate(source, keep_source=False)
+    assert released.metrics.input_bytes == len(source.encode("utf-8"))
+
+
+def test_listeners_receive_metrics():
+    seen = []
+    add_listener(seen.append)
+    try:
+        KdlTemplate("span", use_cache=False)
+    finally:
+        remove_listener(seen.append)
+    KdlTemplate("span", use_cache=False)
+
+    assert len(seen) == 1
+    assert seen[0].origin == "compile"
+
+
+def test_registry_prometheus_output():
+    registry = MetricsRegistry()
+    registry.observe(
+        CompileMetrics(
+            origin="compile",
+            input_bytes=2000,
+            output_bytes=3000,
+            token_count=4,
+            node_count=10,
+            extract_seconds=0.0002,
+            parse_seconds=0.002,
+            convert_seconds=0.003,
+            restore_seconds=0.0001,
+        )
+    )
+    registry.observe(CompileMetrics("memory", 2000, 3000, 4))
+
+    text = registry.to_prometheus()
+
+    assert "# TYPE cuteninja_templates_total counter" in text
+    assert 'cuteninja_templates_total{origin="compile"} 1' in text
+    assert 'cuteninja_templates_total{origin="memory"} 1' in text
+    assert "cuteninja_tokens_total 4" in text
+    assert "cuteninja_nodes_total 10" in text
+    assert 'cuteninja_compile_phase_seconds_bucket{phase="parse",le="0.001"} 0' in text
+    assert 'cuteninja_compile_phase_seconds_bucket{phase="parse",le="0.005"} 1' in text
+    assert 'cuteninja_compile_phase_seconds_count{phase="parse"} 1' in text
+    assert 'cuteninja_input_bytes_bucket{le="4096"} 1' in text
+    assert 'cuteninja_input_bytes_bucket{le="+Inf"} 1' in text
+    assert "cuteninja_input_bytes_sum 2000" in text
+    assert text.endswith("\n")
+
+
+def test_registry_enable_disable():
+    registry = MetricsRegistry()
+    registry.enable()
+    try:
+        KdlTemplate("em", use_cache=False)
+    finally:
+        registry.disable()
+    KdlTemplate("em", use_cache=False)
+
+    assert registry.templates == {"compile": 1}
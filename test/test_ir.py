@@ -0,0 +1,138 @@
+import pytest
+
+from cuteninja import KdlTemplate
+from cuteninja.ir import DocumentCache, DocumentIR, get_document_cache
+from cuteninja.kdl_bindings import parse
+from cuteninja.kdl_converter import KdlToHtmlConverter
+
+SOURCE = """
+!doctype html
+html lang=en {
+    body {
+        - "__JINJA_0__"
+        p "Hello" 2 {
+            - "inner"
+            br
+            span class="a \\"b\\"" hidden=#true skip=#false n=1.5
+        }
+        ul { li "one"; li "two" }
+        - "__JINJA_1__"
+        img src="x.png"
+        pre "a  b" { b "c" }
+        "" ""
+    }
+}
+- "tail"
+"""
+
+CONVERTERS = [
+    KdlToHtmlConverter(),
+    KdlToHtmlConverter(iterative=True),
+    KdlToHtmlConverter(format_output=False),
+    KdlToHtmlConverter(indent="\t"),
+    KdlToHtmlConverter(minify=True),
+]
+
+
+@pytest.mark.parametrize("converter", CONVERTERS)
+def test_emits_like_the_parse_tree(converter):
+    nodes = parse(SOURCE).nodes
+    ir = DocumentIR.from_bytes(DocumentIR.from_nodes(nodes).to_bytes())
+    statements = {"__JINJA_0__", "__JINJA_1__"}
+
+    expected = []
+    count = converter.convert_document_to(nodes, expected.append, statements)
+    parts = []
+    assert converter.convert_document_to(ir, parts.append, statements) == count
+    assert "".join(parts) == "".join(expected)
+
+
+def test_nodes_are_shaped_like_ckdl_nodes():
+    ir = DocumentIR.from_nodes(parse(SOURCE).nodes)
+    html = ir.nodes[1]
+    paragraph = html.children[0].children[1]
+
+    assert [node.name for node in ir.nodes] == ["!doctype", "html", "-"]
+    assert html.properties == {"lang": "en"}
+    assert paragraph.args == ["Hello", "2"]
+    assert paragraph.children[2].properties == {
+        "class": 'a "b"',
+        "hidden": True,
+        "skip": False,
+        "n": "1.5",
+    }
+    # names and repeated values are stored once
+    assert ir.strings.count("li") == 1
+    assert ir.values().count("inner") == 1
+
+
+def test_from_bytes_rejects_other_data():
+    data = DocumentIR.from_nodes(parse(SOURCE).nodes).to_bytes()
+    for bad in (b"", b"nope" * 10, data[:-1], data[:5] + b"\x02" + data[6:]):
+        with pytest.raises(ValueError):
+            DocumentIR.from_bytes(bad)
+
+
+def test_from_bytes_rejects_corrupt_instructions():
+    ir = DocumentIR.from_nodes(parse(SOURCE).nodes)
+    first_close = ir.operands[1]
+
+    def corrupted(index, value):
+        operands = ir.operands[:]
+        operands[index] = value
+        return DocumentIR(ir.strings, ir.text, ir.offsets, ir.opcodes, operands)
+
+    for bad in (
+        corrupted(0, len(ir.strings)),  # name out of range
+        corrupted(1, 0),  # CLOSE pointing back at the OPEN
+        corrupted(1, first_close + 1),  # CLOSE of another node
+        corrupted(1, len(ir.opcodes)),  # CLOSE past the end
+        corrupted(2 * ir.opcodes.index(1), len(ir.offsets)),  # text out of range
+    ):
+        with pytest.raises(ValueError):
+            DocumentIR.from_bytes(bad.to_bytes())
+
+
+def test_from_bytes_loads_or_rejects_any_damage():
+    data = DocumentIR.from_nodes(parse(SOURCE).nodes).to_bytes()
+    for position in range(6, len(data)):
+        damaged = bytearray(data)
+        damaged[position] ^= 0x41
+        try:
+            ir = DocumentIR.from_bytes(bytes(damaged))
+        except ValueError:
+            continue
+        KdlToHtmlConverter().convert_document_to(ir, [].append)
+
+
+def test_cache_keeps_documents_parsed_again():
+    cache = DocumentCache()
+
+    assert isinstance(cache.parse(SOURCE), list)
+    ir = cache.parse(SOURCE)
+    assert isinstance(ir, DocumentIR)
+    assert cache.parse(SOURCE) is ir
+
+    small = DocumentCache(max_entries=0)
+    small.parse(SOURCE)
+    assert isinstance(small.parse(SOURCE), DocumentIR)
+    assert len(small) == 0
+
+
+def test_templates_share_the_ir_across_options():
+    get_document_cache().clear()
+    source = 'section { p "{{ text }}"; p "ir" }'
+
+    formatted = KdlTemplate(source).output
+    assert len(get_document_cache()) == 0
+    compact = KdlTemplate(source, format_output=False).output
+    minified = KdlTemplate(source, minify=True).output
+    assert len(get_document_cache()) == 1
+
+    assert formatted == render(source)
+    assert compact == render(source, format_output=False)
+    assert minified == "<section><p>{{ text }}<p>ir</section>"
+
+
+def render(source, **options):
+    return KdlTemplate(source, use_cache=False, **options).output
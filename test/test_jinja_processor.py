@@ -0,0 +1,88 @@
+from cuteninja import render_kdl
+from cuteninja.jinja_processor import JinjaProcessor
+
+
+def test_scan_records_token_offsets():
+    source = 'div {\n    p "{{ name }}"\n    {% if x %}\n}'
+    result = JinjaProcessor().scan(source)
+
+    assert len(result.offsets) == len(result.token_map) == 2
+    for (start, end), token in zip(result.offsets, result.token_map.values()):
+        assert source[start:end] == token
+
+
+def test_closers_inside_string_literals():
+    source = """p "{{ '}}' ~ name }}"\n{% set x = "%}" %}"""
+    tokens = list(JinjaProcessor().scan(source).token_map.values())
+
+    assert tokens == ["{{ '}}' ~ name }}", '{% set x = "%}" %}']
+
+
+def test_nested_braces_and_kdl_escapes():
+    source = 'p "{{ {\'a\': {\'b\': 1}} }}"\np "{{ x|default(\\"y\\") }}"'
+    tokens = list(JinjaProcessor().scan(source).token_map.values())
+
+    assert tokens == ["{{ {'a': {'b': 1}} }}", '{{ x|default(\\"y\\") }}']
+
+
+def test_unbalanced_quote_ends_at_first_closer():
+    tokens = list(JinjaProcessor().scan('p "{{ it\'s }} ok"').token_map.values())
+
+    assert tokens == ["{{ it's }}"]
+
+
+def test_raw_block_content_is_literal():
+    source = "{%- raw -%}\np \"{{ '}}' }}\"\n{% endraw %}"
+    tokens = list(JinjaProcessor().scan(source).token_map.values())
+
+    # Jinja does not parse inside raw, the first closer ends a token
+    assert tokens == ["{%- raw -%}", "{{ '}}", "{% endraw %}"]
+
+
+def test_whitespace_control_on_standalone_lines():
+    kdl = """
+    ul {
+        {%- for item in items -%}
+        li "{{ item }}"
+        {%- endfor +%}
+    }
+    """
+    html = render_kdl(kdl, format_output=False)
+
+    assert html == (
+        "<ul>{%- for item in items -%}<li>{{ item }}</li>{%- endfor +%}</ul>"
+    )
+
+
+def test_several_tokens_on_one_line():
+    kdl = "div {\n    {% if a %}{% if b %} {{ c }}\n    {% endif %}{% endif %}\n}"
+    html = render_kdl(kdl, format_output=False)
+
+    assert html == "<div>{% if a %}{% if b %} {{ c }}{% endif %}{% endif %}</div>"
+
+
+def test_extract_jinja_matches_scan():
+    processor = JinjaProcessor()
+    source = 'p "{{ a }}"\n{# note #}'
+
+    cleaned, token_map = processor.extract_jinja(source)
+    result = processor.scan(source)
+
+    assert (cleaned, token_map) == (result.kdl, result.token_map)
+
+
+def test_restore_jinja_with_a_custom_map():
+    processor = JinjaProcessor()
+
+    assert processor.restore_jinja("<p>X</p>", {"X": "{{ a }}"}) == "<p>{{ a }}</p>"
+    # longer keys win over their prefixes
+    assert processor.restore_jinja("AB A", {"A": "1", "AB": "2"}) == "2 1"
+
+
+def test_restore_jinja_with_mixed_prefixes():
+    processor = JinjaProcessor()
+    token_map = {"__JINJA_0__": "{{ a }}", "__JINJA1_0__": "{{ b }}"}
+
+    html = processor.restore_jinja("<p>__JINJA_0__ __JINJA1_0__</p>", token_map)
+
+    assert html == "<p>{{ a }} {{ b }}</p>"
@@ -0,0 +1,52 @@
+import gc
+import weakref
+
+import pytest
+
+jinja2 = pytest.importorskip("jinja2")
+
+from cuteninja import KdlTemplate  # noqa: E402
+from cuteninja.jinja_templates import (  # noqa: E402
+    clear_jinja_cache,
+    compile_to_jinja,
+)
+
+
+def test_to_jinja_renders():
+    template = KdlTemplate('p "Hello {{ name }}"', format_output=False)
+
+    assert template.to_jinja().render(name="World") == "<p>Hello World</p>"
+
+
+def test_to_jinja_is_memoized_per_environment():
+    env = jinja2.Environment(autoescape=True)
+    other = jinja2.Environment()
+    template = KdlTemplate('p "{{ value }}"', format_output=False)
+
+    first = template.to_jinja(env)
+
+    assert KdlTemplate('p "{{ value }}"', format_output=False).to_jinja(env) is first
+    assert template.to_jinja(other) is not first
+    assert first.environment is env
+    assert first.render(value="<b>") == "<p>&lt;b&gt;</p>"
+
+
+def test_compile_to_jinja_helper():
+    clear_jinja_cache()
+    first = compile_to_jinja('li "{{ item }}"', format_output=False)
+    second = compile_to_jinja('li "{{ item }}"', format_output=False)
+
+    assert first is second
+    assert first.render(item=3) == "<li>3</li>"
+    assert compile_to_jinja('li "{{ item }}"') is not first
+
+
+def test_environment_is_not_kept_alive():
+    env = jinja2.Environment()
+    compile_to_jinja("div", env)
+    ref = weakref.ref(env)
+
+    del env
+    gc.collect()
+
+    assert ref() is None
@@ -0,0 +1,171 @@
+import io
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from cuteninja import KdlTemplate, render_kdl, render_kdl_to
+from cuteninja.kdl_bindings import KdlParseError
+from cuteninja.kdl_converter import KdlToHtmlConverter
+from cuteninja.kdl_events import (
+    ARGS,
+    END,
+    PROPS,
+    START,
+    build_nodes,
+    parse_document,
+    parse_events,
+)
+
+SOURCE = """
+!doctype html
+html lang=en {
+    body {
+        - "__JINJA_0__"
+        p "Hello" 2 {
+            - "inner"
+            br
+            span class="a \\"b\\"" hidden=#true skip=#false n=1.5
+        }
+        ul { li "one"; li "two" }
+        /-ul { li "gone" }
+        div /-{ p "gone" } { !doctype }
+        section {
+            !doctype "x"
+            !doctype
+        }
+        - "__JINJA_1__"
+        img src="x.png"
+        pre "a  b" { b "c" }
+        "" ""
+    }
+}
+- "tail" { ignored }
+"""
+
+CONVERTERS = [
+    KdlToHtmlConverter(),
+    KdlToHtmlConverter(format_output=False),
+    KdlToHtmlConverter(indent="\t"),
+    KdlToHtmlConverter(minify=True),
+]
+
+
+def test_yields_events_in_document_order():
+    events = list(parse_events('a 1 k=v { b; /-c { d } }\n/-e\nf "x" /-2'))
+    assert events == [
+        (START, "a"),
+        (PROPS, {"k": "v"}),
+        (ARGS, [1]),
+        (START, "b"),
+        (PROPS, {}),
+        (ARGS, []),
+        (END, "b"),
+        (END, "a"),
+        (START, "f"),
+        (PROPS, {}),
+        (ARGS, ["x"]),
+        (END, "f"),
+    ]
+
+
+@pytest.mark.parametrize(
+    "source",
+    [
+        "a 0x1F 1e3 1_000 -1.5 0o7 0b11 true false null",
+        "a #true #false #null #inf 1.5e-3",
+        'a r#"raw "x""#',
+        'a #"raw \\n"# "\\u{41}\\s\\t" "x\\   y"',
+        'a """\n    one\n      two\n    """',
+        "a (t)5 x=y 'q' - \\\n    2 // comment",
+        "(t)a /* a /* nested */ comment */ 1; b",
+    ],
+)
+def test_values_match_ckdl(source):
+    ckdl = pytest.importorskip("ckdl")
+
+    def dump(nodes):
+        return [
+            (
+                node.name,
+                [
+                    arg if type(arg).__name__ != "Value" else str(arg)
+                    for arg in node.args
+                ],
+                dict(node.properties),
+                dump(node.children),
+            )
+            for node in nodes
+        ]
+
+    assert dump(parse_document(source).nodes) == dump(ckdl.parse(source).nodes)
+
+
+@pytest.mark.parametrize(
+    "source", ["a {", "a }", "a 1x", 'a "open', "a =1", "a { b } c"]
+)
+def test_invalid_source_raises(source):
+    with pytest.raises(KdlParseError, match="line 1"):
+        list(parse_events(source))
+
+
+def test_errors_come_after_the_events_before_them():
+    events = parse_events("a\nb {\n")
+    assert next(events) == (START, "a")
+    with pytest.raises(KdlParseError, match="line 3"):
+        list(events)
+
+
+@pytest.mark.parametrize("converter", CONVERTERS)
+def test_converts_events_like_nodes(converter):
+    expected = []
+    count = converter.convert_document_to(parse_document(SOURCE).nodes, expected.append)
+    parts = []
+    assert converter.convert_events_to(parse_events(SOURCE), parts.append) == count
+    assert "".join(parts) == "".join(expected)
+
+
+def test_converts_deep_documents_without_recursion():
+    depth = sys.getrecursionlimit() * 2
+    source = "div {\n" * depth + "}\n" * depth
+    parts = []
+    converter = KdlToHtmlConverter(format_output=False)
+    assert converter.convert_events_to(parse_events(source), parts.append) == depth
+    assert "".join(parts) == "<div>" * depth + "</div>" * depth
+    assert len(build_nodes(parse_events(source))) == 1
+
+
+@pytest.mark.parametrize("format_output", [True, False])
+def test_render_kdl_to_writes_what_render_kdl_returns(format_output):
+    source = """
+    ul {
+        {% for item in items %}
+        li class="{{ item.kind }}" "{{ item.name }}"
+        {% endfor %}
+    }
+    """
+    out = io.StringIO()
+    assert render_kdl_to(source, out.write, format_output=format_output) == 4
+    assert out.getvalue() == render_kdl(source, format_output=format_output)
+
+
+def test_templates_compile_with_the_python_backend():
+    source = 'div class="{{ cls }}" { p "{{ text }}" }'
+    script = (
+        "import sys\n"
+        "from cuteninja import KdlTemplate\n"
+        "from cuteninja.kdl_bindings import BACKEND\n"
+        "assert BACKEND == 'python', BACKEND\n"
+        "sys.stdout.write(KdlTemplate(sys.argv[1]).output)\n"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", script, source],
+        capture_output=True,
+        text=True,
+        cwd=Path(__file__).resolve().parent.parent,
+        env={**os.environ, "CUTENINJA_KDL_BACKEND": "python"},
+        check=True,
+    )
+    assert result.stdout == KdlTemplate(source, use_cache=False).output
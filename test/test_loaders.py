@@ -0,0 +1,75 @@
+import os
+
+import pytest
+
+jinja2 = pytest.importorskip("jinja2")
+
+from cuteninja.loaders import KdlLoader  # noqa: E402
+
+
+def make_env(tmp_path, **options):
+    loader = KdlLoader(jinja2.FileSystemLoader(str(tmp_path)), **options)
+    return jinja2.Environment(loader=loader, auto_reload=True)
+
+
+def test_renders_kdl_template(tmp_path):
+    (tmp_path / "page.kdl").write_text('p "Hello {{ name }}"')
+    env = make_env(tmp_path, format_output=False)
+
+    assert env.get_template("page.kdl").render(name="World") == "<p>Hello World</p>"
+
+
+def test_non_kdl_templates_pass_through(tmp_path):
+    (tmp_path / "raw.html").write_text("<b>{{ x }}</b>")
+    env = make_env(tmp_path)
+
+    assert env.get_template("raw.html").render(x=1) == "<b>1</b>"
+
+
+def test_include_and_extends(tmp_path):
+    (tmp_path / "base.kdl").write_text("""
+        main {
+            {% block content %}
+            {% endblock %}
+        }
+        """)
+    (tmp_path / "nav.kdl").write_text('nav "{{ site }}"')
+    (tmp_path / "page.kdl").write_text("""
+        {% extends "base.kdl" %}
+        {% block content %}
+        {% include "nav.kdl" %}
+        p "body"
+        {% endblock %}
+        """)
+    env = make_env(tmp_path, format_output=False)
+
+    html = env.get_template("page.kdl").render(site="Demo")
+
+    assert html == "<main><nav>Demo</nav><p>body</p></main>"
+
+
+def test_touch_keeps_compiled_template(tmp_path):
+    path = tmp_path / "page.kdl"
+    path.write_text('p "same"')
+    env = make_env(tmp_path)
+    template = env.get_template("page.kdl")
+
+    stat = os.stat(path)
+    os.utime(path, (stat.st_atime, stat.st_mtime + 10))
+
+    assert template.is_up_to_date
+    assert env.get_template("page.kdl") is template
+
+
+def test_edit_reloads_template(tmp_path):
+    path = tmp_path / "page.kdl"
+    path.write_text('p "old"')
+    env = make_env(tmp_path, format_output=False)
+    template = env.get_template("page.kdl")
+
+    stat = os.stat(path)
+    path.write_text('p "new"')
+    os.utime(path, (stat.st_atime, stat.st_mtime + 10))
+
+    assert not template.is_up_to_date
+    assert env.get_template("page.kdl").render() == "<p>new</p>"
@@ -0,0 +1,132 @@
+import json
+import os
+
+from cuteninja import KdlTemplate, get_compile_cache, render_kdl
+from cuteninja.cache import CompiledTemplate
+from cuteninja.persistent import (
+    CACHE_MAGIC,
+    Bucket,
+    FileSystemCache,
+    set_persistent_cache,
+)
+from cuteninja.version import __version__
+
+
+def test_filesystem_cache_round_trip(tmp_path):
+    cache = FileSystemCache(str(tmp_path))
+    source = 'p "{{ stored }}"'
+
+    get_compile_cache().clear()
+    first = KdlTemplate(source, persistent_cache=cache)
+    files = os.listdir(tmp_path)
+    assert len(files) == 1
+
+    bucket = cache.get_bucket(source, True, "    ")
+    assert bucket.compiled is not None
+    assert bucket.compiled.output == first.render()
+    assert list(bucket.compiled.token_map.values()) == ["{{ stored }}"]
+
+
+def test_filesystem_cache_serves_stored_output(tmp_path):
+    cache = FileSystemCache(str(tmp_path))
+    source = "div"
+    bucket = cache.get_bucket(source, False, "    ")
+    bucket.compiled = CompiledTemplate("<from-disk>", {})
+    cache.set_bucket(bucket)
+
+    get_compile_cache().clear()
+    html = render_kdl(source, format_output=False, persistent_cache=cache)
+
+    assert html == "<from-disk>"
+
+
+def test_key_depends_on_options(tmp_path):
+    cache = FileSystemCache(str(tmp_path))
+
+    assert cache.get_cache_key("div", True) != cache.get_cache_key("div", False)
+
+
+def test_corrupted_entry_is_ignored_and_removed(tmp_path):
+    cache = FileSystemCache(str(tmp_path))
+    key = cache.get_cache_key("div", True, "    ")
+    path = tmp_path / f"__cuteninja_{key}.cache"
+    path.write_bytes(CACHE_MAGIC + b'{"key": "truncated')
+
+    bucket = cache.get_bucket("div", True, "    ")
+
+    assert bucket.compiled is None
+    assert not path.exists()
+
+
+def test_entry_with_wrong_types_is_ignored_and_removed(tmp_path):
+    cache = FileSystemCache(str(tmp_path))
+    key = cache.get_cache_key("div", True, "    ")
+    path = tmp_path / f"__cuteninja_{key}.cache"
+    for payload in (
+        {"output": 1, "tokens": {}},
+        {"output": "<div></div>", "tokens": {"__JINJA_0__": 0}},
+        {"output": "<div></div>", "tokens": {}, "folded": [None]},
+    ):
+        payload.update(key=key, version=__version__)
+        path.write_bytes(CACHE_MAGIC + json.dumps(payload).encode("utf-8"))
+
+        bucket = cache.get_bucket("div", True, "    ")
+
+        assert bucket.compiled is None
+        assert not path.exists()
+
+
+def test_bucket_round_trips_lone_surrogates():
+    compiled = CompiledTemplate("<p>\ud800</p>", {"__JINJA_0__": "{{ '\udfff' }}"})
+    bucket = Bucket("a")
+    bucket.compiled = compiled
+
+    loaded = Bucket("a")
+    loaded.loads(bucket.dumps())
+
+    assert loaded.compiled == compiled
+
+
+def test_bucket_rejects_foreign_key():
+    bucket = Bucket("a")
+    bucket.compiled = CompiledTemplate("<p></p>", {})
+    data = bucket.dumps()
+
+    other = Bucket("b")
+    other.loads(data)
+    assert other.compiled is None
+
+    same = Bucket("a")
+    same.loads(data)
+    assert same.compiled == CompiledTemplate("<p></p>", {})
+
+
+def test_prune_removes_oldest_entries(tmp_path):
+    cache = FileSystemCache(str(tmp_path))
+    for i in range(4):
+        bucket = Bucket(f"k{i}")
+        bucket.compiled = CompiledTemplate("x" * 100, {})
+        cache.set_bucket(bucket)
+        path = cache._get_cache_filename(bucket)
+        os.utime(path, (1000 + i, 1000 + i))
+
+    size = os.path.getsize(cache._get_cache_filename(Bucket("k0")))
+    removed = cache.prune(max_bytes=size * 2)
+
+    assert removed == 2
+    assert sorted(os.listdir(tmp_path)) == [
+        "__cuteninja_k2.cache",
+        "__cuteninja_k3.cache",
+    ]
+
+
+def test_process_wide_persistent_cache(tmp_path):
+    cache = FileSystemCache(str(tmp_path))
+    get_compile_cache().clear()
+    set_persistent_cache(cache)
+    try:
+        render_kdl('span "process wide"', use_cache=True)
+    finally:
+        set_persistent_cache(None)
+
+    assert len(os.listdir(tmp_path)) == 1
@@ -0,0 +1,62 @@
+import time
+
+import pytest
+
+pytest.importorskip("jinja2")
+
+from cuteninja import KdlTemplate  # noqa: E402
+from cuteninja.profiling import profile_render  # noqa: E402
+
+SOURCE = """div {
+    h1 "{{ title }}"
+    {% for item in items %}
+    p "{{ slow(item) }}"
+    {% endfor %}
+    p "{{ fast }}"
+}"""
+
+
+def test_source_map_links_output_lines_to_kdl_lines():
+    template = KdlTemplate(SOURCE)
+    source_map = template.source_map()
+    output_lines = template.output.split("\n")
+
+    for output_line, kdl_line in source_map:
+        kdl = SOURCE.split("\n")[kdl_line - 1].strip()
+        # the token on the KDL line made it to the mapped output line
+        token = kdl[kdl.index("{") : kdl.rindex("}") + 1]
+        assert token in output_lines[output_line - 1]
+    assert source_map.kdl_line(1) is None
+
+
+def test_source_map_spans_point_at_tokens():
+    template = KdlTemplate('p "{{ a }}"\n{% if b %}\n{#\n  note\n#}\n{% endif %}')
+    source_map = template.source_map()
+
+    assert len(source_map.spans) == 4
+    for span in source_map.spans:
+        assert (
+            template.output[span.output_start : span.output_end]
+            == template.original_source[span.source_start : span.source_end]
+        )
+    # a token spanning lines maps each of them; its first output line also
+    # holds the `if`, which keeps that line
+    comment = source_map.spans[2]
+    first_line = template.output.count("\n", 0, comment.output_start) + 1
+    assert [source_map.kdl_line(first_line + i) for i in range(3)] == [2, 4, 5]
+
+
+def test_profile_charges_time_to_kdl_lines():
+    def slow(item):
+        time.sleep(0.01)
+        return item
+
+    template = KdlTemplate(SOURCE)
+    profile = profile_render(template, title="T", items=[1, 2, 3], slow=slow, fast=1)
+
+    assert "<p>3</p>" in profile.output
+    line, seconds, hits = profile.top(1)[0]
+    assert line == 4
+    assert seconds >= 0.03
+    assert hits >= 3
+    assert 'p "{{ slow(item) }}"' in profile.report(SOURCE)
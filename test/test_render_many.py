@@ -0,0 +1,72 @@
+import threading
+
+import pytest
+
+from cuteninja import get_compile_cache, render_kdl, render_many
+from cuteninja.core import KdlTemplate
+from cuteninja.jinja_processor import JinjaProcessor
+
+
+def make_sources(count):
+    return [
+        f'ul id=list{i} {{\n    {{% for x in items{i} %}}\n    li "{{{{ x.n{i} }}}}"\n'
+        f"    {{% endfor %}}\n}}"
+        for i in range(count)
+    ]
+
+
+def test_shared_processor_is_reentrant():
+    processor = JinjaProcessor()
+    sources = make_sources(16)
+    expected = [JinjaProcessor().scan(source) for source in sources]
+    barrier = threading.Barrier(len(sources))
+    results = [None] * len(sources)
+
+    def scan(index):
+        barrier.wait()
+        for _ in range(50):
+            results[index] = processor.extract_jinja(sources[index])
+            assert processor.token_map == expected[index].token_map
+
+    threads = [threading.Thread(target=scan, args=(i,)) for i in range(len(sources))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == [(kdl, token_map) for kdl, token_map, _ in expected]
+
+
+def test_templates_compile_concurrently():
+    sources = make_sources(8)
+    expected = [render_kdl(source, use_cache=False) for source in sources]
+    outputs = {}
+
+    def compile_all(name):
+        outputs[name] = [
+            KdlTemplate(source, use_cache=False).render() for source in sources
+        ]
+
+    threads = [threading.Thread(target=compile_all, args=(i,)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert all(result == expected for result in outputs.values())
+
+
+@pytest.mark.parametrize("executor", ["thread", "process"])
+def test_render_many_keeps_order(executor):
+    get_compile_cache().clear()
+    sources = make_sources(6)
+    sources.append(sources[0])
+    expected = [render_kdl(source, use_cache=False) for source in sources]
+
+    assert render_many(sources, workers=3, executor=executor) == expected
+    assert len(get_compile_cache()) == 6
+
+
+def test_render_many_rejects_unknown_executor():
+    with pytest.raises(ValueError):
+        render_many(["p hi"], executor="fiber")
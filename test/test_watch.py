@@ -0,0 +1,110 @@
+import os
+
+from cuteninja.jinja_processor import find_template_references
+from cuteninja.watch import DependencyGraph, Watcher
+
+
+def touch(path, text):
+    path.write_text(text)
+    stat = os.stat(path)
+    # move the mtime forward so the change is seen on coarse clocks
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+
+def test_find_template_references():
+    tokens = [
+        '{% include "nav.html" %}',
+        "{%- extends 'base.kdl' -%}",
+        '{% from "macros.kdl" import button %}',
+        '{% import "forms.kdl" as forms %}',
+        "{% include name %}",
+        '{{ "include" }}',
+        '{% include "nav.html" %}',
+    ]
+
+    assert find_template_references(tokens) == [
+        "nav.html",
+        "base.kdl",
+        "macros.kdl",
+        "forms.kdl",
+    ]
+
+
+def test_dependency_graph_is_transitive():
+    graph = DependencyGraph()
+    graph.set_dependencies("page.kdl", ["layout.kdl"])
+    graph.set_dependencies("layout.kdl", ["nav.kdl"])
+    graph.set_dependencies("other.kdl", [])
+
+    assert graph.affected(["nav.kdl"]) == {"nav.kdl", "layout.kdl", "page.kdl"}
+
+    graph.set_dependencies("layout.kdl", [])
+    assert graph.affected(["nav.kdl"]) == {"nav.kdl"}
+
+
+def test_watcher_rebuilds_dependents(tmp_path):
+    src, out = tmp_path / "src", tmp_path / "out"
+    (src / "partials").mkdir(parents=True)
+    (src / "partials" / "nav.kdl").write_text('nav "v1"')
+    (src / "page.kdl").write_text(
+        '{% extends "layout.html" %}\n{% include "partials/nav.html" %}'
+    )
+    (src / "layout.kdl").write_text("main")
+    (src / "other.kdl").write_text("p")
+
+    watcher = Watcher(str(src), str(out), format_output=False)
+    results = watcher.build_all()
+
+    assert [r.source for r in results] == [
+        "layout.kdl",
+        "other.kdl",
+        "page.kdl",
+        "partials/nav.kdl",
+    ]
+    assert watcher.poll() == set()
+
+    touch(src / "partials" / "nav.kdl", 'nav "v2"')
+    changed = watcher.poll()
+    results = watcher.rebuild(changed)
+
+    assert changed == {"partials/nav.kdl"}
+    assert [r.source for r in results] == ["page.kdl", "partials/nav.kdl"]
+    assert (out / "partials" / "nav.html").read_text() == "<nav>v2</nav>"
+
+
+def test_watcher_tracks_new_references(tmp_path):
+    src, out = tmp_path / "src", tmp_path / "out"
+    src.mkdir()
+    (src / "page.kdl").write_text("p")
+    (src / "footer.kdl").write_text("footer")
+
+    watcher = Watcher(str(src), str(out))
+    watcher.build_all()
+
+    touch(src / "page.kdl", '{% include "footer.kdl" %}')
+    watcher.rebuild(watcher.poll())
+    touch(src / "footer.kdl", 'footer "new"')
+
+    results = watcher.rebuild(watcher.poll())
+    assert [r.source for r in results] == ["footer.kdl", "page.kdl"]
+
+
+def test_watcher_removes_outputs_of_deleted_sources(tmp_path):
+    src, out = tmp_path / "src", tmp_path / "out"
+    src.mkdir()
+    (src / "page.kdl").write_text('{% include "nav.html" %}')
+    (src / "nav.kdl").write_text("nav")
+
+    watcher = Watcher(str(src), str(out))
+    watcher.build_all()
+    assert (out / "nav.html.gz").exists()
+
+    (src / "nav.kdl").unlink()
+    changed = watcher.poll()
+    results = watcher.rebuild(changed)
+
+    assert changed == {"nav.kdl"}
+    assert [r.source for r in results] == ["page.kdl"]
+    assert not (out / "nav.html").exists()
+    assert not (out / "nav.html.gz").exists()
+    assert (out / "page.html").exists()